@@ -0,0 +1,122 @@
+import time
+
+from FrameAnalysis import changed_ratio, compute_signature
+
+# 操作验证结果
+VERIFIED = "verified"
+UNVERIFIED = "unverified"
+NO_OP = "no_op"
+
+# 需要验证的操作类型（输入文本由文本输入引擎自行确认）
+VERIFY_ACTIONS = {"click", "tap", "swipe", "press_home", "press_back", "press_menu"}
+
+
+class ActionVerifier:
+    """本地操作验证器：比较操作前后的低分辨率画面，无需再调用模型
+
+    判断依据依次为：操作指定的预期文字出现在控件树中；全屏变化比例超过阈值；
+    点击位置附近的变化比例超过阈值。画面完全没有变化时判定为无效操作（no_op），
+    其余情况（如只有点击水波纹等细微变化）判定为未确认（unverified）。
+    """
+
+    def __init__(self, device_manager, capture=None, global_threshold=0.02, local_threshold=0.08,
+                 local_radius=0.06, noise_threshold=0.002, response_window=1.0):
+        """初始化操作验证器
+
+        Args:
+            device_manager (HarmonyDeviceManager): 设备管理器
+            capture (callable, optional): 截取一帧画面的函数，返回图片数据，默认截取144x256的画面；
+                后台截屏运行时应传入读取截屏缓冲区的函数，避免与后台截屏同时在设备上截图
+            global_threshold (float): 全屏变化比例超过该值即确认操作生效
+            local_threshold (float): 点击位置附近变化比例超过该值即确认操作生效
+            local_radius (float): 点击位置附近区域的半径（占屏幕宽高的比例）
+            noise_threshold (float): 全屏变化比例低于该值视为画面没有变化
+            response_window (float): 判定无效操作前至少等待的时间（秒），从操作完成时算起
+        """
+        self.device_manager = device_manager
+        self.capture = capture or (lambda: device_manager.capture_frame(144, 256, channel="verify"))
+        self.global_threshold = global_threshold
+        self.local_threshold = local_threshold
+        self.local_radius = local_radius
+        self.noise_threshold = noise_threshold
+        self.response_window = response_window
+        self.counts = {VERIFIED: 0, UNVERIFIED: 0, NO_OP: 0}
+
+    def capture_signature(self):
+        """截取当前画面的指纹，作为操作前的参照
+
+        Returns:
+            FrameSignature: 画面指纹，截取失败时返回None
+        """
+        data = self.capture()
+        return compute_signature(data) if data else None
+
+    def _tap_region(self, tap_point):
+        """点击位置附近的区域，坐标为屏幕比例"""
+        screen_size = self.device_manager.get_screen_size()
+        if not tap_point or not screen_size:
+            return None
+        x = tap_point[0] / screen_size[0]
+        y = tap_point[1] / screen_size[1]
+        return (x - self.local_radius, y - self.local_radius / 2, x + self.local_radius, y + self.local_radius / 2)
+
+    def _element_present(self, expected_text):
+        elements = self.device_manager.dump_layout()
+        if elements is None:
+            return None
+        return any(expected_text in str(element.get("text") or element.get("description") or "")
+                   for element in elements)
+
+    def verify(self, before, after=None, tap_point=None, expected_text=None):
+        """验证操作是否生效
+
+        Args:
+            before (FrameSignature): 操作前的画面指纹
+            after (FrameSignature, optional): 操作后的画面指纹，为None时立即截取
+            tap_point (tuple, optional): 点击坐标 (x, y)，用于检查点击位置附近的变化
+            expected_text (str, optional): 操作后应出现在界面上的文字
+
+        Returns:
+            dict: 验证结果，包含status（verified、unverified或no_op）、global_change、local_change
+        """
+        if after is None:
+            after = self.capture_signature()
+        result = {"status": UNVERIFIED, "global_change": None, "local_change": None}
+        if expected_text and self._element_present(expected_text):
+            result["status"] = VERIFIED
+        if before is not None and after is not None:
+            result["global_change"] = changed_ratio(before, after)
+            region = self._tap_region(tap_point)
+            if region:
+                result["local_change"] = changed_ratio(before, after, region=region)
+            if result["status"] != VERIFIED:
+                if result["global_change"] >= self.global_threshold or (
+                        result["local_change"] or 0.0) >= self.local_threshold:
+                    result["status"] = VERIFIED
+                elif result["global_change"] < self.noise_threshold and not result["local_change"]:
+                    result["status"] = NO_OP
+        self.counts[result["status"]] += 1
+        return result
+
+    def recheck(self, previous, before, action_time, tap_point=None, expected_text=None):
+        """判定为无效操作后的复核：等满响应时间后重新截取一帧再验证
+
+        界面稳定检测只能说明画面暂时没有变化，响应慢的应用可能在检测结束之后才开始切换页面，
+        只凭稳定检测的最后一帧判定无效操作并重试，会导致同一个点击执行两次。
+        复核结果替换首次验证的计数，每次操作只计一次。
+
+        Args:
+            previous (dict): 首次验证的结果
+            before (FrameSignature): 操作前的画面指纹
+            action_time (float): 操作完成时的单调时间
+            tap_point (tuple, optional): 点击坐标 (x, y)
+            expected_text (str, optional): 操作后应出现在界面上的文字
+
+        Returns:
+            dict: 验证结果，格式与verify相同
+        """
+        remaining = action_time + self.response_window - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        self.counts[previous["status"]] -= 1
+        return self.verify(before, tap_point=tap_point, expected_text=expected_text)
@@ -0,0 +1,578 @@
+import http.client
+import itertools
+import json
+import os
+import re
+import socket
+import socketserver
+import sys
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 设备连接状态的缓存时间（秒），避免每条指令都执行一次list targets
+DEVICE_CHECK_TTL = 5.0
+# 客户端只能在这些设备工具中选择，实际执行的命令由启动服务时的配置决定
+DEVICE_TOOLS = ("hdc", "adb")
+# 设备ID只允许序列号或"主机:端口"中出现的字符
+DEVICE_ID_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9._:-]{0,63}")
+
+
+def validate_target(tool=None, device_id=None):
+    """校验客户端选择的目标设备
+
+    Args:
+        tool (str, optional): 设备工具，"hdc"或"adb"
+        device_id (str, optional): 目标设备ID
+
+    Returns:
+        tuple: (设备工具, 设备ID)
+
+    Raises:
+        ValueError: 设备工具不在允许的范围内或设备ID格式不正确
+    """
+    if tool is not None and tool not in DEVICE_TOOLS:
+        raise ValueError(f"tool只能是{'/'.join(DEVICE_TOOLS)}")
+    if device_id is not None and (not isinstance(device_id, str) or not DEVICE_ID_PATTERN.fullmatch(device_id)):
+        raise ValueError("device_id格式不正确")
+    return tool, device_id or None
+
+
+class Job:
+    """守护进程中的一条指令任务"""
+
+    def __init__(self, job_id, instruction, tool, device_id=None):
+        self.job_id = job_id
+        self.instruction = instruction
+        self.tool = tool
+        self.device_id = device_id
+        self.status = "queued"
+        self.success = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = []
+        self.condition = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in ("succeeded", "failed")
+
+    def add_event(self, kind, message):
+        """追加一条进度事件并唤醒等待的读取者"""
+        with self.condition:
+            self.events.append({"seq": len(self.events), "time": time.time(), "kind": kind, "message": message})
+            self.condition.notify_all()
+
+    def set_status(self, status):
+        """更新状态并追加对应的状态事件：两者在同一临界区内完成，读取者看到结束状态时一定也能看到该事件"""
+        with self.condition:
+            self.status = status
+            self.add_event("status", status)
+
+    def finish(self, success, error=None):
+        with self.condition:
+            self.success = success
+            self.error = error
+            self.finished_at = time.time()
+            self.set_status("succeeded" if success else "failed")
+
+    def to_dict(self, include_events=True):
+        with self.condition:
+            data = {
+                "job_id": self.job_id,
+                "instruction": self.instruction,
+                "tool": self.tool,
+                "device_id": self.device_id,
+                "status": self.status,
+                "success": self.success,
+                "error": self.error,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+            if include_events:
+                data["events"] = list(self.events)
+            return data
+
+
+class _JobOutputStream:
+    """替换sys.stdout：任务线程中的print输出同时记录为该任务的进度事件"""
+
+    def __init__(self, original):
+        self.original = original
+        self.local = threading.local()
+
+    def write(self, text):
+        job = getattr(self.local, "job", None)
+        if job is not None:
+            buffer = getattr(self.local, "buffer", "") + text
+            *lines, self.local.buffer = buffer.split("\n")
+            for line in lines:
+                if line.strip():
+                    job.add_event("log", line)
+        return self.original.write(text)
+
+    def flush(self):
+        self.original.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.original, name)
+
+
+class AgentDaemon:
+    """常驻的自动操作代理服务
+
+    保持HarmonyAutoAgent实例（LLM客户端连接池、设备管理器、缓存）常驻内存，
+    通过HTTP或Unix socket上的JSON接口接收指令，避免每次调用都重新启动Python、
+    导入依赖、创建客户端和检查hdc。
+
+    服务没有鉴权，客户端不能指定要执行的命令：只能选择设备工具（hdc/adb）和设备ID，
+    工具对应的命令在启动服务时确定。
+    """
+
+    def __init__(self, device_command="hdc", screenshot_path="screenshot.jpeg", max_jobs=1000, direct=False,
+                 max_agents=8):
+        """初始化守护进程
+
+        Args:
+            device_command (str): 默认的设备管理命令，另一种工具使用环境变量中的hdc或adb
+            screenshot_path (str): 截图保存路径
+            max_jobs (int): 内存中最多保留的任务数，超出时丢弃最早完成的任务
+            direct (bool): 是否直接与hdc/adb server通信，不启动命令行进程
+            max_agents (int): 最多常驻的代理实例数，超出时释放最久未使用的空闲代理
+        """
+        self.device_command = device_command
+        self.tool = "adb" if "adb" in device_command else "hdc"
+        self.device_commands = {tool: tool for tool in DEVICE_TOOLS}
+        self.device_commands[self.tool] = device_command
+        self.direct = direct
+        self.screenshot_path = screenshot_path
+        self.max_jobs = max_jobs
+        self.max_agents = max_agents
+        self.started_at = time.time()
+        # 键为(设备工具, 设备ID)，按最近使用排序
+        self._agents = OrderedDict()
+        self._agent_locks = {}
+        self._device_checks = {}
+        self._jobs = {}
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.server = None
+        self._output = None
+
+    def get_agent(self, tool=None, device_id=None):
+        """获取（必要时创建）常驻的代理实例
+
+        Args:
+            tool (str, optional): 设备工具，"hdc"或"adb"，默认使用守护进程的默认工具
+            device_id (str, optional): 目标设备ID，默认使用唯一连接的设备
+
+        Returns:
+            tuple: (代理实例, 该代理的执行锁)
+
+        Raises:
+            ValueError: 目标设备不合法
+            RuntimeError: 设备管理命令不可用
+        """
+        from HarmonyAutoAgent import HarmonyAutoAgent
+
+        tool, device_id = validate_target(tool or self.tool, device_id)
+        key = (tool, device_id)
+        with self._lock:
+            agent = self._agents.get(key)
+            if agent is None:
+                device_command = self.device_commands[tool]
+                transport = None
+                if self.direct:
+                    from DeviceTransport import create_server_transport
+                    transport = create_server_transport(tool)
+                agent = HarmonyAutoAgent(
+                    device_command=device_command, screenshot_path=self.screenshot_path, transport=transport,
+                    device_id=device_id
+                )
+                if not agent.check_command_available():
+                    raise RuntimeError(f"设备管理命令不可用，请确保已安装 {device_command} 并添加到环境变量")
+                self._agents[key] = agent
+                self._agent_locks[key] = threading.Lock()
+            self._agents.move_to_end(key)
+            self._evict_agents()
+            return agent, self._agent_locks[key]
+
+    def _evict_agents(self):
+        """代理数超过上限时释放最久未使用的空闲代理（调用方持有self._lock）"""
+        # 最后一个是刚取得的代理，不参与释放
+        for key in list(self._agents)[:-1]:
+            if len(self._agents) <= self.max_agents:
+                break
+            lock = self._agent_locks[key]
+            if not lock.acquire(blocking=False):
+                # 正在执行指令的代理不释放
+                continue
+            # 只移除引用，不关闭代理持有的资源：刚通过get_agent取得该代理的调用方仍可安全使用
+            del self._agents[key]
+            del self._agent_locks[key]
+            self._device_checks.pop(key, None)
+            lock.release()
+
+    def check_device_connected(self, agent, key):
+        """带缓存的设备连接检查
+
+        Args:
+            agent (HarmonyAutoAgent): 代理实例
+            key (tuple): (设备工具, 设备ID)
+
+        Returns:
+            bool: 设备是否已连接
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._device_checks.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+        connected = agent.check_device_connected()
+        self._cache_device_check(key, connected)
+        return connected
+
+    def _cache_device_check(self, key, connected):
+        # 只缓存已连接的结果，断开后下次请求会立即重新检查
+        with self._lock:
+            if key in self._agents:
+                self._device_checks[key] = (connected, time.monotonic() + (DEVICE_CHECK_TTL if connected else 0))
+
+    def submit(self, instruction, tool=None, device_id=None):
+        """提交一条指令，在后台线程中执行
+
+        Args:
+            instruction (str): 自然语言指令
+            tool (str, optional): 设备工具，"hdc"或"adb"
+            device_id (str, optional): 目标设备ID
+
+        Returns:
+            Job: 任务对象
+
+        Raises:
+            ValueError: 目标设备不合法
+        """
+        tool, device_id = validate_target(tool or self.tool, device_id)
+        job = Job(str(next(self._job_ids)), instruction, tool, device_id)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            if len(self._jobs) > self.max_jobs:
+                for job_id in [key for key, value in self._jobs.items() if value.done][:len(self._jobs) - self.max_jobs]:
+                    del self._jobs[job_id]
+        threading.Thread(target=self._run_job, args=(job,), name=f"job-{job.job_id}", daemon=True).start()
+        return job
+
+    def _run_job(self, job):
+        if self._output is not None:
+            self._output.local.job = job
+            self._output.local.buffer = ""
+        try:
+            agent, agent_lock = self.get_agent(job.tool, job.device_id)
+            with agent_lock:
+                job.set_status("running")
+                if not self.check_device_connected(agent, (job.tool, job.device_id)):
+                    job.finish(False, "设备未连接，请确保已连接设备并授权调试")
+                    return
+                # 已用缓存结果检查过设备连接，指令内部不再重复检查
+                success = agent.execute_instruction(job.instruction, check_device=False)
+            job.finish(bool(success))
+        except Exception as e:
+            job.finish(False, str(e))
+        finally:
+            if self._output is not None:
+                self._output.local.job = None
+
+    def get_job(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_device_state(self, tool=None, device_id=None):
+        """查询设备状态
+
+        Args:
+            tool (str, optional): 设备工具，"hdc"或"adb"
+            device_id (str, optional): 目标设备ID
+
+        Returns:
+            dict: 设备状态
+        """
+        tool, device_id = validate_target(tool or self.tool, device_id)
+        agent, agent_lock = self.get_agent(tool, device_id)
+        with agent_lock:
+            connected = agent.check_device_connected()
+            self._cache_device_check((tool, device_id), connected)
+            state = {"tool": tool, "device_id": device_id, "connected": connected}
+            if connected:
+                state["screen_size"] = agent.device_manager.get_screen_size()
+                state["foreground_app"] = agent.device_manager.foreground_app
+        return state
+
+    def serve(self, host="127.0.0.1", port=8765, socket_path=None):
+        """启动服务并阻塞，直到收到Ctrl+C
+
+        Args:
+            host (str): HTTP监听地址
+            port (int): HTTP监听端口
+            socket_path (str, optional): Unix socket路径，指定后改为监听Unix socket
+        """
+        self._output = _JobOutputStream(sys.stdout)
+        sys.stdout = self._output
+        handler = _make_handler(self)
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            self.server = _UnixHTTPServer(socket_path, handler)
+            address = f"unix:{socket_path}"
+        else:
+            self.server = ThreadingHTTPServer((host, port), handler)
+            address = f"http://{host}:{self.server.server_address[1]}"
+        print(f"===== 自动操作代理服务已启动: {address} =====")
+        try:
+            # 预热默认设备的代理实例
+            self.get_agent()
+        except RuntimeError as e:
+            print(f"警告: {str(e)}")
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n服务已停止")
+        finally:
+            self.server.server_close()
+            sys.stdout = self._output.original
+            if socket_path and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+    def shutdown(self):
+        """停止服务（可在其他线程中调用）"""
+        if self.server is not None:
+            self.server.shutdown()
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """监听Unix socket的HTTP服务"""
+
+    daemon_threads = True
+
+
+def _make_handler(daemon):
+    """创建绑定到守护进程实例的请求处理类"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            # 请求日志不输出，避免与任务日志混在一起
+            pass
+
+        def _send_json(self, status, data):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if not length:
+                return {}
+            return json.loads(self.rfile.read(length).decode("utf-8"))
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            query = urllib.parse.parse_qs(url.query)
+            parts = [part for part in url.path.split("/") if part]
+            try:
+                if parts == ["health"]:
+                    self._send_json(200, {"status": "ok", "uptime": time.time() - daemon.started_at})
+                elif parts == ["device"]:
+                    self._send_json(200, daemon.get_device_state(
+                        query.get("tool", [None])[0], query.get("device_id", [None])[0]
+                    ))
+                elif len(parts) in (2, 3) and parts[0] == "jobs":
+                    job = daemon.get_job(parts[1])
+                    if job is None:
+                        self._send_json(404, {"error": f"任务不存在: {parts[1]}"})
+                    elif len(parts) == 2:
+                        self._send_json(200, job.to_dict())
+                    elif parts[2] == "events":
+                        self._stream_events(job, int(query.get("after", ["-1"])[0]))
+                    else:
+                        self._send_json(404, {"error": "未知接口"})
+                else:
+                    self._send_json(404, {"error": "未知接口"})
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+
+        def do_POST(self):
+            parts = [part for part in urllib.parse.urlparse(self.path).path.split("/") if part]
+            try:
+                if parts != ["instructions"]:
+                    self._send_json(404, {"error": "未知接口"})
+                    return
+                # 只接受JSON请求：浏览器跨站提交的表单无法携带该类型，不能借此触发指令
+                content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+                if content_type != "application/json":
+                    self._send_json(415, {"error": "Content-Type应为application/json"})
+                    return
+                request = self._read_json()
+                if not isinstance(request, dict):
+                    self._send_json(400, {"error": "请求体应为JSON对象"})
+                    return
+                instruction = request.get("instruction")
+                if not isinstance(instruction, str) or not instruction.strip():
+                    self._send_json(400, {"error": "缺少instruction或instruction不是字符串"})
+                    return
+                job = daemon.submit(instruction.strip(), request.get("tool"), request.get("device_id"))
+                if request.get("wait"):
+                    with job.condition:
+                        job.condition.wait_for(lambda: job.done)
+                    self._send_json(200, job.to_dict())
+                else:
+                    self._send_json(202, job.to_dict(include_events=False))
+            except (ValueError, json.JSONDecodeError) as e:
+                self._send_json(400, {"error": f"请求格式错误: {str(e)}"})
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+
+        def _stream_events(self, job, after):
+            """以NDJSON分块流的形式推送任务进度，直到任务结束"""
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            while True:
+                with job.condition:
+                    job.condition.wait_for(lambda: len(job.events) > after + 1 or job.done, timeout=15)
+                    events = job.events[after + 1:]
+                    done = job.done
+                for event in events:
+                    line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+                    self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+                    after = event["seq"]
+                self.wfile.flush()
+                if done and not events:
+                    break
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """通过Unix socket发送HTTP请求"""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class AgentDaemonClient:
+    """守护进程的轻量客户端，不依赖LLM和设备相关模块"""
+
+    def __init__(self, address="http://127.0.0.1:8765", timeout=None):
+        """初始化客户端
+
+        Args:
+            address (str): 服务地址，http://host:port 或 unix:/path/to/socket
+            timeout (float, optional): 网络超时（秒）
+        """
+        self.address = address
+        self.timeout = timeout
+
+    def _connection(self):
+        if self.address.startswith("unix:"):
+            return _UnixHTTPConnection(self.address[len("unix:"):], self.timeout)
+        url = urllib.parse.urlparse(self.address)
+        return http.client.HTTPConnection(url.hostname, url.port or 80, timeout=self.timeout)
+
+    def _request(self, method, path, body=None):
+        connection = self._connection()
+        try:
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+            headers = {"Content-Type": "application/json"} if payload is not None else {}
+            connection.request(method, path, payload, headers)
+            response = connection.getresponse()
+            data = json.loads(response.read().decode("utf-8"))
+            if response.status >= 400:
+                raise RuntimeError(data.get("error", f"请求失败: {response.status}"))
+            return data
+        finally:
+            connection.close()
+
+    def submit(self, instruction, tool=None, device_id=None, wait=False):
+        """提交指令
+
+        Args:
+            instruction (str): 自然语言指令
+            tool (str, optional): 设备工具，"hdc"或"adb"，默认使用服务的默认工具
+            device_id (str, optional): 目标设备ID
+            wait (bool): 是否等待指令执行完成
+
+        Returns:
+            dict: 任务信息
+        """
+        return self._request("POST", "/instructions", {
+            "instruction": instruction,
+            "tool": tool,
+            "device_id": device_id,
+            "wait": wait,
+        })
+
+    def get_job(self, job_id):
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def get_device_state(self, tool=None, device_id=None):
+        query = {key: value for key, value in (("tool", tool), ("device_id", device_id)) if value}
+        return self._request("GET", "/device" + ("?" + urllib.parse.urlencode(query) if query else ""))
+
+    def stream_events(self, job_id, after=-1):
+        """逐条读取任务进度事件，任务结束时停止
+
+        Args:
+            job_id (str): 任务ID
+            after (int): 只返回序号大于该值的事件
+
+        Yields:
+            dict: 进度事件
+        """
+        connection = self._connection()
+        try:
+            connection.request("GET", f"/jobs/{job_id}/events?after={after}")
+            response = connection.getresponse()
+            if response.status >= 400:
+                raise RuntimeError(json.loads(response.read().decode("utf-8")).get("error"))
+            for line in response:
+                if line.strip():
+                    yield json.loads(line.decode("utf-8"))
+        finally:
+            connection.close()
+
+    def run_instruction(self, instruction, tool=None, device_id=None):
+        """提交指令并实时打印进度，返回是否成功
+
+        Args:
+            instruction (str): 自然语言指令
+            tool (str, optional): 设备工具，"hdc"或"adb"
+            device_id (str, optional): 目标设备ID
+
+        Returns:
+            bool: 指令是否执行成功
+        """
+        job = self.submit(instruction, tool, device_id)
+        for event in self.stream_events(job["job_id"]):
+            if event["kind"] == "log":
+                print(event["message"])
+        result = self.get_job(job["job_id"])
+        if result.get("error"):
+            print(f"错误: {result['error']}")
+        return bool(result.get("success"))
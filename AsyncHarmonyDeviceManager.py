@@ -0,0 +1,363 @@
+import asyncio
+import os
+import shlex
+import sqlite3
+import tempfile
+import time
+import uuid
+import xml.etree.ElementTree as ET
+
+from HarmonyDeviceManager import (
+    SCREENSHOT_SECONDS,
+    DeviceCommandMixin,
+    parse_device_list,
+    parse_foreground_activity,
+    parse_layout_text,
+    parse_screen_size,
+)
+from ScreenshotStore import ScreenshotStore
+
+
+class AsyncHarmonyDeviceManager(DeviceCommandMixin):
+    """基于asyncio的鸿蒙设备管理器
+
+    命令与解析逻辑和HarmonyDeviceManager共用，进程通过asyncio.create_subprocess_exec
+    以参数列表启动（不经过本机shell），每条命令可单独设置超时并支持取消。
+    同一设备上同时执行的命令数受max_concurrency限制，可在一个事件循环中同时驱动多台设备。
+    截图和导出控件树每次使用不同的设备端临时文件，同时执行时互不覆盖。
+    """
+
+    def __init__(self, device_command="hdc", screenshot_store=None, transport=None, device_id=None,
+                 max_concurrency=4):
+        """初始化异步设备管理器
+
+        Args:
+            device_command (str): 设备管理命令路径，支持hdc, hdc_std, adb
+            screenshot_store (ScreenshotStore, optional): 截图归档存储，默认归档到当前目录下的pictures
+            transport (object, optional): 命令传输，如DeviceTransport.HdcServerTransport，
+                                          指定后在线程池中调用，不再启动命令行进程
+            device_id (str, optional): 目标设备ID，多台设备连接时用于指定设备
+            max_concurrency (int): 该设备在每个事件循环中同时执行的最大命令数
+        """
+        self.device_command = device_command
+        self.command_type = self._detect_command_type()
+        self.device_id = device_id
+        self.transport = transport
+        self.screenshot_store = screenshot_store or ScreenshotStore()
+        self.max_concurrency = max_concurrency
+        # 最近一次导出控件树时的前台应用包名
+        self.foreground_app = None
+        self._screen_size = None
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    @property
+    def semaphore(self):
+        """当前事件循环的信号量：信号量只能在创建它的事件循环中使用，换了事件循环时重新创建"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def _remote_name(self, prefix):
+        """设备端临时文件名，每次调用都不同"""
+        return f"{prefix}-{uuid.uuid4().hex[:12]}"
+
+    async def execute_command(self, command, timeout=30, quiet=False):
+        """执行设备管理命令
+
+        超时时终止进程并返回错误；调用方取消任务时同样会终止进程，然后继续抛出CancelledError。
+
+        Args:
+            command (str|list): 要执行的命令，字符串会按shell规则拆分为参数列表
+            timeout (float): 命令执行超时时间（秒）
+            quiet (bool): 是否不打印命令
+
+        Returns:
+            tuple: (返回码, 标准输出, 标准错误)
+        """
+        args = self._normalize_args(command)
+        argv = self._build_argv(args)
+        async with self.semaphore:
+            if not quiet:
+                print(f"执行命令: {shlex.join(argv)}")
+            started = time.monotonic()
+            result = await self._run_command(args, argv, timeout)
+            return self._record_command(args, result, time.monotonic() - started)
+
+    async def _run_command(self, args, argv, timeout):
+        """通过传输或子进程执行命令，返回(返回码, 标准输出, 标准错误)"""
+        if self.transport is not None:
+            return await asyncio.to_thread(self.transport.execute, args, timeout)
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *argv,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except FileNotFoundError:
+            return -1, "", f"找不到命令: {self.device_command}，请确保已安装并添加到环境变量"
+        except OSError as e:
+            return -1, "", f"命令执行失败: {str(e)}"
+
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            await self._kill(process)
+            return -1, "", "命令执行超时"
+        except asyncio.CancelledError:
+            await self._kill(process)
+            raise
+        return (
+            process.returncode,
+            stdout.decode("utf-8", errors="replace").strip(),
+            stderr.decode("utf-8", errors="replace").strip(),
+        )
+
+    async def _kill(self, process):
+        """终止进程并回收，避免残留僵尸进程"""
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+        await process.wait()
+
+    async def check_command_available(self):
+        """检查设备管理命令是否可用
+
+        Returns:
+            bool: 命令是否可用
+        """
+        return_code, stdout, stderr = await self.execute_command(["help"], timeout=10)
+        return return_code == 0
+
+    async def list_devices(self):
+        """列出已连接的设备
+
+        Returns:
+            list: 设备ID列表
+        """
+        return_code, stdout, stderr = await self.execute_command(self._device_list_args())
+        if return_code != 0:
+            return []
+        return parse_device_list(stdout)
+
+    async def check_device_connected(self):
+        """检查设备是否已连接
+
+        Returns:
+            bool: 设备是否已连接
+        """
+        devices = await self.list_devices()
+        if self.device_id:
+            connected = self.device_id in devices
+        else:
+            connected = bool(devices)
+        if connected:
+            print(f"检测到设备ID: {self.device_id or devices[0]}")
+        return connected
+
+    async def get_screenshot(self, save_path):
+        """获取设备屏幕截图
+
+        Args:
+            save_path (str): 截图保存路径
+
+        Returns:
+            bool: 截图是否成功
+        """
+        with SCREENSHOT_SECONDS.time(source="device"):
+            return await self._get_screenshot(save_path)
+
+    async def _get_screenshot(self, save_path):
+        """执行截图命令，成功后归档截图"""
+        save_dir = os.path.dirname(save_path)
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+
+        steps, cleanup = self._screenshot_steps(save_path, self._remote_name("screenshot"))
+        try:
+            for step in steps:
+                return_code, stdout, stderr = await self.execute_command(step)
+                if return_code != 0:
+                    print(f"截图失败: {stderr}")
+                    return False
+        finally:
+            # 临时文件名每次不同，失败时也要清理，避免在设备上堆积
+            await self.execute_command(cleanup, quiet=True)
+
+        if os.path.exists(save_path) and os.path.getsize(save_path) > 0:
+            await asyncio.to_thread(self.archive_screenshot, save_path)
+            print(f"截图成功，保存到: {save_path}")
+            return True
+
+        print(f"截图失败")
+        return False
+
+    def archive_screenshot(self, path):
+        """将截图归档到截图存储，归档失败不影响截图结果
+
+        Args:
+            path (str): 截图路径
+        """
+        try:
+            label = os.path.splitext(os.path.basename(path))[0]
+            self.screenshot_store.put_file(path, label=label)
+        except (OSError, sqlite3.Error) as e:
+            print(f"截图归档失败: {str(e)}")
+
+    async def _run_simple(self, args, failure_message, success_message):
+        return_code, stdout, stderr = await self.execute_command(args)
+        if return_code != 0:
+            print(f"{failure_message}: {stderr}")
+            return False
+        print(success_message)
+        return True
+
+    async def tap(self, x, y):
+        """点击设备屏幕上的指定位置
+
+        Returns:
+            bool: 点击是否成功
+        """
+        return await self._run_simple(self._tap_args(x, y), "点击失败", f"点击位置: ({x}, {y})")
+
+    async def swipe(self, start_x, start_y, end_x, end_y, duration=None):
+        """在设备屏幕上滑动
+
+        Returns:
+            bool: 滑动是否成功
+        """
+        return await self._run_simple(
+            self._swipe_args(start_x, start_y, end_x, end_y, duration),
+            "滑动失败",
+            f"滑动: ({start_x}, {start_y}) -> ({end_x}, {end_y})",
+        )
+
+    async def press_home(self):
+        """按下设备的Home键"""
+        return await self._run_simple(self._key_args(3), "按下Home键失败", "按下Home键")
+
+    async def press_back(self):
+        """按下设备的返回键"""
+        return await self._run_simple(self._key_args(4), "按下返回键失败", "按下返回键")
+
+    async def press_menu(self):
+        """按下设备的菜单键"""
+        return await self._run_simple(self._key_args(82), "按下菜单键失败", "按下菜单键")
+
+    async def press_key(self, keycode):
+        """按下指定键码的按键"""
+        return await self._run_simple(self._key_args(keycode), f"按键{keycode}失败", f"按键: {keycode}")
+
+    async def send_text(self, text):
+        """向设备发送文本
+
+        Returns:
+            bool: 操作是否成功
+        """
+        args, text = self._text_args(text)
+        return await self._run_simple(args, "发送文本失败", f"发送文本: {text}")
+
+    async def launch_app(self, package, ability=None):
+        """按包名启动应用
+
+        Returns:
+            bool: 操作是否成功
+        """
+        return_code, stdout, stderr = await self.execute_command(self._launch_args(package, ability))
+        if return_code != 0 or "error" in stdout.lower():
+            print(f"启动应用失败: {stderr or stdout}")
+            return False
+        print(f"启动应用: {package}")
+        return True
+
+    async def get_screen_size(self, refresh=False):
+        """获取设备屏幕尺寸，成功获取后缓存
+
+        Args:
+            refresh (bool): 是否忽略缓存重新获取
+
+        Returns:
+            tuple: (宽度, 高度)，如果获取失败则返回None
+        """
+        if self._screen_size is not None and not refresh:
+            return self._screen_size
+        return_code, stdout, stderr = await self.execute_command(self._screen_size_args())
+        if return_code != 0:
+            print(f"获取屏幕尺寸失败: {stderr}")
+            return None
+        self._screen_size = parse_screen_size(stdout)
+        return self._screen_size
+
+    async def get_foreground_activity(self):
+        """获取前台页面（包名和Ability/Activity名）
+
+        Returns:
+            str: "包名/Ability或Activity名"，获取失败时返回None
+        """
+        return_code, stdout, stderr = await self.execute_command(self._foreground_args(), quiet=True)
+        if return_code != 0:
+            return None
+        return parse_foreground_activity(self.command_type, stdout)
+
+    async def dump_layout(self):
+        """导出当前界面的控件树
+
+        Returns:
+            list: UI元素列表，获取失败时返回None
+        """
+        fd, local_path = tempfile.mkstemp(suffix=self._layout_suffix())
+        os.close(fd)
+        try:
+            steps, cleanup = self._layout_steps(local_path, self._remote_name("layout"))
+            try:
+                for step in steps:
+                    return_code, stdout, stderr = await self.execute_command(step)
+                    if return_code != 0:
+                        print(f"导出控件树失败: {stderr}")
+                        return None
+            finally:
+                await self.execute_command(cleanup, quiet=True)
+
+            if os.path.getsize(local_path) == 0:
+                print("导出控件树失败: 文件为空")
+                return None
+            with open(local_path, "r", encoding="utf-8") as f:
+                elements, self.foreground_app = parse_layout_text(self.command_type, f.read())
+            return elements
+        except (ValueError, ET.ParseError) as e:
+            print(f"解析控件树失败: {str(e)}")
+            return None
+        finally:
+            os.remove(local_path)
+
+    async def capture_frame(self, width=None, height=None, channel="frame"):
+        """快速截取一帧屏幕画面，不保存到pictures目录
+
+        Args:
+            width (int, optional): 画面宽度（仅hdc支持缩放）
+            height (int, optional): 画面高度（仅hdc支持缩放）
+            channel (str): 设备端临时文件名，同时截取的调用方需各用一个
+
+        Returns:
+            bytes: 图片数据，获取失败时返回None
+        """
+        fd, local_path = tempfile.mkstemp(suffix=self._frame_suffix())
+        os.close(fd)
+        started = time.monotonic()
+        try:
+            for step in self._frame_steps(local_path, width, height, channel):
+                return_code, stdout, stderr = await self.execute_command(step, quiet=True)
+                if return_code != 0:
+                    print(f"截取画面失败: {stderr}")
+                    return None
+            with open(local_path, "rb") as f:
+                data = f.read()
+            SCREENSHOT_SECONDS.observe(time.monotonic() - started, source="frame")
+            return data or None
+        finally:
+            os.remove(local_path)
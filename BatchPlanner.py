@@ -0,0 +1,185 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# 批量规划允许的操作类型：都不依赖当前屏幕内容
+BATCH_ACTIONS = {"swipe", "type", "press_home", "press_back", "press_menu", "screenshot", "launch_app"}
+
+
+class BatchPlanner:
+    """批量规划器：把连续的、不依赖屏幕内容的指令合并为一次LLM请求
+
+    指令文件中按键、输入文本、滑动、启动应用这类指令不需要先截图分析，
+    连续的多条可以一次请求得到按序号对应的操作步骤。每条结果在本地校验，
+    缺失或不合法的条目退回逐条执行的常规流程。后续批次在后台线程中提前规划，
+    与前面步骤的执行重叠。
+    """
+
+    # 不依赖屏幕内容的指令关键词
+    INDEPENDENT_PATTERN = re.compile(
+        r"返回|后退|主页|主屏幕|桌面|菜单|home|back|menu|输入|键入|填写|滑|翻页|截图|截屏|启动|打开.{1,12}(应用|app)",
+        re.I,
+    )
+    # 需要在屏幕上找目标的指令关键词
+    SCREEN_PATTERN = re.compile(r"点击|单击|双击|长按|选择|勾选|找到|屏幕上|页面上|按钮|图标")
+
+    def __init__(self, parser, max_batch=8, lookahead=2):
+        """初始化批量规划器
+
+        Args:
+            parser (InstructionParser): 指令解析器，使用其路由器调用文本模型
+            max_batch (int): 每批最多的指令数
+            lookahead (int): 在执行当前批次时最多提前规划的后续批次数
+        """
+        self.parser = parser
+        self.router = parser.router
+        self.max_batch = max_batch
+        self.lookahead = lookahead
+        self.stats = {"batches": 0, "planned": 0, "fallbacks": 0}
+
+    def is_batchable(self, instruction):
+        """判断指令是否可以批量规划：不依赖屏幕内容，且本地规则无法直接处理
+
+        Args:
+            instruction (str): 自然语言指令
+
+        Returns:
+            bool: 是否可以批量规划
+        """
+        if self.SCREEN_PATTERN.search(instruction) or not self.INDEPENDENT_PATTERN.search(instruction):
+            return False
+        # 本地规则能直接处理的指令不需要调用模型
+        return self.router.rules.parse_instruction(instruction, None) is None
+
+    def segment(self, instructions):
+        """将指令序列切分为批次
+
+        Args:
+            instructions (list): 自然语言指令列表
+
+        Returns:
+            list: 每项为(是否批量规划, 指令序号列表)
+        """
+        groups = []
+        current = []
+        for index, instruction in enumerate(instructions):
+            if self.is_batchable(instruction):
+                current.append(index)
+                if len(current) >= self.max_batch:
+                    groups.append((True, current))
+                    current = []
+                continue
+            if current:
+                groups.append((len(current) > 1, current))
+                current = []
+            groups.append((False, [index]))
+        if current:
+            groups.append((len(current) > 1, current))
+        return groups
+
+    def validate_step(self, step):
+        """本地校验一个操作步骤是否完整
+
+        Args:
+            step (dict): 操作步骤
+
+        Returns:
+            bool: 是否可以直接执行
+        """
+        if not isinstance(step, dict) or step.get("action") not in BATCH_ACTIONS:
+            return False
+        params = step.get("params") or {}
+        if not isinstance(params, dict):
+            return False
+        action = step["action"]
+        if action == "type":
+            return isinstance(params.get("text"), str) and bool(params["text"])
+        if action == "launch_app":
+            return isinstance(params.get("package"), str) and bool(params["package"].strip())
+        if action == "swipe":
+            if all(isinstance(params.get(key), (int, float)) for key in ("start_x", "start_y", "end_x", "end_y")):
+                return True
+            # 只有方向描述时由本地规则换算坐标
+            return bool(self.router.rules.SWIPE_PATTERN.match(str(step.get("description", "")).strip()))
+        return True
+
+    def _parse_batch(self, result, indices):
+        """解析批量规划结果，返回序号到操作步骤列表的映射（只包含校验通过的条目）"""
+        parsed = self.parser.load_json(result)
+        if isinstance(parsed, dict) and isinstance(parsed.get("plans"), list):
+            parsed = parsed["plans"]
+        entries = {}
+        if isinstance(parsed, list):
+            for item in parsed:
+                if isinstance(item, dict) and "index" in item:
+                    entries[str(item["index"])] = item.get("steps")
+        elif isinstance(parsed, dict):
+            entries = {str(key): value for key, value in parsed.items()}
+
+        plans = {}
+        for position, index in enumerate(indices):
+            steps = entries.get(str(position))
+            if isinstance(steps, dict):
+                steps = [steps]
+            if isinstance(steps, list) and steps and all(self.validate_step(step) for step in steps):
+                plans[index] = steps
+        return plans
+
+    def plan_batch(self, instructions, indices):
+        """一次请求规划一批指令
+
+        Args:
+            instructions (list): 全部指令
+            indices (list): 本批指令的序号
+
+        Returns:
+            dict: 指令序号到操作步骤列表的映射，规划失败的指令不在其中
+        """
+        listing = "\n".join(f"{position}. {instructions[index]}" for position, index in enumerate(indices))
+        system_prompt = "你是一个智能助手，能够将用户的自然语言指令转换为具体的手机操作步骤。"
+        prompt = (
+            f"以下指令依次执行，且都不需要查看屏幕内容:\n{listing}\n\n"
+            "请将每条指令分别转换为操作步骤，按编号返回JSON："
+            '{"plans": [{"index": 编号, "steps": [{"action": "操作类型", "params": {...}}]}]}\n'
+            "操作类型只能是：press_home、press_back、press_menu、screenshot、"
+            'type（params: {"text": "文本"}）、'
+            'swipe（description为"向上滑动"之类的方向描述，或params给出start_x、start_y、end_x、end_y）、'
+            'launch_app（params: {"package": "应用包名"}，可选"ability"）。'
+            "无法确定的指令不要返回。"
+        )
+
+        def parse(result):
+            plans = self._parse_batch(result, indices)
+            return plans, len(plans) / len(indices)
+
+        self.stats["batches"] += 1
+        try:
+            plans = self.router.run("plan_batch", prompt, system_prompt, parse) or {}
+        except Exception as e:
+            print(f"批量规划失败，改为逐条执行: {str(e)}")
+            plans = {}
+        self.stats["planned"] += len(plans)
+        self.stats["fallbacks"] += len(indices) - len(plans)
+        print(f"批量规划{len(indices)}条指令，{len(plans)}条可直接执行")
+        return plans
+
+    def iter_plans(self, instructions):
+        """按顺序给出每条指令及其预先规划的操作步骤
+
+        当前批次执行时，后续最多lookahead个批次在后台线程中规划。
+
+        Args:
+            instructions (list): 自然语言指令列表
+
+        Yields:
+            tuple: (指令, 操作步骤列表)，需要按常规流程逐条执行的指令步骤为None
+        """
+        groups = self.segment(instructions)
+        futures = {}
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-planner") as pool:
+            for position, (batched, indices) in enumerate(groups):
+                for ahead in range(position, min(len(groups), position + self.lookahead + 1)):
+                    if groups[ahead][0] and ahead not in futures:
+                        futures[ahead] = pool.submit(self.plan_batch, instructions, groups[ahead][1])
+                plans = futures.pop(position).result() if batched else {}
+                for index in indices:
+                    yield instructions[index], plans.get(index)
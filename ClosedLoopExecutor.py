@@ -0,0 +1,216 @@
+import json
+import os
+import time
+from collections import deque
+
+from ModelRouter import iter_elements
+
+# 系统提示和任务前缀在整个任务中保持逐字节不变，服务端可以缓存这部分前缀
+SYSTEM_PROMPT = (
+    "你是一个手机自动操作助手。每一轮你会看到任务、之前步骤的记录和当前屏幕的UI元素，"
+    "请只决定下一步操作。"
+)
+
+TASK_PROMPT_TEMPLATE = """任务: {instruction}
+
+每一轮只返回一个JSON对象，不要添加任何其他内容：
+{{"status": "continue", "action": {{"action": "操作类型", "params": {{...}}}}, "reason": "简短说明"}}
+
+status取值：continue表示执行action后继续观察，done表示任务已完成（不需要action），fail表示任务无法完成。
+操作类型和参数：
+- click: {{"coordinates": [x, y]}}，坐标取自UI元素列表中的中心点
+- swipe: {{"start_x": x1, "start_y": y1, "end_x": x2, "end_y": y2}}
+- type: {{"text": "要输入的文本"}}
+- press_home / press_back / press_menu: 无参数"""
+
+
+class ClosedLoopExecutor:
+    """观察-执行闭环：每执行一步都重新观察屏幕，再决定下一步
+
+    每轮请求由三部分组成：固定的系统提示、固定的任务前缀（两者逐字节不变，便于服务端前缀缓存），
+    以及本轮变化的内容（步骤记录和当前屏幕）。步骤记录只保留最近几步的原文，
+    更早的步骤压缩为一行摘要，并受token预算限制，因此请求大小不会随步数线性增长。
+    """
+
+    def __init__(self, agent, max_steps=None, recent_steps=4, history_token_budget=400,
+                 max_elements=80, model_id=None):
+        """初始化闭环执行器
+
+        Args:
+            agent (HarmonyAutoAgent): 自动操作代理，提供截图、元素分析和操作执行
+            max_steps (int, optional): 单个任务的最大步数，默认读取AGENT_MAX_STEPS（默认15）
+            recent_steps (int): 步骤记录中保留原文的最近步数
+            history_token_budget (int): 步骤记录的token预算
+            max_elements (int): 每轮发送的最多UI元素数
+            model_id (str, optional): 使用的模型，默认使用客户端的默认模型
+        """
+        self.agent = agent
+        if max_steps is None:
+            max_steps = int(os.getenv("AGENT_MAX_STEPS", "15"))
+        self.max_steps = max_steps
+        self.recent_steps = recent_steps
+        self.history_token_budget = history_token_budget
+        self.max_elements = max_elements
+        self.model_id = model_id
+        self.history = []
+        # 只保留最近一个任务长度的请求大小：常驻服务中的代理会长期存活，不能随任务数无限增长
+        self.stats = {"steps": 0, "prompt_chars": deque(maxlen=max_steps), "prompt_chars_total": 0}
+
+    @staticmethod
+    def _estimate_tokens(text):
+        # 与客户端限流的估算方式一致：约两个字符一个token
+        return len(text) // 2 + 1
+
+    def build_prefix(self, instruction):
+        """构造整个任务中保持不变的消息前缀
+
+        Args:
+            instruction (str): 自然语言指令
+
+        Returns:
+            list: 系统提示和任务前缀消息
+        """
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": TASK_PROMPT_TEMPLATE.format(instruction=instruction)},
+        ]
+
+    def summarize_history(self):
+        """生成受token预算限制的步骤记录
+
+        Returns:
+            str: 步骤记录文本
+        """
+        if not self.history:
+            return "之前的步骤: 无"
+        recent = self.history[-self.recent_steps:]
+        older = self.history[:-self.recent_steps] if len(self.history) > self.recent_steps else []
+        lines = []
+        if older:
+            # 连续相同的步骤合并为一项，如"press_back成功×3"
+            brief = []
+            for entry in older:
+                if brief and brief[-1][0] == entry["brief"]:
+                    brief[-1][1] += 1
+                else:
+                    brief.append([entry["brief"], 1])
+            brief = [text if count == 1 else f"{text}×{count}" for text, count in brief]
+            summary = f"更早的{len(older)}步: " + "；".join(brief)
+            # 摘要超出预算的一半时，从最早的步骤开始省略
+            while len(brief) > 1 and self._estimate_tokens(summary) > self.history_token_budget // 2:
+                brief.pop(0)
+                summary = f"更早的{len(older)}步（省略前{len(older) - len(brief)}步）: " + "；".join(brief)
+            lines.append(summary)
+        detail = [entry["detail"] for entry in recent]
+        while len(detail) > 1 and self._estimate_tokens("\n".join(lines + detail)) > self.history_token_budget:
+            detail.pop(0)
+        return "之前的步骤:\n" + "\n".join(lines + detail)
+
+    def describe_elements(self, ui_elements):
+        """将UI元素压缩为每行一个元素的文本，只保留类型、文字和中心点
+
+        Args:
+            ui_elements (list|dict): UI元素分析结果
+
+        Returns:
+            str: UI元素描述，无法提取元素列表时返回None
+        """
+        lines = []
+        for element in iter_elements(ui_elements):
+            label = str(element.get("text") or element.get("description") or "").strip()
+            center = self.agent.parser.get_element_center(element)
+            if not label and not element.get("clickable"):
+                continue
+            position = f" @({center[0]}, {center[1]})" if center else ""
+            lines.append(f"- {element.get('type', 'element')} \"{label[:40]}\"{position}")
+            if len(lines) >= self.max_elements:
+                break
+        return "\n".join(lines) if lines else None
+
+    def build_observation(self, ui_elements, screenshot_path):
+        """构造本轮变化的消息：步骤记录和当前屏幕
+
+        Args:
+            ui_elements (list|dict): UI元素分析结果
+            screenshot_path (str): 当前截图路径
+
+        Returns:
+            dict: 用户消息，无法提取文字元素时附带截图
+        """
+        text = self.summarize_history() + "\n\n当前屏幕UI元素:\n"
+        description = self.describe_elements(ui_elements)
+        if description:
+            return {"role": "user", "content": text + description}
+        # 元素没有可用的文字和坐标，附带截图交给多模态模型
+        return {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": text + "（见截图）"},
+                self.agent.client.image_part(screenshot_path),
+            ],
+        }
+
+    def _record(self, step, action, success, reason):
+        action_type = action.get("action", "unknown")
+        params = action.get("params", {})
+        brief = action_type
+        if params.get("text"):
+            brief += f"「{params['text'][:20]}」"
+        elif params.get("coordinates"):
+            brief += f"{tuple(params['coordinates'])}"
+        outcome = "成功" if success else "失败"
+        self.history.append({
+            "brief": f"{brief}{outcome}",
+            "detail": f"第{step}步: {json.dumps(action, ensure_ascii=False)} -> {outcome}（{reason}）",
+        })
+
+    def run(self, instruction):
+        """执行任务，直到模型判断完成、失败或达到最大步数
+
+        Args:
+            instruction (str): 自然语言指令
+
+        Returns:
+            bool: 任务是否完成
+        """
+        self.history = []
+        prefix = self.build_prefix(instruction)
+        for step in range(1, self.max_steps + 1):
+            screenshot_path, ui_elements = self.agent.get_screenshot_and_elements()
+            if not screenshot_path:
+                print("错误: 无法获取屏幕截图")
+                return False
+
+            messages = prefix + [self.build_observation(ui_elements, screenshot_path)]
+            prompt_chars = len(json.dumps(messages, ensure_ascii=False))
+            self.stats["steps"] += 1
+            self.stats["prompt_chars"].append(prompt_chars)
+            self.stats["prompt_chars_total"] += prompt_chars
+            started = time.monotonic()
+            try:
+                result = self.agent.client.chat(messages, self.model_id)
+            except Exception as e:
+                print(f"第{step}步请求模型失败: {str(e)}")
+                return False
+            decision = self.agent.parser.load_json(result)
+            print(f"第{step}步决策（{time.monotonic() - started:.1f}秒）: {result}")
+            if not isinstance(decision, dict):
+                print(f"无法解析第{step}步的决策: {result}")
+                return False
+
+            status = decision.get("status", "continue")
+            if status == "done":
+                print(f"任务完成，共{step - 1}步")
+                return True
+            if status == "fail":
+                print(f"任务无法完成: {decision.get('reason', '')}")
+                return False
+            action = decision.get("action")
+            if not isinstance(action, dict) or "action" not in action:
+                print(f"第{step}步缺少操作: {result}")
+                return False
+            success = self.agent._execute_action_and_settle(action)
+            self._record(step, action, success, decision.get("reason", ""))
+
+        print(f"已达到最大步数{self.max_steps}，任务未完成")
+        return False
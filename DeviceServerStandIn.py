@@ -0,0 +1,276 @@
+import os
+import shlex
+import socketserver
+import struct
+import threading
+import time
+
+from DeviceTransport import (
+    ADB_SHELL_EXIT,
+    ADB_SHELL_STDERR,
+    ADB_SHELL_STDOUT,
+    HDC_BANNER,
+    HDC_BANNER_SIZE,
+    HDC_CONNECT_KEY_SIZE,
+    TransportError,
+    _recv_exact,
+)
+
+
+class _StandInServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _StandInBase:
+    """本地替身server的公共部分
+
+    devices为序列号到设备对象的映射，设备对象需要提供：
+    shell(command) -> (退出码, 标准输出, 标准错误)、read_file(path) -> bytes或None、
+    write_file(path, data)。
+    """
+
+    def __init__(self, devices, host="127.0.0.1", port=0):
+        """初始化替身server
+
+        Args:
+            devices (dict): 序列号到设备对象的映射
+            host (str): 监听地址
+            port (int): 监听端口，0表示自动分配
+        """
+        self.devices = devices
+        self.host = host
+        self.port = port
+        self.connections = 0
+        self._server = None
+        self._thread = None
+
+    def _online_serials(self):
+        # 设备对象可以提供online属性模拟断开连接，断开的设备不出现在设备列表中
+        return [serial for serial, device in self.devices.items() if getattr(device, "online", True)]
+
+    def _select_device(self, serial):
+        if serial:
+            device = self.devices.get(serial)
+        elif len(self.devices) == 1:
+            device = next(iter(self.devices.values()))
+        else:
+            return None
+        return device if getattr(device, "online", True) else None
+
+    def start(self):
+        """在后台线程中启动server
+
+        Returns:
+            int: 实际监听的端口
+        """
+        owner = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                owner.connections += 1
+                try:
+                    owner.handle_connection(self.request)
+                except (OSError, TransportError):
+                    pass
+
+        self._server = _StandInServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="device-server-stand-in", daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        """停止server"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def handle_connection(self, sock):
+        raise NotImplementedError
+
+
+class HdcStandInServer(_StandInBase):
+    """实现hdc server协议子集的本地替身：握手、list targets、shell、file send/recv"""
+
+    def _send_packet(self, sock, payload):
+        sock.sendall(struct.pack(">I", len(payload)) + payload)
+
+    def _recv_packet(self, sock):
+        length = struct.unpack(">I", _recv_exact(sock, 4))[0]
+        return _recv_exact(sock, length)
+
+    def handle_connection(self, sock):
+        handshake = HDC_BANNER.ljust(HDC_BANNER_SIZE, b"\0") + struct.pack(">I", self.connections)
+        self._send_packet(sock, handshake)
+        reply = self._recv_packet(sock)
+        if not reply.startswith(HDC_BANNER):
+            return
+        connect_key = reply[HDC_BANNER_SIZE:HDC_BANNER_SIZE + HDC_CONNECT_KEY_SIZE].rstrip(b"\0").decode("utf-8")
+        command = self._recv_packet(sock).rstrip(b"\0").decode("utf-8")
+        output = self.run_command(connect_key, command)
+        if output:
+            self._send_packet(sock, output.encode("utf-8"))
+
+    def run_command(self, connect_key, command):
+        """执行一条命令，返回输出文本"""
+        if command.strip() == "list targets":
+            serials = self._online_serials()
+            return "\n".join(serials) if serials else "[Empty]"
+        device = self._select_device(connect_key)
+        if device is None:
+            return "[Fail]Device not founded or connected"
+        if command.startswith("shell "):
+            exit_code, stdout, stderr = device.shell(command[len("shell "):])
+            return stdout + (("\n" if stdout else "") + stderr if stderr else "")
+
+        args = shlex.split(command)
+        if len(args) >= 6 and args[0] == "file" and args[2] == "-cwd":
+            cwd, source, target = args[3], args[4], args[5]
+            if args[1] == "recv":
+                data = device.read_file(source)
+                if data is None:
+                    return f"[Fail]Error opening file: no such file or directory, path:{source}"
+                local_path = os.path.join(cwd, target)
+                with open(local_path, "wb") as f:
+                    f.write(data)
+                return f"FileTransfer finish, Size:{len(data)}, File count = 1, time:1ms rate:0kB/s"
+            if args[1] == "send":
+                with open(os.path.join(cwd, source), "rb") as f:
+                    data = f.read()
+                device.write_file(target, data)
+                return f"FileTransfer finish, Size:{len(data)}, File count = 1, time:1ms rate:0kB/s"
+        return f"[Fail]Unknown command: {command}"
+
+
+class AdbStandInServer(_StandInBase):
+    """实现adb server协议子集的本地替身：host:version/devices/transport、shell(v1/v2)、sync RECV/SEND"""
+
+    def __init__(self, devices, host="127.0.0.1", port=0, shell_v2=True):
+        """初始化adb替身server
+
+        Args:
+            devices (dict): 序列号到设备对象的映射
+            host (str): 监听地址
+            port (int): 监听端口，0表示自动分配
+            shell_v2 (bool): 是否支持shell v2协议
+        """
+        super().__init__(devices, host, port)
+        self.shell_v2 = shell_v2
+        # 客户端在shell v2连接上发送的stdin控制包类型
+        self.stdin_packets = []
+
+    def _read_request(self, sock):
+        length = int(_recv_exact(sock, 4), 16)
+        return _recv_exact(sock, length).decode("utf-8")
+
+    def _fail(self, sock, message):
+        payload = message.encode("utf-8")
+        sock.sendall(b"FAIL" + f"{len(payload):04x}".encode("ascii") + payload)
+
+    def _okay_with_payload(self, sock, text):
+        payload = text.encode("utf-8")
+        sock.sendall(b"OKAY" + f"{len(payload):04x}".encode("ascii") + payload)
+
+    def handle_connection(self, sock):
+        request = self._read_request(sock)
+        if request == "host:version":
+            self._okay_with_payload(sock, "0029")
+            return
+        if request == "host:devices":
+            self._okay_with_payload(sock, "".join(f"{serial}\tdevice\n" for serial in self._online_serials()))
+            return
+        if request.startswith("host:transport"):
+            serial = request[len("host:transport:"):] if request.startswith("host:transport:") else None
+            device = self._select_device(serial)
+            if device is None:
+                self._fail(sock, f"device '{serial or ''}' not found")
+                return
+            sock.sendall(b"OKAY")
+            self._handle_service(sock, device, self._read_request(sock))
+            return
+        self._fail(sock, f"unknown host service: {request}")
+
+    def _handle_service(self, sock, device, service):
+        if service.startswith("shell,v2,raw:"):
+            if not self.shell_v2:
+                self._fail(sock, "closed")
+                return
+            sock.sendall(b"OKAY")
+            self.stdin_packets.append(struct.unpack("<BI", _recv_exact(sock, 5))[0])
+            exit_code, stdout, stderr = device.shell(service[len("shell,v2,raw:"):])
+            for packet_id, text in ((ADB_SHELL_STDOUT, stdout), (ADB_SHELL_STDERR, stderr)):
+                if text:
+                    data = text.encode("utf-8")
+                    sock.sendall(struct.pack("<BI", packet_id, len(data)) + data)
+            sock.sendall(struct.pack("<BI", ADB_SHELL_EXIT, 1) + bytes([exit_code & 0xFF]))
+        elif service.startswith("shell:"):
+            sock.sendall(b"OKAY")
+            exit_code, stdout, stderr = device.shell(service[len("shell:"):])
+            sock.sendall((stdout + stderr).encode("utf-8"))
+        elif service == "sync:":
+            sock.sendall(b"OKAY")
+            self._handle_sync(sock, device)
+        else:
+            self._fail(sock, f"unknown service: {service}")
+
+    def _handle_sync(self, sock, device):
+        while True:
+            kind = _recv_exact(sock, 4)
+            length = struct.unpack("<I", _recv_exact(sock, 4))[0]
+            if kind == b"QUIT":
+                return
+            argument = _recv_exact(sock, length).decode("utf-8")
+            if kind == b"RECV":
+                data = device.read_file(argument)
+                if data is None:
+                    message = b"No such file or directory"
+                    sock.sendall(b"FAIL" + struct.pack("<I", len(message)) + message)
+                    continue
+                for offset in range(0, len(data), 64 * 1024):
+                    chunk = data[offset:offset + 64 * 1024]
+                    sock.sendall(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+                sock.sendall(b"DONE" + struct.pack("<I", 0))
+            elif kind == b"SEND":
+                path = argument.rsplit(",", 1)[0]
+                chunks = []
+                while True:
+                    chunk_kind = _recv_exact(sock, 4)
+                    chunk_length = struct.unpack("<I", _recv_exact(sock, 4))[0]
+                    if chunk_kind == b"DONE":
+                        break
+                    chunks.append(_recv_exact(sock, chunk_length))
+                device.write_file(path, b"".join(chunks))
+                sock.sendall(b"OKAY" + struct.pack("<I", 0))
+            else:
+                return
+
+
+class InMemoryDevice:
+    """最简单的替身设备：shell命令按字典返回固定输出，文件保存在内存中"""
+
+    def __init__(self, responses=None, files=None, latency=0.0):
+        """初始化替身设备
+
+        Args:
+            responses (dict, optional): shell命令到(退出码, 标准输出, 标准错误)的映射
+            files (dict, optional): 设备路径到文件内容的映射
+            latency (float): 每条shell命令的模拟延迟（秒）
+        """
+        self.responses = responses or {}
+        self.files = files or {}
+        self.latency = latency
+        self.commands = []
+
+    def shell(self, command):
+        self.commands.append(command)
+        if self.latency:
+            time.sleep(self.latency)
+        return self.responses.get(command, (0, "", ""))
+
+    def read_file(self, path):
+        return self.files.get(path)
+
+    def write_file(self, path, data):
+        self.files[path] = data
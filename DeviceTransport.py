@@ -0,0 +1,454 @@
+import os
+import shlex
+import socket
+import struct
+import threading
+import time
+
+# hdc客户端与hdc server之间握手消息的标识
+HDC_BANNER = b"OHOS HDC"
+HDC_BANNER_SIZE = 12
+HDC_CONNECT_KEY_SIZE = 32
+
+# adb sync协议单个DATA包的最大长度
+ADB_SYNC_DATA_MAX = 64 * 1024
+
+# adb shell v2协议的数据包类型
+ADB_SHELL_STDOUT = 1
+ADB_SHELL_STDERR = 2
+ADB_SHELL_EXIT = 3
+ADB_SHELL_CLOSE_STDIN = 4
+
+
+class TransportError(Exception):
+    """与hdc/adb server通信失败"""
+
+
+class TransportRejected(TransportError):
+    """server明确拒绝了请求（返回FAIL），而不是连接中断"""
+
+
+def _recv_exact(sock, size):
+    """从socket读取指定长度的数据
+
+    Args:
+        sock (socket.socket): 已连接的socket
+        size (int): 需要读取的字节数
+
+    Returns:
+        bytes: 读取到的数据
+
+    Raises:
+        TransportError: 连接在读满之前关闭
+    """
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise TransportError("连接已关闭")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class ConnectionPool:
+    """单个设备的预连接池
+
+    hdc/adb server的一条连接只能执行一条命令，因此池中保存的是已经完成握手
+    （hdc）或已经切换到目标设备（adb）、尚未发送命令的连接。每取走一条，
+    就在后台补充一条，使下一条命令不需要等待建连和握手。
+    """
+
+    def __init__(self, connect, size=2, max_idle=30.0):
+        """初始化连接池
+
+        Args:
+            connect (callable): 创建并完成握手的连接的函数
+            size (int): 保持的空闲连接数
+            max_idle (float): 空闲连接的最长保留时间（秒），超过后server可能已关闭连接
+        """
+        self.connect = connect
+        self.size = size
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._refilling = False
+
+    def acquire(self):
+        """取出一条可用连接
+
+        Returns:
+            tuple: (socket, 是否来自连接池)
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                sock, created_at = self._idle.pop()
+                if now - created_at < self.max_idle:
+                    self._schedule_refill()
+                    return sock, True
+                sock.close()
+        self._schedule_refill()
+        return self.connect(), False
+
+    def _schedule_refill(self):
+        """在后台补充空闲连接（调用方可持有也可不持有锁）"""
+        if self.size <= 0 or self._refilling:
+            return
+        self._refilling = True
+        threading.Thread(target=self._refill, name="transport-pool-refill", daemon=True).start()
+
+    def _refill(self):
+        try:
+            while True:
+                with self._lock:
+                    if len(self._idle) >= self.size:
+                        break
+                try:
+                    sock = self.connect()
+                except (OSError, TransportError):
+                    break
+                with self._lock:
+                    self._idle.append((sock, time.monotonic()))
+        finally:
+            self._refilling = False
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            for sock, _ in self._idle:
+                sock.close()
+            self._idle = []
+
+
+class HdcServerTransport:
+    """直接通过TCP协议与hdc server通信，不再为每条命令启动hdc进程
+
+    execute的参数和返回值与HarmonyDeviceManager.execute_command相同，
+    可以通过HarmonyDeviceManager(transport=...)替换命令行调用。
+    """
+
+    def __init__(self, connect_key="", host="127.0.0.1", port=None, pool_size=2):
+        """初始化hdc server传输
+
+        Args:
+            connect_key (str): 目标设备的序列号，为空时由server选择唯一连接的设备
+            host (str): hdc server地址
+            port (int, optional): hdc server端口，默认读取OHOS_HDC_SERVER_PORT或8710
+            pool_size (int): 预连接池大小
+        """
+        self.connect_key = connect_key
+        self.host = host
+        self.port = port or int(os.getenv("OHOS_HDC_SERVER_PORT", "8710"))
+        self.pool = ConnectionPool(self._connect, pool_size)
+
+    def _send_packet(self, sock, payload):
+        sock.sendall(struct.pack(">I", len(payload)) + payload)
+
+    def _recv_packet(self, sock):
+        """读取一个长度前缀的数据包，连接正常关闭时返回None"""
+        header = sock.recv(4)
+        if not header:
+            return None
+        if len(header) < 4:
+            header += _recv_exact(sock, 4 - len(header))
+        return _recv_exact(sock, struct.unpack(">I", header)[0])
+
+    def _connect(self):
+        """建立连接并完成握手
+
+        Returns:
+            socket.socket: 已握手的连接
+        """
+        sock = socket.create_connection((self.host, self.port), timeout=10)
+        try:
+            handshake = self._recv_packet(sock)
+            if not handshake or not handshake.startswith(HDC_BANNER):
+                raise TransportError("hdc server握手失败")
+            reply = HDC_BANNER.ljust(HDC_BANNER_SIZE, b"\0")
+            reply += self.connect_key.encode("utf-8")[:HDC_CONNECT_KEY_SIZE].ljust(HDC_CONNECT_KEY_SIZE, b"\0")
+            self._send_packet(sock, reply)
+            return sock
+        except Exception:
+            sock.close()
+            raise
+
+    def _normalize_command(self, command):
+        """调整需要本地路径的命令：文件传输由server在本机读写文件，需要告知客户端的工作目录"""
+        if isinstance(command, str):
+            args = shlex.split(command)
+        else:
+            # 参数列表中需要在设备端保持原样的参数已由调用方转义，按空格拼接即可
+            args = list(command)
+            command = " ".join(args)
+        if len(args) >= 2 and args[0] == "file" and args[1] in ("send", "recv"):
+            # hdc server按双引号解析含空格的参数
+            quoted = [f'"{arg}"' if " " in arg else arg for arg in [os.getcwd() + os.sep] + args[2:]]
+            return f"file {args[1]} -cwd " + " ".join(quoted)
+        return command
+
+    def execute(self, command, timeout=30):
+        """执行一条hdc命令
+
+        Args:
+            command (str|list): hdc命令（不含hdc本身），如"shell ls"、["file", "recv", "a", "b"]
+            timeout (int): 超时时间（秒）
+
+        Returns:
+            tuple: (返回码, 标准输出, 标准错误)
+        """
+        for attempt in range(2):
+            try:
+                sock, pooled = self.pool.acquire()
+            except (OSError, TransportError) as e:
+                return -1, "", f"无法连接hdc server {self.host}:{self.port}: {str(e)}"
+            received = False
+            try:
+                sock.settimeout(timeout)
+                if self._normalize_command(command).strip() == "help":
+                    # 能完成握手即说明hdc server可用
+                    return 0, "", ""
+                self._send_packet(sock, self._normalize_command(command).encode("utf-8") + b"\0")
+                chunks = []
+                while True:
+                    packet = self._recv_packet(sock)
+                    if packet is None:
+                        break
+                    received = True
+                    chunks.append(packet)
+                output = b"".join(chunks).decode("utf-8", errors="replace").rstrip("\0").strip()
+                if output.startswith("[Fail]"):
+                    return 1, "", output
+                return 0, output, ""
+            except socket.timeout:
+                return -1, "", "命令执行超时"
+            except (OSError, TransportError) as e:
+                # 池中的空闲连接可能已被server关闭，尚未收到任何数据时换新连接重试一次
+                if pooled and not received and attempt == 0:
+                    continue
+                return -1, "", f"命令执行失败: {str(e)}"
+            finally:
+                sock.close()
+
+    def close(self):
+        self.pool.close()
+
+
+class AdbServerTransport:
+    """直接通过adb server协议（默认端口5037）执行命令，不再为每条命令启动adb进程"""
+
+    def __init__(self, serial=None, host="127.0.0.1", port=None, pool_size=2):
+        """初始化adb server传输
+
+        Args:
+            serial (str, optional): 目标设备序列号，为空时使用唯一连接的设备
+            host (str): adb server地址
+            port (int, optional): adb server端口，默认读取ANDROID_ADB_SERVER_PORT或5037
+            pool_size (int): 预连接池大小
+        """
+        self.serial = serial
+        self.host = host
+        self.port = port or int(os.getenv("ANDROID_ADB_SERVER_PORT", "5037"))
+        self.pool = ConnectionPool(self._connect_transport, pool_size)
+        self._shell_v2 = True
+
+    def _open(self):
+        return socket.create_connection((self.host, self.port), timeout=10)
+
+    def _send_request(self, sock, request):
+        """发送一条请求并读取OKAY/FAIL状态"""
+        payload = request.encode("utf-8")
+        sock.sendall(f"{len(payload):04x}".encode("ascii") + payload)
+        status = _recv_exact(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            length = int(_recv_exact(sock, 4), 16)
+            raise TransportRejected(_recv_exact(sock, length).decode("utf-8", errors="replace"))
+        raise TransportError(f"adb server返回了未知状态: {status!r}")
+
+    def _connect_transport(self):
+        """建立连接并切换到目标设备"""
+        sock = self._open()
+        try:
+            self._send_request(sock, f"host:transport:{self.serial}" if self.serial else "host:transport-any")
+            return sock
+        except Exception:
+            sock.close()
+            raise
+
+    def _host_query(self, request, timeout):
+        """执行host:开头、返回长度前缀数据的查询"""
+        sock = self._open()
+        try:
+            sock.settimeout(timeout)
+            self._send_request(sock, request)
+            length = int(_recv_exact(sock, 4), 16)
+            return _recv_exact(sock, length).decode("utf-8", errors="replace")
+        finally:
+            sock.close()
+
+    def _shell(self, sock, command):
+        """执行shell命令，优先使用可以获取退出码的shell v2协议"""
+        if self._shell_v2:
+            try:
+                self._send_request(sock, f"shell,v2,raw:{command}")
+            except TransportRejected:
+                # server拒绝了shell v2，之后都使用旧协议；连接中断等其他错误不影响协议选择
+                self._shell_v2 = False
+                raise
+            # 关闭stdin，避免设备端命令等待输入
+            sock.sendall(struct.pack("<BI", ADB_SHELL_CLOSE_STDIN, 0))
+            stdout, stderr, exit_code = [], [], 0
+            while True:
+                header = sock.recv(5)
+                if not header:
+                    break
+                if len(header) < 5:
+                    header += _recv_exact(sock, 5 - len(header))
+                packet_id, length = struct.unpack("<BI", header)
+                data = _recv_exact(sock, length)
+                if packet_id == ADB_SHELL_STDOUT:
+                    stdout.append(data)
+                elif packet_id == ADB_SHELL_STDERR:
+                    stderr.append(data)
+                elif packet_id == ADB_SHELL_EXIT:
+                    exit_code = data[0] if data else 0
+                    break
+            return exit_code, b"".join(stdout), b"".join(stderr)
+
+        self._send_request(sock, f"shell:{command}")
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return 0, b"".join(chunks), b""
+
+    def _pull(self, sock, remote_path, local_path):
+        """通过sync协议从设备拉取文件"""
+        self._send_request(sock, "sync:")
+        path = remote_path.encode("utf-8")
+        sock.sendall(b"RECV" + struct.pack("<I", len(path)) + path)
+        tmp_path = local_path + ".part"
+        try:
+            with open(tmp_path, "wb") as f:
+                while True:
+                    kind = _recv_exact(sock, 4)
+                    length = struct.unpack("<I", _recv_exact(sock, 4))[0]
+                    if kind == b"DATA":
+                        f.write(_recv_exact(sock, length))
+                    elif kind == b"DONE":
+                        break
+                    elif kind == b"FAIL":
+                        raise TransportError(_recv_exact(sock, length).decode("utf-8", errors="replace"))
+                    else:
+                        raise TransportError(f"sync协议返回了未知数据: {kind!r}")
+            os.replace(tmp_path, local_path)
+        finally:
+            # 拉取失败时不留下不完整的文件
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        sock.sendall(b"QUIT" + struct.pack("<I", 0))
+
+    def _push(self, sock, local_path, remote_path):
+        """通过sync协议向设备推送文件"""
+        self._send_request(sock, "sync:")
+        header = f"{remote_path},{0o644}".encode("utf-8")
+        sock.sendall(b"SEND" + struct.pack("<I", len(header)) + header)
+        with open(local_path, "rb") as f:
+            while True:
+                data = f.read(ADB_SYNC_DATA_MAX)
+                if not data:
+                    break
+                sock.sendall(b"DATA" + struct.pack("<I", len(data)) + data)
+        sock.sendall(b"DONE" + struct.pack("<I", int(time.time())))
+        status = _recv_exact(sock, 4)
+        length = struct.unpack("<I", _recv_exact(sock, 4))[0]
+        if status != b"OKAY":
+            raise TransportError(_recv_exact(sock, length).decode("utf-8", errors="replace"))
+        sock.sendall(b"QUIT" + struct.pack("<I", 0))
+
+    def execute(self, command, timeout=30):
+        """执行一条adb命令
+
+        支持help、devices、shell、pull、push，参数和返回值与HarmonyDeviceManager.execute_command相同。
+
+        Args:
+            command (str|list): adb命令（不含adb本身）
+            timeout (int): 超时时间（秒）
+
+        Returns:
+            tuple: (返回码, 标准输出, 标准错误)
+        """
+        args = shlex.split(command) if isinstance(command, str) else list(command)
+        if not args:
+            return -1, "", "命令为空"
+        try:
+            if args[0] in ("help", "version"):
+                version = self._host_query("host:version", timeout)
+                return 0, f"Android Debug Bridge version {int(version, 16)}", ""
+            if args[0] == "devices":
+                devices = self._host_query("host:devices", timeout)
+                return 0, "List of devices attached\n" + devices.strip(), ""
+            if args[0] not in ("shell", "pull", "push"):
+                return -1, "", f"adb server传输不支持该命令: {args[0]}"
+        except socket.timeout:
+            return -1, "", "命令执行超时"
+        except (OSError, TransportError, ValueError) as e:
+            return -1, "", f"无法连接adb server {self.host}:{self.port}: {str(e)}"
+
+        for attempt in range(2):
+            try:
+                sock, pooled = self.pool.acquire()
+            except (OSError, TransportError) as e:
+                return -1, "", f"无法连接adb server {self.host}:{self.port}: {str(e)}"
+            shell_v2 = self._shell_v2
+            try:
+                sock.settimeout(timeout)
+                if args[0] == "shell":
+                    if isinstance(command, str):
+                        shell_command = command.split(None, 1)[1] if len(args) > 1 else ""
+                    else:
+                        shell_command = " ".join(args[1:])
+                    exit_code, stdout, stderr = self._shell(sock, shell_command)
+                    return (
+                        exit_code,
+                        stdout.decode("utf-8", errors="replace").strip(),
+                        stderr.decode("utf-8", errors="replace").strip(),
+                    )
+                if len(args) != 3:
+                    return -1, "", f"{args[0]}命令需要两个路径参数"
+                if args[0] == "pull":
+                    self._pull(sock, args[1], args[2])
+                else:
+                    self._push(sock, args[1], args[2])
+                return 0, "", ""
+            except socket.timeout:
+                return -1, "", "命令执行超时"
+            except (OSError, TransportError) as e:
+                # 池中的空闲连接可能已失效，或server刚拒绝了shell v2，换新连接重试一次
+                if attempt == 0 and (pooled or shell_v2 != self._shell_v2):
+                    continue
+                return -1, "", f"命令执行失败: {str(e)}"
+            finally:
+                sock.close()
+
+    def close(self):
+        self.pool.close()
+
+
+def create_server_transport(command_type, serial=None):
+    """按命令类型创建直连server的传输
+
+    Args:
+        command_type (str): "hdc"或"adb"
+        serial (str, optional): 目标设备序列号
+
+    Returns:
+        HdcServerTransport|AdbServerTransport: 传输实例
+    """
+    if command_type == "adb":
+        return AdbServerTransport(serial)
+    return HdcServerTransport(serial or "")
@@ -0,0 +1,931 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import contextlib
+import json
+import os
+import random
+import shlex
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from DeviceServerStandIn import HdcStandInServer
+from DeviceTransport import HdcServerTransport
+
+# 桌面的包名和模拟的应用：包名 -> (应用名称, 应用首页的列表项)
+LAUNCHER_PACKAGE = "com.ohos.launcher"
+SIMULATED_APPS = {
+    "com.huawei.hmos.settings": ("设置", ["WLAN", "蓝牙", "移动网络", "显示和亮度", "声音和振动", "电池"]),
+    "com.huawei.hmos.camera": ("相机", ["拍照", "录像", "人像", "夜景"]),
+    "com.huawei.hmos.photos": ("图库", ["照片", "相册", "发现"]),
+    "com.huawei.hmos.browser": ("浏览器", ["搜索", "书签", "历史记录"]),
+    "com.huawei.hmos.clock": ("时钟", ["闹钟", "世界时钟", "秒表", "计时器"]),
+    "com.huawei.hmos.notepad": ("备忘录", ["新建笔记", "搜索笔记"]),
+}
+
+# 负载测试的默认指令：本地规则可以处理的导航、输入，以及需要调用模型的指令
+DEFAULT_WORKLOAD = [
+    "回到桌面",
+    "打开设置",
+    "点击WLAN",
+    "返回",
+    "帮我看看蓝牙的状态",
+    "回到桌面",
+    "打开备忘录",
+    "点击新建笔记",
+    "输入今天的会议纪要",
+    "回到桌面",
+]
+
+OFFLINE_MESSAGE = "[Fail]Device not founded or connected"
+
+_PNG_CACHE_SIZE = 512
+_png_cache = collections.OrderedDict()
+_png_cache_lock = threading.Lock()
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def encode_png(width, height, rows):
+    """用纯Python编码8位灰度PNG
+
+    Args:
+        width (int): 宽度
+        height (int): 高度
+        rows (list): 每行的像素字节，共height行，每行width字节
+
+    Returns:
+        bytes: PNG数据
+    """
+    raw = b"".join(b"\0" + row for row in rows)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+        + _png_chunk(b"IDAT", zlib.compress(raw, 1))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def render_frame(scene, screen_size, width, height):
+    """将界面场景渲染为灰度PNG，相同场景和尺寸的结果在进程内缓存
+
+    Args:
+        scene (tuple): 场景描述，(背景灰度, ((x1, y1, x2, y2, 灰度), ...))，坐标为设备像素
+        screen_size (tuple): 设备屏幕尺寸 (宽, 高)
+        width (int): 输出宽度
+        height (int): 输出高度
+
+    Returns:
+        bytes: PNG数据
+    """
+    key = (scene, screen_size, width, height)
+    with _png_cache_lock:
+        data = _png_cache.get(key)
+        if data is not None:
+            _png_cache.move_to_end(key)
+            return data
+
+    background, rects = scene
+    scale_x = width / screen_size[0]
+    scale_y = height / screen_size[1]
+    scaled = [(int(x1 * scale_x), int(y1 * scale_y), max(int(x1 * scale_x) + 1, int(x2 * scale_x)),
+               max(int(y1 * scale_y) + 1, int(y2 * scale_y)), level) for x1, y1, x2, y2, level in rects]
+    # 覆盖同一组矩形的行内容相同，只生成一次
+    row_cache = {}
+    rows = []
+    for y in range(height):
+        active = tuple(rect for rect in scaled if rect[1] <= y < rect[3])
+        row = row_cache.get(active)
+        if row is None:
+            pixels = bytearray([background]) * width
+            for x1, _, x2, _, level in active:
+                pixels[max(0, x1):min(width, x2)] = bytes([level]) * (min(width, x2) - max(0, x1))
+            row = row_cache[active] = bytes(pixels)
+        rows.append(row)
+    data = encode_png(width, height, rows)
+
+    with _png_cache_lock:
+        _png_cache[key] = data
+        while len(_png_cache) > _PNG_CACHE_SIZE:
+            _png_cache.popitem(last=False)
+    return data
+
+
+class VirtualDevice:
+    """虚拟设备：带界面状态机的替身设备，可直接交给DeviceServerStandIn或SimulatedTransport使用
+
+    界面包括桌面、应用首页和应用内的详情页（带开关和输入框）。点击、滑动、按键、输入文本、
+    启动应用都会改变界面状态，截图和控件树按当前状态生成。每条命令按配置模拟延迟和抖动，
+    并可按概率返回失败或断开连接一段时间。
+    """
+
+    def __init__(self, serial, screen_size=(1260, 2720), latency=0.02, jitter=0.005, failure_rate=0.0,
+                 disconnect_rate=0.0, disconnect_duration=2.0, animation_time=0.15, screenshot_scale=0.25,
+                 bandwidth=40 * 1024 * 1024, response_delay=0.0, seed=None):
+        """初始化虚拟设备
+
+        Args:
+            serial (str): 设备序列号
+            screen_size (tuple): 屏幕尺寸 (宽, 高)
+            latency (float): 每条shell命令的平均延迟（秒）
+            jitter (float): 延迟的标准差（秒）
+            failure_rate (float): 每条命令返回失败的概率
+            disconnect_rate (float): 每条命令之后断开连接的概率
+            disconnect_duration (float): 断开连接的持续时间（秒）
+            animation_time (float): 界面切换动画的时长（秒），期间画面持续变化
+            screenshot_scale (float): 未指定尺寸的截图相对屏幕尺寸的缩放比例
+            bandwidth (float): 文件传输速度（字节/秒）
+            response_delay (float): 点击后界面开始响应前的延迟（秒），模拟响应慢的应用
+            seed (int, optional): 随机数种子
+        """
+        self.serial = serial
+        self.screen_size = screen_size
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.disconnect_rate = disconnect_rate
+        self.disconnect_duration = disconnect_duration
+        self.animation_time = animation_time
+        self.screenshot_scale = screenshot_scale
+        self.bandwidth = bandwidth
+        self.response_delay = response_delay
+        self.random = random.Random(seed)
+        self.files = {}
+        self.stack = [("home",)]
+        self.switches = {}
+        self.texts = {}
+        self.scroll = 0
+        self.changed_at = 0.0
+        self.offline_until = 0.0
+        # 尚未生效的点击：(生效的单调时间, x, y)
+        self._pending_taps = []
+        self._lock = threading.Lock()
+        self.stats = {"commands": 0, "failures": 0, "disconnects": 0, "taps": 0, "no_op_taps": 0}
+
+    @property
+    def online(self):
+        """设备当前是否在线"""
+        return time.monotonic() >= self.offline_until
+
+    @property
+    def screen(self):
+        return self.stack[-1]
+
+    @property
+    def package(self):
+        """前台应用包名"""
+        return LAUNCHER_PACKAGE if self.screen[0] == "home" else self.screen[1]
+
+    def elements(self):
+        """当前界面的UI元素
+
+        Returns:
+            list: 每项为dict，包含type、text、bounds (x1, y1, x2, y2)、clickable和点击后的动作
+        """
+        width, height = self.screen_size
+        screen = self.screen
+        elements = [{"type": "Text", "text": "12:00", "bounds": (0, 0, width, height // 30),
+                     "clickable": False, "on_tap": None}]
+        if screen[0] == "home":
+            cell_w, cell_h = width // 4, height // 8
+            for index, (package, (name, _)) in enumerate(SIMULATED_APPS.items()):
+                x = (index % 4) * cell_w
+                y = height // 6 + (index // 4) * cell_h
+                elements.append({"type": "Image", "text": name,
+                                 "bounds": (x + cell_w // 6, y, x + cell_w * 5 // 6, y + cell_h * 3 // 4),
+                                 "clickable": True, "on_tap": ("open", ("app", package))})
+            return elements
+
+        title = SIMULATED_APPS[screen[1]][0] if screen[0] == "app" else screen[2]
+        top = height // 30
+        elements.append({"type": "Button", "text": "返回", "bounds": (0, top, width // 6, top + height // 16),
+                         "clickable": True, "on_tap": ("back", None)})
+        elements.append({"type": "Text", "text": title, "bounds": (width // 5, top, width * 4 // 5, top + height // 16),
+                         "clickable": False, "on_tap": None})
+        row_h = height // 12
+        start = top + height // 12 - self.scroll
+        if screen[0] == "app":
+            for index, item in enumerate(SIMULATED_APPS[screen[1]][1]):
+                y = start + index * row_h
+                if y + row_h <= top + height // 16 or y >= height:
+                    continue
+                elements.append({"type": "ListItem", "text": item,
+                                 "bounds": (width // 20, y, width * 19 // 20, y + row_h - 8),
+                                 "clickable": True, "on_tap": ("open", ("page", screen[1], item))})
+            return elements
+
+        switch_on = self.switches.get(screen, False)
+        elements.append({"type": "Toggle", "text": "开启" if switch_on else "关闭",
+                         "bounds": (width * 3 // 4, start, width * 19 // 20, start + row_h // 2),
+                         "clickable": True, "on_tap": ("toggle", None)})
+        elements.append({"type": "TextInput", "text": self.texts.get(screen, ""),
+                         "bounds": (width // 20, start + row_h, width * 19 // 20, start + row_h * 2),
+                         "clickable": True, "on_tap": ("focus", None)})
+        return elements
+
+    def scene(self):
+        """当前画面的场景描述，用于渲染和缓存"""
+        screen_key = "/".join(str(part) for part in self.screen)
+        background = 40 + zlib.crc32(screen_key.encode("utf-8")) % 160
+        rects = []
+        for element in self.elements():
+            x1, y1, x2, y2 = element["bounds"]
+            level = (background + 60 + 10 * len(element["text"])) % 256
+            if element["type"] == "Toggle":
+                level = 250 if element["text"] == "开启" else 20
+            rects.append((x1, y1, x2, y2, level))
+            if element["type"] == "TextInput" and element["text"]:
+                # 输入框中的文字长度体现为一条进度条
+                fill = min(x2, x1 + 20 * len(element["text"]))
+                rects.append((x1, y1 + (y2 - y1) // 3, fill, y2 - (y2 - y1) // 3, 255 - background))
+        progress = (time.monotonic() - self.changed_at) / self.animation_time if self.animation_time else 1.0
+        if progress < 1.0:
+            # 切换动画：遮罩从底部向上收起，按三档量化以便缓存
+            step = int(progress * 3)
+            height = self.screen_size[1]
+            rects.append((0, height * (step + 1) // 4, self.screen_size[0], height, 128))
+        return background, tuple(rects)
+
+    def _changed(self):
+        self.changed_at = time.monotonic()
+
+    def _push(self, screen):
+        self.stack.append(screen)
+        self.scroll = 0
+        self._changed()
+
+    def tap(self, x, y):
+        """在(x, y)处点击，命中的可点击元素触发对应的界面变化（设置了response_delay时延迟生效）"""
+        self.stats["taps"] += 1
+        if self.response_delay:
+            self._pending_taps.append((time.monotonic() + self.response_delay, x, y))
+        else:
+            self._apply_tap(x, y)
+
+    def _apply_pending_taps(self):
+        now = time.monotonic()
+        while self._pending_taps and self._pending_taps[0][0] <= now:
+            _, x, y = self._pending_taps.pop(0)
+            self._apply_tap(x, y)
+
+    def _apply_tap(self, x, y):
+        for element in reversed(self.elements()):
+            x1, y1, x2, y2 = element["bounds"]
+            if element["clickable"] and x1 <= x < x2 and y1 <= y < y2:
+                action, target = element["on_tap"]
+                if action == "open":
+                    self._push(target)
+                elif action == "back":
+                    self.back()
+                elif action == "toggle":
+                    self.switches[self.screen] = not self.switches.get(self.screen, False)
+                    self._changed()
+                return
+        self.stats["no_op_taps"] += 1
+
+    def back(self):
+        if len(self.stack) > 1:
+            self.stack.pop()
+            self.scroll = 0
+            self._changed()
+
+    def home(self):
+        if len(self.stack) > 1:
+            self.stack = [("home",)]
+            self.scroll = 0
+            self._changed()
+
+    def swipe(self, start_y, end_y):
+        if self.screen[0] == "app":
+            limit = max(0, len(SIMULATED_APPS[self.screen[1]][1]) * self.screen_size[1] // 12 - self.screen_size[1] // 2)
+            scroll = min(limit, max(0, self.scroll + (start_y - end_y)))
+            if scroll != self.scroll:
+                self.scroll = scroll
+                self._changed()
+
+    def type_text(self, text):
+        if self.screen[0] == "page":
+            self.texts[self.screen] = self.texts.get(self.screen, "") + text
+            self._changed()
+
+    def launch(self, package):
+        if package in SIMULATED_APPS:
+            self.stack = [("home",), ("app", package)]
+            self.scroll = 0
+            self._changed()
+            return True
+        return False
+
+    def mission_dump(self):
+        """生成aa dump -l格式的任务列表，只包含前台任务"""
+        ability = "EntryAbility" if self.screen[0] == "home" else "MainAbility"
+        return (
+            "User ID #100\n"
+            "  current mission lists:{\n"
+            f"    Mission ID #1  mission name #[#{self.package}:entry:{ability}]  lockedState #0\n"
+            "      AbilityRecord ID #1\n"
+            f"        app name [{self.package}]\n"
+            f"        main name [{ability}]\n"
+            f"        bundle name [{self.package}]\n"
+            "        ability type [PAGE]\n"
+            "        state #FOREGROUND  start time [0]\n"
+            "  }\n"
+        )
+
+    def layout_json(self):
+        """生成uitest dumpLayout格式的控件树"""
+        width, height = self.screen_size
+        children = [{
+            "attributes": {
+                "type": element["type"],
+                "text": element["text"],
+                "bounds": "[{},{}][{},{}]".format(*element["bounds"]),
+                "clickable": "true" if element["clickable"] else "false",
+            },
+            "children": [],
+        } for element in self.elements()]
+        return json.dumps({
+            "attributes": {"type": "root", "bundleName": self.package, "bounds": f"[0,0][{width},{height}]"},
+            "children": children,
+        }, ensure_ascii=False)
+
+    def layout_xml(self):
+        """生成uiautomator dump格式的控件树"""
+        nodes = "".join(
+            '<node class="{}" text={} package="{}" bounds="[{},{}][{},{}]" clickable="{}" />'.format(
+                element["type"], json.dumps(element["text"], ensure_ascii=False), self.package,
+                *element["bounds"], "true" if element["clickable"] else "false")
+            for element in self.elements()
+        )
+        return f'<?xml version="1.0" encoding="UTF-8"?><hierarchy rotation="0">{nodes}</hierarchy>'
+
+    def _delay(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def shell(self, command):
+        """执行一条设备端shell命令
+
+        Args:
+            command (str): shell命令
+
+        Returns:
+            tuple: (退出码, 标准输出, 标准错误)
+        """
+        if not self.online:
+            return 255, "", OFFLINE_MESSAGE
+        self._delay(max(0.0, self.random.gauss(self.latency, self.jitter)))
+        with self._lock:
+            self.stats["commands"] += 1
+            if self.failure_rate and self.random.random() < self.failure_rate:
+                self.stats["failures"] += 1
+                return 1, "", "[Fail]simulated command failure"
+            if self.disconnect_rate and self.random.random() < self.disconnect_rate:
+                self.stats["disconnects"] += 1
+                self.offline_until = time.monotonic() + self.disconnect_duration
+            self._apply_pending_taps()
+            try:
+                return self._run(shlex.split(command))
+            except (ValueError, IndexError) as e:
+                return 1, "", f"invalid command: {command} ({str(e)})"
+
+    def _run(self, args):
+        tool = args[0] if args else ""
+        if tool == "uinput" and "-T" in args:
+            index = args.index("-d")
+            self.tap(int(args[index + 1]), int(args[index + 2]))
+        elif tool == "input" and args[1] == "tap":
+            self.tap(int(args[2]), int(args[3]))
+        elif tool == "input" and args[1] == "swipe":
+            self.swipe(int(args[3]), int(args[5]))
+        elif tool == "input" and args[1] == "keyevent":
+            keycode = int(args[2])
+            if keycode == 3:
+                self.home()
+            elif keycode == 4:
+                self.back()
+        elif tool == "input" and args[1] == "text":
+            self.type_text(args[2].replace("%s", " "))
+        elif tool == "uitest" and args[1] == "--version":
+            return 0, "5.0.1.0", ""
+        elif tool == "uitest" and args[1] == "uiInput" and args[2] == "text":
+            self.type_text(" ".join(args[3:]))
+        elif tool == "uitest" and args[1] == "dumpLayout":
+            self.files[args[args.index("-p") + 1]] = self.layout_json().encode("utf-8")
+        elif tool == "uiautomator" and args[1] == "dump":
+            self.files[args[2]] = self.layout_xml().encode("utf-8")
+        elif tool in ("snapshot_display", "screencap"):
+            path = args[args.index("-f") + 1] if "-f" in args else args[-1]
+            width = int(args[args.index("-w") + 1]) if "-w" in args else int(self.screen_size[0] * self.screenshot_scale)
+            height = int(args[args.index("-h") + 1]) if "-h" in args else int(self.screen_size[1] * self.screenshot_scale)
+            self.files[path] = render_frame(self.scene(), self.screen_size, width, height)
+        elif tool == "wm" and args[1] == "size":
+            return 0, "Physical size: {}x{}".format(*self.screen_size), ""
+        elif tool == "aa" and args[1] == "dump":
+            return 0, self.mission_dump(), ""
+        elif tool == "aa" and args[1] == "start":
+            if not self.launch(args[args.index("-b") + 1]):
+                return 0, "error: failed to start ability", ""
+            return 0, "start ability successfully.", ""
+        elif tool == "monkey":
+            self.launch(args[args.index("-p") + 1])
+        elif tool == "rm":
+            self.files.pop(args[-1], None)
+        return 0, "", ""
+
+    def read_file(self, path):
+        if not self.online:
+            return None
+        data = self.files.get(path)
+        if data is not None:
+            self._delay(len(data) / self.bandwidth)
+        return data
+
+    def write_file(self, path, data):
+        self.files[path] = data
+
+
+class SimulatedTransport:
+    """进程内的hdc传输：直接调用虚拟设备，不经过TCP，接口与HdcServerTransport相同
+
+    用于设备数量很多时排除本机TCP连接的开销，只测量代理自身的扩展能力。
+    """
+
+    def __init__(self, devices, connect_key=""):
+        """初始化进程内传输
+
+        Args:
+            devices (dict): 序列号到虚拟设备的映射
+            connect_key (str): 目标设备的序列号，为空时只能在只有一台设备时使用
+        """
+        self.devices = devices
+        self.connect_key = connect_key
+
+    def execute(self, command, timeout=30):
+        """执行一条hdc命令
+
+        Args:
+            command (str|list): hdc命令（不含hdc本身）
+            timeout (int): 超时时间（秒），进程内调用不会超时
+
+        Returns:
+            tuple: (返回码, 标准输出, 标准错误)
+        """
+        # 参数列表中需要在设备端保持原样的参数已由调用方转义，与HdcServerTransport一样按空格拼接
+        text = command if isinstance(command, str) else " ".join(command)
+        args = shlex.split(command) if isinstance(command, str) else list(command)
+        if args == ["help"]:
+            return 0, "", ""
+        if args == ["list", "targets"]:
+            online = [serial for serial, device in self.devices.items() if device.online]
+            return 0, "\n".join(online) if online else "[Empty]", ""
+        device = self.devices.get(self.connect_key) if self.connect_key else (
+            next(iter(self.devices.values())) if len(self.devices) == 1 else None)
+        if device is None or not device.online:
+            return 1, "", OFFLINE_MESSAGE
+        if args[0] == "shell":
+            exit_code, stdout, stderr = device.shell(text.strip()[len("shell "):])
+            return (0 if exit_code == 0 else 1), stdout, stderr
+        if len(args) == 4 and args[:2] == ["file", "recv"]:
+            data = device.read_file(args[2])
+            if data is None:
+                return 1, "", f"[Fail]Error opening file: no such file or directory, path:{args[2]}"
+            with open(args[3], "wb") as f:
+                f.write(data)
+            return 0, f"FileTransfer finish, Size:{len(data)}, File count = 1", ""
+        if len(args) == 4 and args[:2] == ["file", "send"]:
+            with open(args[2], "rb") as f:
+                device.write_file(args[3], f.read())
+            return 0, "FileTransfer finish, File count = 1", ""
+        return 1, "", f"[Fail]Unknown command: {' '.join(args)}"
+
+    def close(self):
+        pass
+
+
+class FleetSimulator:
+    """虚拟设备集群：N台虚拟设备，可通过本地hdc替身server或进程内传输访问"""
+
+    def __init__(self, count, seed=0, **device_options):
+        """初始化设备集群
+
+        Args:
+            count (int): 设备数量
+            seed (int): 随机数种子，每台设备使用不同的派生种子
+            **device_options: 传给VirtualDevice的参数，如latency、jitter、failure_rate、disconnect_rate
+        """
+        self.devices = {}
+        for index in range(count):
+            serial = f"SIMDEV{index:06d}"
+            self.devices[serial] = VirtualDevice(serial, seed=seed * 100003 + index, **device_options)
+        self.server = None
+
+    def start_server(self, host="127.0.0.1", port=0):
+        """启动hdc替身server，所有虚拟设备都挂在该server上
+
+        Returns:
+            int: 实际监听的端口
+        """
+        self.server = HdcStandInServer(self.devices, host, port)
+        return self.server.start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+
+    def transport(self, serial, tcp=False):
+        """获取某台设备的命令传输
+
+        Args:
+            serial (str): 设备序列号
+            tcp (bool): 是否经过hdc替身server（需先调用start_server），否则使用进程内传输
+
+        Returns:
+            object: HdcServerTransport或SimulatedTransport
+        """
+        if tcp:
+            return HdcServerTransport(serial, host=self.server.host, port=self.server.port)
+        return SimulatedTransport(self.devices, serial)
+
+    def device_manager(self, serial, work_dir, tcp=False, screenshot_store=None):
+        """创建连接到某台虚拟设备的设备管理器
+
+        Args:
+            serial (str): 设备序列号
+            work_dir (str): 截图归档目录所在的目录
+            tcp (bool): 是否经过hdc替身server
+            screenshot_store (ScreenshotStore, optional): 截图归档存储，默认归档到work_dir/pictures且不在后台清理
+
+        Returns:
+            HarmonyDeviceManager: 设备管理器
+        """
+        from HarmonyDeviceManager import HarmonyDeviceManager
+
+        return HarmonyDeviceManager("hdc", screenshot_store=screenshot_store or self._screenshot_store(work_dir),
+                                    transport=self.transport(serial, tcp), device_id=serial)
+
+    def agent(self, serial, work_dir, tcp=False, screenshot_store=None):
+        """创建驱动某台虚拟设备的代理，截图保存在work_dir下
+
+        Args:
+            serial (str): 设备序列号
+            work_dir (str): 截图和截图归档所在的目录
+            tcp (bool): 是否经过hdc替身server
+            screenshot_store (ScreenshotStore, optional): 截图归档存储，默认归档到work_dir/pictures且不在后台清理
+
+        Returns:
+            HarmonyAutoAgent: 代理实例
+        """
+        from HarmonyAutoAgent import HarmonyAutoAgent
+
+        return HarmonyAutoAgent(
+            "hdc", screenshot_path=os.path.join(work_dir, f"{serial}.jpeg"), transport=self.transport(serial, tcp),
+            device_id=serial, screenshot_store=screenshot_store or self._screenshot_store(work_dir)
+        )
+
+    @staticmethod
+    def _screenshot_store(work_dir):
+        from ScreenshotStore import ScreenshotStore
+
+        return ScreenshotStore(os.path.join(work_dir, "pictures"), background_pruning=False)
+
+    def get_stats(self):
+        """汇总所有设备的命令统计"""
+        totals = collections.Counter()
+        for device in self.devices.values():
+            totals.update(device.stats)
+        return dict(totals)
+
+
+class MockLLMServer:
+    """模拟的OpenAI兼容聊天补全接口，按固定规则返回结果，用于负载测试
+
+    根据提示中的用户指令和UI元素选出文字出现在指令中的元素，返回点击操作或该元素本身；
+    其他类型的请求返回能被正常解析的保守结果。
+    """
+
+    def __init__(self, latency=0.3, jitter=0.05, host="127.0.0.1", port=0, seed=0):
+        """初始化模拟接口
+
+        Args:
+            latency (float): 平均响应延迟（秒）
+            jitter (float): 延迟的标准差（秒）
+            host (str): 监听地址
+            port (int): 监听端口，0表示自动分配
+            seed (int): 随机数种子
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.host = host
+        self.port = port
+        self.random = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    @staticmethod
+    def _prompt_text(messages):
+        texts = []
+        for message in messages:
+            content = message.get("content")
+            if isinstance(content, str):
+                texts.append(content)
+            elif isinstance(content, list):
+                texts.extend(part.get("text", "") for part in content if isinstance(part, dict))
+        return "\n".join(texts)
+
+    @staticmethod
+    def _elements(text):
+        marker = "当前屏幕UI元素:\n"
+        if marker not in text:
+            return []
+        try:
+            value, _ = json.JSONDecoder().raw_decode(text[text.index(marker) + len(marker):])
+        except ValueError:
+            return []
+        if isinstance(value, dict):
+            value = next((item for item in value.values() if isinstance(item, list)), [])
+        return [element for element in value if isinstance(element, dict)] if isinstance(value, list) else []
+
+    def respond(self, text):
+        """根据提示生成回复
+
+        Args:
+            text (str): 全部消息的文字内容
+
+        Returns:
+            str: 回复内容
+        """
+        if "请只返回该字段的正确值" in text:
+            return json.dumps({"value": None})
+        if "以下指令依次执行" in text:
+            return json.dumps({"plans": []})
+        if "每一轮只返回一个JSON对象" in text:
+            return json.dumps({"status": "done", "reason": "模拟结果"})
+        instruction = ""
+        for line in text.splitlines():
+            if line.startswith("用户指令:"):
+                instruction = line[len("用户指令:"):].strip()
+                break
+        if "start_x" in text and "当前屏幕尺寸" in text:
+            return json.dumps({"start_x": 630, "start_y": 1900, "end_x": 630, "end_y": 800, "duration": 300})
+        labelled = [element for element in self._elements(text)
+                    if element.get("text") and str(element["text"]) in instruction]
+        target = max(labelled, key=lambda element: len(str(element["text"])), default=None)
+        if "找到与用户指令最匹配的元素" in text:
+            return json.dumps(target or {"need_screen": True}, ensure_ascii=False)
+        if target is None:
+            return json.dumps({"action": "press_back", "params": {}})
+        x1, y1, x2, y2 = target["position"]
+        return json.dumps({"action": "click", "target": target,
+                           "params": {"coordinates": [(x1 + x2) // 2, (y1 + y2) // 2]}}, ensure_ascii=False)
+
+    def start(self):
+        """在后台线程中启动接口
+
+        Returns:
+            str: 接口的base_url
+        """
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+                text = owner._prompt_text(request.get("messages", []))
+                with owner._lock:
+                    owner.requests += 1
+                    delay = max(0.0, owner.random.gauss(owner.latency, owner.jitter))
+                time.sleep(delay)
+                content = owner.respond(text)
+                body = json.dumps({
+                    "id": f"sim-{owner.requests}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "simulated"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": len(text) // 2, "completion_tokens": len(content) // 2,
+                              "total_tokens": len(text) // 2 + len(content) // 2},
+                }, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="mock-llm", daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _process_usage():
+    """进程的CPU时间（秒）、当前RSS和峰值RSS（字节），不支持的平台返回None"""
+    cpu = time.process_time()
+    rss = peak = None
+    try:
+        with open("/proc/self/statm", "r") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        pass
+    return cpu, rss, peak
+
+
+def run_load(fleet, workload=None, rounds=1, llm_url=None, tcp=False, workdir=None, quiet=True):
+    """在集群的每台设备上并发执行指令，统计代理进程的吞吐、延迟和资源占用
+
+    每台设备对应一个代理实例和一个工作线程，依次执行rounds轮workload。
+
+    Args:
+        fleet (FleetSimulator): 设备集群
+        workload (list, optional): 每轮执行的指令，默认DEFAULT_WORKLOAD
+        rounds (int): 每台设备执行的轮数
+        llm_url (str): 模拟LLM接口的base_url
+        tcp (bool): 是否经过hdc替身server通信（需先调用fleet.start_server）
+        workdir (str, optional): 截图、界面分析缓存等文件的目录，默认使用临时目录
+        quiet (bool): 是否屏蔽代理的逐步输出
+
+    Returns:
+        dict: 负载测试报告
+    """
+    from LayoutCache import LayoutCache
+    from OpenAICompatibleClient import OpenAICompatibleClient
+
+    workload = workload or DEFAULT_WORKLOAD
+    temporary = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix="fleet-")
+    store = fleet._screenshot_store(workdir)
+    layout_cache = LayoutCache(os.path.join(workdir, "layout_cache.sqlite3"))
+    agents = []
+    for serial in fleet.devices:
+        agent = fleet.agent(serial, workdir, tcp=tcp, screenshot_store=store)
+        agent.layout_cache = layout_cache
+        agent._client = OpenAICompatibleClient(api_key="simulated", base_url=llm_url, model_id="simulated-model")
+        agents.append(agent)
+
+    durations = []
+    outcomes = collections.Counter()
+    lock = threading.Lock()
+
+    def drive(agent):
+        for _ in range(rounds):
+            for instruction in workload:
+                started = time.monotonic()
+                try:
+                    success = agent.execute_instruction(instruction)
+                except Exception:
+                    success = False
+                elapsed = time.monotonic() - started
+                with lock:
+                    durations.append(elapsed)
+                    outcomes["success" if success else "failure"] += 1
+
+    cpu_before, _, _ = _process_usage()
+    started = time.monotonic()
+    output = open(os.devnull, "w") if quiet else None
+    try:
+        with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+            with ThreadPoolExecutor(max_workers=len(agents), thread_name_prefix="fleet-agent") as pool:
+                list(pool.map(drive, agents))
+    finally:
+        if output is not None:
+            output.close()
+        layout_cache.close()
+        if temporary:
+            shutil.rmtree(workdir, ignore_errors=True)
+    wall = time.monotonic() - started
+    cpu_after, rss, peak = _process_usage()
+
+    total = sum(outcomes.values())
+    cpu_seconds = cpu_after - cpu_before
+    return {
+        "devices": len(agents),
+        "instructions": total,
+        "succeeded": outcomes["success"],
+        "wall_seconds": wall,
+        "instructions_per_second": total / wall if wall else 0.0,
+        "latency_p50": _percentile(durations, 0.5),
+        "latency_p90": _percentile(durations, 0.9),
+        "latency_p99": _percentile(durations, 0.99),
+        "latency_max": max(durations) if durations else None,
+        "cpu_seconds": cpu_seconds,
+        "cpu_percent": cpu_seconds / wall * 100 if wall else 0.0,
+        "rss_mb": rss / 1024 / 1024 if rss else None,
+        "peak_rss_mb": peak / 1024 / 1024 if peak else None,
+        "device_stats": fleet.get_stats(),
+    }
+
+
+def format_report(report):
+    """将负载测试报告格式化为多行文本"""
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.0f}ms"
+
+    def mb(value):
+        return "-" if value is None else f"{value:.1f}MB"
+
+    stats = report["device_stats"]
+    return "\n".join([
+        f"设备数: {report['devices']}，指令数: {report['instructions']}，成功: {report['succeeded']}",
+        f"耗时: {report['wall_seconds']:.1f}秒，吞吐: {report['instructions_per_second']:.2f}条/秒",
+        f"指令延迟: P50 {ms(report['latency_p50'])}，P90 {ms(report['latency_p90'])}，"
+        f"P99 {ms(report['latency_p99'])}，最大 {ms(report['latency_max'])}",
+        f"CPU: {report['cpu_seconds']:.1f}秒（{report['cpu_percent']:.0f}%），"
+        f"RSS: {mb(report['rss_mb'])}，峰值RSS: {mb(report['peak_rss_mb'])}",
+        f"设备命令: {stats.get('commands', 0)}条，注入失败: {stats.get('failures', 0)}次，"
+        f"断开: {stats.get('disconnects', 0)}次，无效点击: {stats.get('no_op_taps', 0)}次",
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="虚拟设备集群：hdc替身server和负载测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("serve", "启动挂载虚拟设备的hdc替身server"), ("load", "在所有虚拟设备上并发执行指令")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("--devices", type=int, default=10, help="虚拟设备数量")
+        sub.add_argument("--latency", type=float, default=0.02, help="设备命令的平均延迟（秒）")
+        sub.add_argument("--jitter", type=float, default=0.005, help="设备命令延迟的标准差（秒）")
+        sub.add_argument("--failure-rate", type=float, default=0.0, help="设备命令失败的概率")
+        sub.add_argument("--disconnect-rate", type=float, default=0.0, help="每条命令后设备断开的概率")
+        sub.add_argument("--seed", type=int, default=0, help="随机数种子")
+    subparsers.choices["serve"].add_argument("--port", type=int, default=8710, help="hdc替身server端口")
+    load_parser = subparsers.choices["load"]
+    load_parser.add_argument("--rounds", type=int, default=1, help="每台设备执行指令的轮数")
+    load_parser.add_argument("--instruction-file", type=str, help="每轮执行的指令文件，默认使用内置指令")
+    load_parser.add_argument("--tcp", action="store_true", help="经过本地hdc替身server通信，而不是进程内直接调用")
+    load_parser.add_argument("--llm-latency", type=float, default=0.3, help="模拟LLM接口的平均延迟（秒）")
+    load_parser.add_argument("--json", action="store_true", help="以JSON格式输出报告")
+    args = parser.parse_args()
+
+    fleet = FleetSimulator(args.devices, seed=args.seed, latency=args.latency, jitter=args.jitter,
+                           failure_rate=args.failure_rate, disconnect_rate=args.disconnect_rate)
+    if args.command == "serve":
+        port = fleet.start_server(port=args.port)
+        print(f"hdc替身server已启动: 127.0.0.1:{port}，设备: {', '.join(fleet.devices)}")
+        print(f"设置OHOS_HDC_SERVER_PORT={port}后使用--direct连接")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            fleet.stop()
+        return
+
+    workload = None
+    if args.instruction_file:
+        with open(args.instruction_file, "r", encoding="utf-8") as f:
+            workload = [line.strip() for line in f if line.strip()]
+    llm = MockLLMServer(latency=args.llm_latency, seed=args.seed)
+    llm_url = llm.start()
+    if args.tcp:
+        fleet.start_server()
+    try:
+        report = run_load(fleet, workload, args.rounds, llm_url, tcp=args.tcp)
+    finally:
+        fleet.stop()
+        llm.stop()
+    report["llm_requests"] = llm.requests
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(report))
+        print(f"LLM请求: {llm.requests}次")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import hashlib
+import io
+
+# Pillow在第一次计算画面指纹时才导入
+_image_module = None
+_image_module_loaded = False
+
+
+def _load_image_module():
+    """导入Pillow的Image模块，未安装时返回None（只能按内容哈希判断画面是否完全相同）"""
+    global _image_module, _image_module_loaded
+    if not _image_module_loaded:
+        try:
+            from PIL import Image
+            _image_module = Image
+        except ImportError:
+            _image_module = None
+        _image_module_loaded = True
+    return _image_module
+
+
+# 灰度缩略图的网格尺寸（宽, 高），与屏幕分辨率无关
+GRID_SIZE = (32, 64)
+
+
+class FrameSignature:
+    """画面指纹：内容哈希加灰度缩略图"""
+
+    def __init__(self, digest, pixels=None, size=GRID_SIZE):
+        """初始化画面指纹
+
+        Args:
+            digest (str): 原始图片数据的哈希
+            pixels (bytes, optional): 灰度缩略图像素，未安装Pillow时为None
+            size (tuple): 缩略图尺寸 (宽, 高)
+        """
+        self.digest = digest
+        self.pixels = pixels
+        self.size = size
+
+
+def compute_signature(data, grid_size=GRID_SIZE):
+    """计算图片数据的画面指纹
+
+    Args:
+        data (bytes): 图片数据
+        grid_size (tuple): 灰度缩略图尺寸 (宽, 高)
+
+    Returns:
+        FrameSignature: 画面指纹
+    """
+    digest = hashlib.sha1(data).hexdigest()
+    Image = _load_image_module()
+    if Image is None:
+        return FrameSignature(digest, size=grid_size)
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # draft让JPEG解码器直接按缩小比例解码，避免解码整张大图
+            image.draft("L", (grid_size[0] * 4, grid_size[1] * 4))
+            pixels = image.convert("L").resize(grid_size, Image.BILINEAR).tobytes()
+    except OSError:
+        return FrameSignature(digest, size=grid_size)
+    return FrameSignature(digest, pixels, grid_size)
+
+
+def frame_difference(a, b):
+    """计算两帧画面的差异程度
+
+    Args:
+        a (FrameSignature): 画面指纹
+        b (FrameSignature): 画面指纹
+
+    Returns:
+        float: 0到1之间的差异值，0表示相同
+    """
+    if a.digest == b.digest:
+        return 0.0
+    if a.pixels is None or b.pixels is None or a.size != b.size:
+        return 1.0
+    return sum(abs(x - y) for x, y in zip(a.pixels, b.pixels)) / (255.0 * len(a.pixels))
+
+
+def changed_ratio(a, b, pixel_threshold=16, region=None):
+    """计算发生变化的像素比例
+
+    Args:
+        a (FrameSignature): 画面指纹
+        b (FrameSignature): 画面指纹
+        pixel_threshold (int): 灰度差超过该值才算变化
+        region (tuple, optional): 只统计该区域 (x1, y1, x2, y2)，坐标为0到1之间的屏幕比例
+
+    Returns:
+        float: 0到1之间的变化比例
+    """
+    if a.digest == b.digest:
+        return 0.0
+    if a.pixels is None or b.pixels is None or a.size != b.size:
+        return 1.0
+    width, height = a.size
+    if region:
+        x1 = max(0, int(region[0] * width))
+        y1 = max(0, int(region[1] * height))
+        x2 = min(width, max(x1 + 1, int(round(region[2] * width))))
+        y2 = min(height, max(y1 + 1, int(round(region[3] * height))))
+    else:
+        x1, y1, x2, y2 = 0, 0, width, height
+    changed = total = 0
+    for row in range(y1, y2):
+        offset = row * width
+        for column in range(x1, x2):
+            total += 1
+            if abs(a.pixels[offset + column] - b.pixels[offset + column]) > pixel_threshold:
+                changed += 1
+    return changed / total if total else 0.0
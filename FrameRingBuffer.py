@@ -0,0 +1,182 @@
+import collections
+import threading
+import time
+
+
+class Frame:
+    """缓冲区中的一帧画面"""
+
+    def __init__(self, sequence, data, timestamp, monotonic):
+        """初始化画面帧
+
+        Args:
+            sequence (int): 帧序号，单调递增
+            data (bytes): 图片数据
+            timestamp (float): 开始截取时的系统时间
+            monotonic (float): 开始截取时的单调时间，用于与操作时间比较
+                （截取耗时几百毫秒，截取过程中发生的操作可能没有体现在画面中，因此以开始时间为准）
+        """
+        self.sequence = sequence
+        self.data = data
+        self.timestamp = timestamp
+        self.monotonic = monotonic
+
+
+class FrameRingBuffer:
+    """有界的内存画面环形缓冲区，同时按帧数和字节数限制内存占用"""
+
+    def __init__(self, max_frames=30, max_bytes=64 * 1024 * 1024):
+        """初始化环形缓冲区
+
+        Args:
+            max_frames (int): 最多保留的帧数
+            max_bytes (int): 最多占用的字节数
+        """
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._frames = collections.deque()
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._frames)
+
+    def append(self, data, captured_at=None):
+        """追加一帧画面，超出限制时丢弃最旧的帧
+
+        Args:
+            data (bytes): 图片数据
+            captured_at (float, optional): 开始截取时的单调时间，默认为当前时间
+
+        Returns:
+            Frame: 新追加的帧
+        """
+        now = time.monotonic()
+        if captured_at is None:
+            captured_at = now
+        with self._condition:
+            self._sequence += 1
+            frame = Frame(self._sequence, data, time.time() - (now - captured_at), captured_at)
+            self._frames.append(frame)
+            self.total_bytes += len(data)
+            # 至少保留最新的一帧
+            while len(self._frames) > 1 and (len(self._frames) > self.max_frames or self.total_bytes > self.max_bytes):
+                self.total_bytes -= len(self._frames.popleft().data)
+            self._condition.notify_all()
+            return frame
+
+    def latest(self, newer_than=None):
+        """获取最新的一帧
+
+        Args:
+            newer_than (float, optional): 只返回在该单调时间之后才开始截取的帧
+
+        Returns:
+            Frame: 最新的帧，没有符合条件的帧时返回None
+        """
+        with self._condition:
+            if not self._frames:
+                return None
+            frame = self._frames[-1]
+            if newer_than is not None and frame.monotonic <= newer_than:
+                return None
+            return frame
+
+    def recent(self, count=None):
+        """获取最近的若干帧（按时间从旧到新）
+
+        Args:
+            count (int, optional): 帧数，为None时返回全部
+
+        Returns:
+            list: 帧列表
+        """
+        with self._condition:
+            frames = list(self._frames)
+        return frames if count is None else frames[-count:]
+
+    def wait_for_frame(self, after_sequence=0, newer_than=None, timeout=None):
+        """等待序号大于after_sequence（且晚于newer_than）的新帧
+
+        Args:
+            after_sequence (int): 已经处理过的最大帧序号
+            newer_than (float, optional): 只接受在该单调时间之后才开始截取的帧
+            timeout (float, optional): 最长等待时间（秒）
+
+        Returns:
+            Frame: 新帧，超时返回None
+        """
+        def ready():
+            if not self._frames:
+                return False
+            frame = self._frames[-1]
+            return frame.sequence > after_sequence and (newer_than is None or frame.monotonic > newer_than)
+
+        with self._condition:
+            if not self._condition.wait_for(ready, timeout):
+                return None
+            return self._frames[-1]
+
+
+class ContinuousCapture:
+    """后台连续截屏，把画面写入环形缓冲区"""
+
+    def __init__(self, device_manager, frame_buffer=None, interval=0.0, width=None, height=None):
+        """初始化连续截屏
+
+        Args:
+            device_manager (HarmonyDeviceManager): 设备管理器实例
+            frame_buffer (FrameRingBuffer, optional): 环形缓冲区，默认新建
+            interval (float): 两次截取之间的额外间隔（秒），0表示尽可能快
+            width (int, optional): 画面宽度（仅hdc支持缩放）
+            height (int, optional): 画面高度（仅hdc支持缩放）
+        """
+        self.device_manager = device_manager
+        self.frame_buffer = frame_buffer or FrameRingBuffer()
+        self.interval = interval
+        self.width = width
+        self.height = height
+        self.stats = {"frames": 0, "failures": 0, "capture_seconds": 0.0}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        """后台截屏线程是否在运行"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动后台截屏线程"""
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="continuous-capture", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """停止后台截屏线程
+
+        Args:
+            timeout (float): 等待线程退出的最长时间（秒）
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            start = time.monotonic()
+            data = self.device_manager.capture_frame(self.width, self.height, channel="capture")
+            self.stats["capture_seconds"] += time.monotonic() - start
+            if data:
+                self.frame_buffer.append(data, captured_at=start)
+                self.stats["frames"] += 1
+            else:
+                self.stats["failures"] += 1
+                # 连续失败（如设备断开）时放慢节奏
+                self._stop_event.wait(1.0)
+            if self.interval:
+                self._stop_event.wait(self.interval)
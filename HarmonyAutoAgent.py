@@ -1,23 +1,216 @@
+import contextlib
 import os
+import sqlite3
 import time
-from HarmonyDeviceManager import HarmonyDeviceManager
-from InstructionParser import InstructionParser
-from OpenAICompatibleClient import OpenAICompatibleClient
+import weakref
+from HarmonyDeviceManager import SCREENSHOT_SECONDS, HarmonyDeviceManager
+from ActionVerifier import NO_OP, VERIFY_ACTIONS, ActionVerifier
+from FrameRingBuffer import ContinuousCapture, FrameRingBuffer
+from IconLocator import IconLocator
+from LayoutCache import LayoutCache
+from Metrics import get_registry, record_cache, record_failure
+from ScreenPrefetcher import ScreenPrefetcher
+from ScreenSettleDetector import ScreenSettleDetector
+from TextEntryEngine import TextEntryEngine
+
+# 会引起界面变化、执行后需要等待界面稳定的操作类型
+SETTLE_ACTIONS = {"click", "tap", "swipe", "type", "press_home", "press_back", "press_menu", "launch_app"}
+
+INSTRUCTIONS = get_registry().counter("agent_instructions_total", "执行的指令数，按执行方式和结果")
+INSTRUCTION_SECONDS = get_registry().histogram(
+    "agent_instruction_seconds", "单条指令的执行耗时（秒）",
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0),
+)
 
 class HarmonyAutoAgent:
     """鸿蒙自动操作代理，实现从自然语言指令到手机操作的自动化"""
     
-    def __init__(self, device_command="hdc", screenshot_path="screenshot.jpeg"):
+    def __init__(self, device_command="hdc", screenshot_path="screenshot.jpeg", transport=None, device_id=None,
+                 screenshot_store=None):
         """初始化自动操作代理
         
         Args:
             device_command (str): 设备管理命令路径，支持hdc, hdc_std, adb
             screenshot_path (str): 截图保存路径
+            transport (object, optional): 命令传输，指定后直接与hdc/adb server通信
+            device_id (str, optional): 目标设备ID，多台设备连接时用于指定设备
+            screenshot_store (ScreenshotStore, optional): 截图归档存储，默认归档到当前目录下的pictures
         """
-        self.device_manager = HarmonyDeviceManager(device_command)
-        self.client = OpenAICompatibleClient()
-        self.parser = InstructionParser(self.client)
+        self.device_manager = HarmonyDeviceManager(
+            device_command, screenshot_store=screenshot_store, transport=transport, device_id=device_id
+        )
+        # LLM客户端、路由和解析器在第一次使用时才创建，纯设备操作不会加载LLM相关依赖
+        self._client = None
+        self._router = None
+        self._parser = None
         self.screenshot_path = screenshot_path
+        self.settle_detector = ScreenSettleDetector(self.device_manager)
+        # 操作前后的画面与界面稳定检测使用同一画面来源，便于直接比较
+        self.action_verifier = ActionVerifier(self.device_manager, capture=self.settle_detector.capture)
+        self.last_verification = None
+        self._last_tap_point = None
+        self.text_entry = TextEntryEngine(self.device_manager)
+        # 多模态模型的界面分析结果按相对坐标缓存，不同分辨率的设备可以共用
+        self.layout_cache = LayoutCache()
+        # 图标库中的图标直接在截图中本地定位，无需控件树或模型
+        self.icon_locator = IconLocator()
+        # 为True时指令由闭环执行器逐步观察执行，而不是一次规划后直接执行
+        self.closed_loop = False
+        self._loop_executor = None
+        self.continuous_capture = None
+        # 交互模式等待输入时的界面预取，指令到达时画面未变化则直接使用预取结果
+        self.prefetcher = None
+        # 最近一次操作完成的单调时间，缓冲区中早于该时间的画面视为过期
+        self._last_action_time = 0.0
+        self._settle_sequence = 0
+        # 每个代理单独注册采集函数，按设备区分；注册表只持有弱引用，代理被回收后自动移除
+        get_registry().register_collector(f"agent-{id(self)}", weakref.WeakMethod(self._collect_metrics))
+    
+    @property
+    def client(self):
+        """LLM客户端，首次访问时创建"""
+        if self._client is None:
+            from OpenAICompatibleClient import OpenAICompatibleClient
+            self._client = OpenAICompatibleClient()
+        return self._client
+    
+    @property
+    def router(self):
+        """模型分级路由，首次访问时创建"""
+        if self._router is None:
+            from ModelRouter import ModelRouter
+            self._router = ModelRouter(self.client)
+        return self._router
+    
+    @property
+    def loop_executor(self):
+        """观察-执行闭环执行器，首次访问时创建"""
+        if self._loop_executor is None:
+            from ClosedLoopExecutor import ClosedLoopExecutor
+            self._loop_executor = ClosedLoopExecutor(self)
+        return self._loop_executor
+    
+    @property
+    def parser(self):
+        """指令解析器，首次访问时创建"""
+        if self._parser is None:
+            from InstructionParser import InstructionParser
+            self._parser = InstructionParser(self.client, router=self.router)
+        return self._parser
+    
+    def _collect_metrics(self):
+        """导出各组件自身的统计，供指标注册表采集（尚未创建的LLM组件不会被创建）
+        
+        Returns:
+            list: 每项为(指标名, 类型, 说明, 标签, 值)，标签中包含设备ID
+        """
+        device = self.device_manager.device_id or "default"
+        items = []
+        for status, count in self.action_verifier.counts.items():
+            items.append(("agent_action_verifications_total", "counter", "操作验证结果",
+                          {"device": device, "status": status}, count))
+        for strategy, speed in self.text_entry.get_stats()["chars_per_second"].items():
+            items.append(("agent_text_entry_chars_per_second", "gauge", "各输入方式的实测速度",
+                          {"device": device, "strategy": strategy}, speed))
+        if self._router is not None:
+            for key, count in self._router.get_stats()["tiers"].items():
+                task, tier = key.split("/", 1)
+                items.append(("agent_model_router_calls_total", "counter", "模型路由各层调用次数",
+                              {"device": device, "task": task, "tier": tier}, count))
+        if self._parser is not None:
+            for result, count in self._parser.structured.stats.items():
+                items.append(("agent_structured_output_total", "counter", "模型输出的解析方式和字段重新询问次数",
+                              {"device": device, "result": result}, count))
+        return items
+    
+    def start_continuous_capture(self, max_frames=30, max_bytes=64 * 1024 * 1024):
+        """启动后台连续截屏，之后获取截图和界面稳定检测都直接读取内存中的画面
+        
+        Args:
+            max_frames (int): 环形缓冲区最多保留的帧数
+            max_bytes (int): 环形缓冲区最多占用的字节数
+        """
+        if self.continuous_capture and self.continuous_capture.running:
+            return
+        frame_buffer = FrameRingBuffer(max_frames, max_bytes)
+        self.continuous_capture = ContinuousCapture(self.device_manager, frame_buffer)
+        self.continuous_capture.start()
+        self.settle_detector.frame_source = self._next_buffered_frame
+        print("已启动后台连续截屏")
+    
+    def stop_continuous_capture(self):
+        """停止后台连续截屏"""
+        if self.continuous_capture:
+            self.continuous_capture.stop()
+            self.continuous_capture = None
+        self.settle_detector.frame_source = None
+    
+    def start_prefetch(self, poll_interval=0.5):
+        """启动空闲时的界面预取：在prefetcher.idle()期间后台截图并预先分析UI元素
+        
+        Args:
+            poll_interval (float): 空闲期间检查画面变化的间隔（秒）
+        """
+        if self.prefetcher and self.prefetcher.running:
+            return
+        root, ext = os.path.splitext(self.screenshot_path)
+        self.prefetcher = ScreenPrefetcher(
+            self.device_manager,
+            self._prefetch_elements,
+            f"{root}.prefetch{ext or '.jpeg'}",
+            frame_size=self.settle_detector.frame_size,
+            noise_threshold=self.action_verifier.noise_threshold,
+            poll_interval=poll_interval,
+        )
+        self.prefetcher.start()
+    
+    def stop_prefetch(self):
+        """停止空闲时的界面预取"""
+        if self.prefetcher:
+            self.prefetcher.stop()
+            self.prefetcher = None
+    
+    def _prefetch_elements(self, screenshot_path):
+        """供界面预取使用：在后台线程中分析指定截图的UI元素，不输出日志，分析失败的结果不保留"""
+        elements = self._analyze_elements(screenshot_path, quiet=True)
+        if not elements or (isinstance(elements, dict) and "error" in elements):
+            return None
+        return elements
+    
+    def _next_buffered_frame(self):
+        """供界面稳定检测使用：等待缓冲区中的下一帧
+        
+        Returns:
+            bytes: 图片数据，超时返回None
+        """
+        frame = self.continuous_capture.frame_buffer.wait_for_frame(
+            self._settle_sequence, newer_than=self._last_action_time, timeout=2.0
+        )
+        if frame is None:
+            return None
+        self._settle_sequence = frame.sequence
+        return frame.data
+    
+    def _capture_screenshot(self):
+        """获取当前截图并保存到screenshot_path，后台截屏运行时直接使用内存中的最新画面
+        
+        Returns:
+            bool: 截图是否成功
+        """
+        if self.continuous_capture and self.continuous_capture.running:
+            started = time.monotonic()
+            frame = self.continuous_capture.frame_buffer.wait_for_frame(
+                newer_than=self._last_action_time, timeout=2.0
+            )
+            record_cache("frame_buffer", frame is not None)
+            if frame is not None:
+                SCREENSHOT_SECONDS.observe(time.monotonic() - started, source="buffer")
+                with open(self.screenshot_path, "wb") as f:
+                    f.write(frame.data)
+                self.device_manager.archive_screenshot(self.screenshot_path)
+                return True
+            print("后台截屏暂无可用画面，改为直接截图")
+        return self.device_manager.get_screenshot(self.screenshot_path)
     
     def check_command_available(self):
         """检查设备管理命令是否可用
@@ -41,58 +234,201 @@ class HarmonyAutoAgent:
         Returns:
             tuple: (截图路径, UI元素分析结果)
         """
+        if self.prefetcher is not None:
+            elements = self.prefetcher.take(self.screenshot_path)
+            if elements is not None:
+                print("界面与预取时相同，直接使用预先分析的UI元素")
+                return self.screenshot_path, elements
+        
         # 获取截图
-        if not self.device_manager.get_screenshot(self.screenshot_path):
+        if not self._capture_screenshot():
             return None, None
+        return self.screenshot_path, self._analyze_elements()
+    
+    def _analyze_elements(self, screenshot_path=None, quiet=False):
+        """分析截图中的UI元素：优先使用控件树，不可用时先查界面分析缓存，最后才调用多模态模型
+        
+        Args:
+            screenshot_path (str, optional): 截图路径，默认为当前截图
+            quiet (bool): 是否不输出日志（用于后台预取）
         
-        # 分析UI元素
-        elements = self.client.extract_elements_from_image(self.screenshot_path)
-        return self.screenshot_path, elements
+        Returns:
+            list|dict: UI元素分析结果
+        """
+        screenshot_path = screenshot_path or self.screenshot_path
+        layout_elements = self.device_manager.dump_layout(quiet=quiet)
+        if layout_elements:
+            return self.router.extract_elements(screenshot_path, layout_elements)
+        return self._extract_elements_with_cache(screenshot_path, quiet)
     
-    def execute_instruction(self, instruction):
+    def _extract_elements_with_cache(self, screenshot_path, quiet=False):
+        """查找界面分析缓存，未命中时调用多模态模型并保存结果
+        
+        Args:
+            screenshot_path (str): 截图路径
+            quiet (bool): 是否不输出日志
+        
+        Returns:
+            list|dict: UI元素分析结果（当前设备的像素坐标）
+        """
+        screen_size = self.device_manager.get_screen_size()
+        try:
+            with open(screenshot_path, "rb") as f:
+                image_data = f.read()
+        except OSError:
+            image_data = None
+        log = (lambda message: None) if quiet else print
+        if not screen_size or not image_data:
+            return self.router.extract_elements(screenshot_path, quiet=quiet)
+        
+        # 走到这里通常是控件树导出失败，foreground_app可能已过期，以实时查询的前台页面为准
+        page_key = self.device_manager.get_foreground_activity()
+        app = page_key.split("/", 1)[0] if page_key else self.device_manager.foreground_app
+        try:
+            cached = self.layout_cache.lookup(app, image_data, screen_size, page_key=page_key)
+        except sqlite3.Error as e:
+            log(f"读取界面分析缓存失败: {str(e)}")
+            cached = None
+        if cached is not None:
+            log("界面分析缓存命中，跳过多模态模型分析")
+            return cached
+        
+        elements = self.router.extract_elements(screenshot_path, quiet=quiet)
+        try:
+            self.layout_cache.store(app, image_data, screen_size, elements, page_key=page_key)
+        except sqlite3.Error as e:
+            log(f"保存界面分析缓存失败: {str(e)}")
+        return elements
+    
+    def _record_instruction(self, mode, started, success):
+        """记录一条指令的执行耗时和结果"""
+        INSTRUCTION_SECONDS.observe(time.monotonic() - started, mode=mode)
+        INSTRUCTIONS.inc(mode=mode, outcome="success" if success else "failure")
+        return success
+    
+    def execute_instruction(self, instruction, check_device=True):
         """执行自然语言指令
         
         Args:
             instruction (str): 自然语言指令
+            check_device (bool): 是否先检查设备连接（调用方已检查过时可跳过）
             
         Returns:
             bool: 操作是否成功
         """
+        started = time.monotonic()
+        success = self._execute_instruction(instruction, check_device)
+        return self._record_instruction("loop" if self.closed_loop else "single", started, success)
+    
+    def _execute_instruction(self, instruction, check_device):
+        """执行自然语言指令（不含指标记录）"""
         print(f"\n===== 执行指令: {instruction} =====")
         
         # 检查设备连接
-        if not self.check_device_connected():
+        if check_device and not self.check_device_connected():
             print("错误: 设备未连接")
+            record_failure("device_disconnected")
             return False
         
+        if self.closed_loop:
+            return self.loop_executor.run(instruction)
+        
         # 获取屏幕截图和UI元素
         screenshot_path, ui_elements = self.get_screenshot_and_elements()
         if not screenshot_path or not ui_elements:
             print("错误: 无法获取屏幕截图或分析UI元素")
+            record_failure("observe_failed")
             return False
         
         print("\n屏幕UI元素分析结果:")
         print(ui_elements)
         
         # 解析指令
-        parsed_instruction = self.parser.parse_instruction(instruction, ui_elements)
+        parsed_instruction = self.parser.parse_instruction(instruction, ui_elements, screenshot_path)
         print(f"\n解析后的指令: {parsed_instruction}")
+        return self._execute_plan(parsed_instruction)
+    
+    def _execute_plan(self, parsed_instruction):
+        """执行解析得到的操作步骤
         
-        # 执行操作
+        Args:
+            parsed_instruction (list|dict): 操作步骤列表或单个操作
+            
+        Returns:
+            bool: 操作是否成功
+        """
         if isinstance(parsed_instruction, list):
             # 如果返回的是操作步骤列表
             for step in parsed_instruction:
-                if not self._execute_single_action(step):
+                if not self._execute_action_and_settle(step):
                     return False
         elif isinstance(parsed_instruction, dict):
             # 如果返回的是单个操作
-            return self._execute_single_action(parsed_instruction)
+            return self._execute_action_and_settle(parsed_instruction)
         else:
             print(f"错误: 解析结果格式不正确: {parsed_instruction}")
+            record_failure("parse_failed")
             return False
         
         return True
     
+    def _execute_action_and_settle(self, action):
+        """执行单个操作，并在会引起界面变化时等待界面稳定
+        
+        Args:
+            action (dict): 操作信息
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        if not isinstance(action, dict) or "action" not in action:
+            print(f"错误: 操作格式不正确: {action}")
+            record_failure("action_failed")
+            return False
+        action_type = action["action"]
+        verify = action_type in VERIFY_ACTIONS
+        for attempt in range(2):
+            before = self.action_verifier.capture_signature() if verify else None
+            self._last_tap_point = None
+            success = self._execute_single_action(action)
+            self._last_action_time = time.monotonic()
+            if not success:
+                record_failure("action_failed")
+                return False
+            settle = None
+            if action_type in SETTLE_ACTIONS:
+                settle = self.settle_detector.wait_for_settle()
+            if before is None:
+                return True
+            
+            # 比较操作前后的画面，确认操作是否生效
+            self.last_verification = self.action_verifier.verify(
+                before,
+                settle.get("signature") if settle else None,
+                tap_point=self._last_tap_point,
+                expected_text=action.get("expect"),
+            )
+            status = self.last_verification["status"]
+            print(f"操作验证: {status}")
+            if status != NO_OP or action_type not in ("click", "tap"):
+                return True
+            # 应用可能只是响应慢：等满响应时间后再确认一次，仍然没有变化才重试
+            self.last_verification = self.action_verifier.recheck(
+                self.last_verification, before, self._last_action_time,
+                tap_point=self._last_tap_point, expected_text=action.get("expect"),
+            )
+            if self.last_verification["status"] != NO_OP:
+                print(f"复核操作验证: {self.last_verification['status']}")
+                return True
+            if attempt == 0:
+                # 点击后画面完全没有变化，按已解析的坐标重试一次
+                print("点击后画面没有变化，重试一次")
+                if self._last_tap_point:
+                    action = {"action": "tap", "params": {"coordinates": list(self._last_tap_point)}}
+        print("错误: 重试后点击仍然没有效果")
+        record_failure("no_op")
+        return False
+    
     def _execute_single_action(self, action):
         """执行单个操作
         
@@ -127,11 +463,17 @@ class HarmonyAutoAgent:
             else:
                 # 尝试从UI元素中找到目标
                 instruction = action.get("target", {}).get("description", "")
-                screenshot_path, ui_elements = self.get_screenshot_and_elements()
-                if not ui_elements:
-                    print("错误: 无法获取UI元素")
+                if not self._capture_screenshot():
+                    print("错误: 无法获取截图")
                     return False
-                target_element = self.parser.find_target_element(instruction, ui_elements)
+                # 图标库中的图标先在截图中本地定位，找不到时再分析UI元素
+                target_element = self.icon_locator.resolve(instruction, self.screenshot_path)
+                if target_element is None:
+                    ui_elements = self._analyze_elements()
+                    if not ui_elements:
+                        print("错误: 无法获取UI元素")
+                        return False
+                    target_element = self.parser.find_target_element(instruction, ui_elements, self.screenshot_path)
                 if not target_element:
                     print(f"错误: 无法找到目标元素: {instruction}")
                     return False
@@ -142,6 +484,7 @@ class HarmonyAutoAgent:
                 center_x, center_y = center
             
             # 执行点击
+            self._last_tap_point = (center_x, center_y)
             return self.device_manager.tap(center_x, center_y)
             
         elif action_type == "swipe":
@@ -176,8 +519,8 @@ class HarmonyAutoAgent:
                 print("错误: 输入文本为空")
                 return False
             
-            # 执行输入
-            return self.device_manager.send_text(text)
+            # 执行输入，由输入引擎选择输入方式并分块发送
+            return self.text_entry.enter_text(text)["success"]
             
         elif action_type == "press_home":
             # 按下Home键
@@ -191,6 +534,14 @@ class HarmonyAutoAgent:
             # 按下菜单键
             return self.device_manager.press_menu()
             
+        elif action_type == "launch_app":
+            # 按包名启动应用
+            package = params.get("package")
+            if not package:
+                print("错误: 启动应用缺少包名")
+                return False
+            return self.device_manager.launch_app(package, params.get("ability"))
+            
         elif action_type == "screenshot":
             # 截图操作
             return self.device_manager.get_screenshot(self.screenshot_path)
@@ -208,30 +559,59 @@ class HarmonyAutoAgent:
         Returns:
             bool: 所有操作是否都成功
         """
+        if self.closed_loop:
+            plans = ((instruction, None) for instruction in instructions)
+        else:
+            # 连续的、不依赖屏幕内容的指令合并规划，并在执行前面的指令时提前规划后续批次
+            from BatchPlanner import BatchPlanner
+            plans = BatchPlanner(self.parser).iter_plans(instructions)
+        
         all_success = True
-        for instruction in instructions:
-            if not self.execute_instruction(instruction):
+        for instruction, plan in plans:
+            if plan is None:
+                success = self.execute_instruction(instruction)
+            else:
+                print(f"\n===== 执行指令: {instruction}（批量规划） =====")
+                print(f"操作步骤: {plan}")
+                started = time.monotonic()
+                success = self._record_instruction("batch", started, self._execute_plan(plan))
+                if not success and any(isinstance(step, dict) and step.get("action") == "launch_app" for step in plan):
+                    # 批量规划时模型看不到屏幕，包名和Ability只能猜测，启动失败时按常规流程重新执行
+                    print("批量规划的启动应用失败，改为按常规流程执行")
+                    success = self.execute_instruction(instruction)
+            if not success:
                 all_success = False
         return all_success
     
-    def interactive_mode(self):
-        """进入交互模式，接收用户输入的指令"""
+    def interactive_mode(self, prefetch=True):
+        """进入交互模式，接收用户输入的指令
+        
+        Args:
+            prefetch (bool): 是否在等待输入时预先截图和分析UI元素
+        """
         print("===== 鸿蒙自动操作代理 - 交互模式 =====")
         print("输入'退出'或'quit'退出交互模式")
         
-        while True:
-            instruction = input("\n请输入指令: ").strip()
-            if not instruction:
-                continue
-            
-            if instruction.lower() in ["退出", "quit"]:
-                print("退出交互模式")
-                break
-            
-            try:
-                self.execute_instruction(instruction)
-            except Exception as e:
-                print(f"执行指令时发生错误: {str(e)}")
+        if prefetch:
+            self.start_prefetch()
+        try:
+            while True:
+                with self.prefetcher.idle() if self.prefetcher else contextlib.nullcontext():
+                    instruction = input("\n请输入指令: ").strip()
+                if not instruction:
+                    continue
+                
+                if instruction.lower() in ["退出", "quit"]:
+                    print("退出交互模式")
+                    break
+                
+                try:
+                    self.execute_instruction(instruction)
+                except Exception as e:
+                    print(f"执行指令时发生错误: {str(e)}")
+        finally:
+            if prefetch:
+                self.stop_prefetch()
     
     def test_device_connection(self):
         """测试设备连接和基本功能
@@ -255,8 +635,8 @@ class HarmonyAutoAgent:
             if results["screenshot_taken"]:
                 try:
                     elements = self.client.extract_elements_from_image(self.screenshot_path)
-                    results["ui_elements_analyzed"] = True
-                    results["ui_element_count"] = len(elements) if isinstance(elements, list) else 0
+                    results["ui_elements_analyzed"] = "error" not in elements
+                    results["ui_element_count"] = len(elements.get("elements", []))
                 except Exception:
                     results["ui_elements_analyzed"] = False
             else:
@@ -1,20 +1,272 @@
 import os
+import re
+import shlex
+import sqlite3
 import subprocess
+import tempfile
 import time
 import json
+import xml.etree.ElementTree as ET
+from Metrics import get_registry, record_failure
+from ScreenshotStore import ScreenshotStore
 
-class HarmonyDeviceManager:
-    """鸿蒙设备管理器，用于执行设备管理命令与设备交互"""
+# 控件边界格式：[x1,y1][x2,y2]
+BOUNDS_PATTERN = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+# dumpsys activity activities中前台Activity所在的行，如mResumedActivity: ActivityRecord{1a2b u0 com.pkg/.Main t12}
+RESUMED_ACTIVITY_PATTERN = re.compile(r"(?:mResumedActivity|topResumedActivity)[:=]\s*ActivityRecord\{\S+ \S+ ([^\s}]+)")
+
+# 设备端工具到命令种类的映射，用于按种类统计命令耗时
+SHELL_COMMAND_KINDS = {
+    "uinput": "tap",
+    "snapshot_display": "screenshot",
+    "screencap": "screenshot",
+    "uiautomator": "layout",
+    "aa": "launch",
+    "monkey": "launch",
+    "wm": "screen_size",
+    "rm": "cleanup",
+    "am": "broadcast",
+    "settings": "settings",
+    "dumpsys": "foreground",
+}
+LOCAL_COMMAND_KINDS = {"list": "list", "devices": "list", "file": "file_recv", "pull": "file_recv", "help": "help"}
+
+COMMAND_SECONDS = get_registry().histogram("device_command_seconds", "设备命令耗时（秒），按命令种类")
+SCREENSHOT_SECONDS = get_registry().histogram("device_screenshot_seconds", "截图耗时（秒），含文件传输")
+
+
+def _parse_bounds(bounds):
+    """解析控件边界字符串
+
+    Args:
+        bounds (str): 形如"[x1,y1][x2,y2]"的边界字符串
+
+    Returns:
+        list: [x1, y1, x2, y2]，无法解析时返回None
+    """
+    match = BOUNDS_PATTERN.search(bounds or "")
+    if not match:
+        return None
+    return [int(value) for value in match.groups()]
+
+
+def _make_layout_element(element_type, text, description, bounds, clickable):
+    """将控件树节点转换为与视觉分析结果一致的UI元素格式，无意义的节点返回None"""
+    position = _parse_bounds(bounds)
+    if not position or position[2] <= position[0] or position[3] <= position[1]:
+        return None
+    if not (text or description or clickable):
+        return None
+    return {
+        "type": element_type,
+        "text": text,
+        "description": text or description,
+        "position": position,
+        "clickable": clickable,
+    }
+
+
+def parse_hdc_layout(layout):
+    """解析鸿蒙uitest dumpLayout输出的控件树
+
+    Args:
+        layout (dict): dumpLayout生成的JSON对象
+
+    Returns:
+        list: UI元素列表
+    """
+    elements = []
+    stack = [layout]
+    while stack:
+        node = stack.pop()
+        attributes = node.get("attributes", {})
+        element = _make_layout_element(
+            attributes.get("type", ""),
+            attributes.get("text", ""),
+            attributes.get("description", "") or attributes.get("id", ""),
+            attributes.get("bounds", ""),
+            attributes.get("clickable") == "true",
+        )
+        if element:
+            elements.append(element)
+        stack.extend(reversed(node.get("children", [])))
+    return elements
+
+
+def parse_adb_layout(xml_text):
+    """解析uiautomator dump输出的控件树
+
+    Args:
+        xml_text (str): uiautomator生成的XML文本
+
+    Returns:
+        list: UI元素列表
+    """
+    elements = []
+    for node in ET.fromstring(xml_text).iter("node"):
+        element = _make_layout_element(
+            node.get("class", "").split(".")[-1],
+            node.get("text", ""),
+            node.get("content-desc", "") or node.get("resource-id", ""),
+            node.get("bounds", ""),
+            node.get("clickable") == "true",
+        )
+        if element:
+            elements.append(element)
+    return elements
+
+
+def parse_device_list(stdout):
+    """解析hdc list targets / adb devices的输出
     
-    def __init__(self, device_command="hdc"):
-        """初始化设备管理器
+    Args:
+        stdout (str): 命令输出
         
-        Args:
-            device_command (str): 设备管理命令路径，默认使用环境变量中的hdc
-                                  支持的命令包括：hdc, hdc_std, adb（部分命令兼容）
-        """
-        self.device_command = device_command
-        self.command_type = self._detect_command_type()
+    Returns:
+        list: 已连接的设备ID列表
+    """
+    devices = []
+    stdout = stdout.strip()
+    if not stdout or stdout.lower().startswith("unknown operation"):
+        return devices
+    for line in stdout.split("\n"):
+        line = line.strip()
+        if not line or line.lower().startswith("unknown operation"):
+            continue
+        # 排除明显的标题行
+        if (line.lower().startswith("list of devices attached") or
+                line.lower() == "target list" or
+                line.lower() == "devices"):
+            continue
+        # adb devices的输出格式为"设备ID\t状态"，只接受状态为device的设备
+        parts = line.split()
+        if len(parts) > 1 and parts[1] != "device":
+            continue
+        # 检查是否是设备ID（长度大于等于10的字母数字组合）
+        if len(parts[0]) >= 10 and parts[0].isalnum():
+            devices.append(parts[0])
+    return devices
+
+
+def parse_screen_size(stdout):
+    """解析wm size的输出
+    
+    Args:
+        stdout (str): 命令输出
+        
+    Returns:
+        tuple: (宽度, 高度)，无法解析时返回None
+    """
+    # 解析输出，格式类似：Physical size: 1080x2340
+    try:
+        # 检查是否包含错误信息
+        if "inaccessible" in stdout.lower() or "not found" in stdout.lower():
+            print(f"解析屏幕尺寸失败: {stdout.strip()}")
+            return None
+            
+        # 尝试多种可能的格式解析
+        size_str = stdout.strip()
+        
+        # 格式1: Physical size: 1080x2340
+        if ":" in size_str:
+            size_str = size_str.split(":")[-1].strip()
+        
+        # 格式2: 1080x2340
+        if "x" in size_str:
+            width, height = map(int, size_str.split("x"))
+            return width, height
+        
+        # 格式3: 1080 2340 (空格分隔)
+        elif " " in size_str and all(part.isdigit() for part in size_str.split()):
+            width, height = map(int, size_str.split())
+            return width, height
+        else:
+            print(f"解析屏幕尺寸失败: 输出格式无法识别: {stdout}")
+            return None
+            
+    except Exception as e:
+        print(f"解析屏幕尺寸失败: {str(e)}")
+        return None
+
+
+def parse_layout_text(command_type, text):
+    """解析导出的控件树文件内容
+    
+    Args:
+        command_type (str): "hdc"或"adb"
+        text (str): 控件树文件内容
+        
+    Returns:
+        tuple: (UI元素列表, 前台应用包名)
+        
+    Raises:
+        ValueError: JSON格式错误
+        ET.ParseError: XML格式错误
+    """
+    if command_type == "hdc":
+        layout = json.loads(text)
+        return parse_hdc_layout(layout), layout.get("attributes", {}).get("bundleName") or None
+    package = re.search(r'package="([^"]+)"', text)
+    return parse_adb_layout(text), package.group(1) if package else None
+
+
+def parse_foreground_activity(command_type, stdout):
+    """解析前台页面：鸿蒙为aa dump -l的输出，安卓为dumpsys activity activities的输出
+    
+    Args:
+        command_type (str): "hdc"或"adb"
+        stdout (str): 命令输出
+        
+    Returns:
+        str: "包名/Ability或Activity名"，无法解析时返回None
+    """
+    if command_type != "hdc":
+        match = RESUMED_ACTIVITY_PATTERN.search(stdout)
+        if not match:
+            return None
+        package, _, activity = match.group(1).partition("/")
+        return f"{package}/{package + activity if activity.startswith('.') else activity}"
+    bundle = ability = None
+    for line in stdout.splitlines():
+        line = line.strip()
+        if line.startswith("bundle name ["):
+            bundle = line[len("bundle name ["):].rstrip("]")
+        elif line.startswith("main name ["):
+            ability = line[len("main name ["):].rstrip("]")
+        elif line.startswith("state #FOREGROUND") and bundle:
+            return f"{bundle}/{ability or ''}"
+    return None
+
+
+def command_kind(args):
+    """判断命令的种类，种类的取值是有限的几种，可以直接作为指标标签
+    
+    Args:
+        args (list): 命令参数列表（不含设备管理命令本身）
+        
+    Returns:
+        str: 命令种类，如tap、swipe、screenshot、layout、file_recv
+    """
+    if not args:
+        return "other"
+    if args[0] != "shell":
+        return LOCAL_COMMAND_KINDS.get(args[0], "other")
+    tool = args[1] if len(args) > 1 else ""
+    if tool == "input" and len(args) > 2:
+        return {"keyevent": "key", "tap": "tap", "swipe": "swipe", "text": "text"}.get(args[2], "input")
+    if tool == "uitest":
+        return "layout" if "dumpLayout" in args else "text" if "uiInput" in args else "uitest"
+    if tool == "aa" and "dump" in args:
+        return "foreground"
+    return SHELL_COMMAND_KINDS.get(tool, "shell")
+
+
+class DeviceCommandMixin:
+    """同步与异步设备管理器共用的命令构造逻辑
+    
+    所有命令都构造成参数列表（不含设备管理命令本身），直接作为进程参数执行，
+    不经过本机shell；需要在设备端shell中保持原样的参数（如输入的文本）会被转义。
+    """
     
     def _detect_command_type(self):
         """检测命令类型（hdc系列或adb系列）
@@ -29,35 +281,198 @@ class HarmonyDeviceManager:
         else:
             return "hdc"  # 默认假设为hdc系列
     
-    def execute_command(self, command, timeout=30):
+    def _normalize_args(self, command):
+        """将命令统一为参数列表"""
+        if isinstance(command, str):
+            return shlex.split(command)
+        return [str(arg) for arg in command]
+    
+    def _build_argv(self, args):
+        """构造完整的进程参数：设备管理命令 + 目标设备 + 命令参数"""
+        argv = shlex.split(self.device_command)
+        if self.device_id:
+            argv += ["-t" if self.command_type == "hdc" else "-s", self.device_id]
+        return argv + args
+    
+    def _record_command(self, args, result, elapsed):
+        """记录命令耗时和失败原因"""
+        COMMAND_SECONDS.observe(elapsed, kind=command_kind(args))
+        return_code, _, stderr = result
+        if return_code == -1 and stderr == "命令执行超时":
+            record_failure("device_timeout")
+        elif return_code != 0:
+            record_failure("device_error")
+        return result
+    
+    def _device_list_args(self):
+        return ["list", "targets"] if self.command_type == "hdc" else ["devices"]
+    
+    def _tap_args(self, x, y):
+        # 使用用户指定的uinput命令格式：uinput -T -d x y -u x y
+        return ["shell", "uinput", "-T", "-d", str(x), str(y), "-u", str(x), str(y)]
+    
+    def _swipe_args(self, start_x, start_y, end_x, end_y, duration=None):
+        args = ["shell", "input", "swipe", str(start_x), str(start_y), str(end_x), str(end_y)]
+        if duration:
+            args.append(str(duration))
+        return args
+    
+    def _key_args(self, keycode):
+        return ["shell", "input", "keyevent", str(int(keycode))]
+    
+    def _text_args(self, text):
+        # 替换特殊字符，并按设备端shell的规则转义，避免文本中的元字符被解释
+        text = text.replace(" ", "%s").replace("\n", "%n")
+        return ["shell", "input", "text", shlex.quote(text)], text
+    
+    def _launch_args(self, package, ability=None):
+        if self.command_type == "hdc":
+            # 鸿蒙应用的入口Ability通常为EntryAbility
+            return ["shell", "aa", "start", "-b", package, "-a", ability or "EntryAbility"]
+        return ["shell", "monkey", "-p", package, "-c", "android.intent.category.LAUNCHER", "1"]
+    
+    def _screen_size_args(self):
+        return ["shell", "wm", "size"]
+    
+    def _foreground_args(self):
+        if self.command_type == "hdc":
+            return ["shell", "aa", "dump", "-l"]
+        return ["shell", "dumpsys", "activity", "activities"]
+    
+    def _screenshot_steps(self, save_path, remote_name="screenshot"):
+        """截图的命令序列
+        
+        Args:
+            save_path (str): 本地保存路径
+            remote_name (str): 设备端临时文件名（不含扩展名），同时截图的调用方需各用一个
+        
+        Returns:
+            tuple: (截图和拉取步骤, 清理设备临时文件的命令)
+        """
+        if self.command_type == "hdc":
+            # 只保留鸿蒙官方推荐的截图命令 - 使用snapshot_display（经过测试可正常工作）
+            remote_path = f"/data/local/tmp/{remote_name}.jpeg"
+            return [
+                ["shell", "snapshot_display", "-f", remote_path],
+                ["file", "recv", remote_path, save_path],
+            ], ["shell", "rm", remote_path]
+        remote_path = f"/sdcard/{remote_name}.png"
+        return [
+            ["shell", "screencap", "-p", remote_path],
+            ["pull", remote_path, save_path],
+        ], ["shell", "rm", remote_path]
+    
+    def _layout_steps(self, local_path, remote_name=None):
+        """导出控件树的命令序列
+        
+        Args:
+            local_path (str): 本地保存路径
+            remote_name (str, optional): 设备端临时文件名（不含扩展名），同时导出的调用方需各用一个
+        
+        Returns:
+            tuple: (导出和拉取步骤, 清理设备临时文件的命令)
+        """
+        if self.command_type == "hdc":
+            remote_path = f"/data/local/tmp/{remote_name or 'layout'}.json"
+            return [
+                ["shell", "uitest", "dumpLayout", "-p", remote_path],
+                ["file", "recv", remote_path, local_path],
+            ], ["shell", "rm", remote_path]
+        remote_path = f"/sdcard/{remote_name or 'window_dump'}.xml"
+        return [
+            ["shell", "uiautomator", "dump", remote_path],
+            ["pull", remote_path, local_path],
+        ], ["shell", "rm", remote_path]
+    
+    def _frame_steps(self, local_path, width=None, height=None, channel="frame"):
+        """截取一帧画面的命令序列，设备端临时文件按channel区分，不同调用方同时截取时互不覆盖"""
+        if self.command_type == "hdc":
+            remote_path = f"/data/local/tmp/{channel}.jpeg"
+            capture = ["shell", "snapshot_display", "-f", remote_path]
+            if width and height:
+                capture += ["-w", str(width), "-h", str(height)]
+            return [capture, ["file", "recv", remote_path, local_path]]
+        remote_path = f"/sdcard/{channel}.png"
+        return [["shell", "screencap", "-p", remote_path], ["pull", remote_path, local_path]]
+    
+    def _frame_suffix(self):
+        return ".jpeg" if self.command_type == "hdc" else ".png"
+    
+    def _layout_suffix(self):
+        return ".json" if self.command_type == "hdc" else ".xml"
+
+
+class HarmonyDeviceManager(DeviceCommandMixin):
+    """鸿蒙设备管理器，用于执行设备管理命令与设备交互"""
+    
+    def __init__(self, device_command="hdc", screenshot_store=None, transport=None, device_id=None):
+        """初始化设备管理器
+        
+        Args:
+            device_command (str): 设备管理命令路径，默认使用环境变量中的hdc
+                                  支持的命令包括：hdc, hdc_std, adb（部分命令兼容）
+            screenshot_store (ScreenshotStore, optional): 截图归档存储，默认归档到当前目录下的pictures
+            transport (object, optional): 命令传输，如DeviceTransport.HdcServerTransport，
+                                          指定后直接与hdc/adb server通信，不再启动命令行进程
+            device_id (str, optional): 目标设备ID，多台设备连接时用于指定设备
+        """
+        self.device_command = device_command
+        self.command_type = self._detect_command_type()
+        self.device_id = device_id
+        self.transport = transport
+        self.screenshot_store = screenshot_store or ScreenshotStore()
+        # 最近一次导出控件树时的前台应用包名
+        self.foreground_app = None
+        self._screen_size = None
+    
+    def execute_command(self, command, timeout=30, quiet=False):
         """执行设备管理命令
         
+        命令以参数列表的形式直接启动进程，不经过本机shell，路径中的空格等字符不会被拆分。
+        
         Args:
-            command (str): 要执行的命令
+            command (str|list): 要执行的命令，字符串会按shell规则拆分为参数列表
             timeout (int): 命令执行超时时间（秒）
+            quiet (bool): 是否不打印命令（用于高频的后台截屏等命令）
             
         Returns:
             tuple: (返回码, 标准输出, 标准错误)
         """
-        full_command = f"{self.device_command} {command}"
-        print(f"执行命令: {full_command}")
+        args = self._normalize_args(command)
+        argv = self._build_argv(args)
+        if not quiet:
+            print(f"执行命令: {shlex.join(argv)}")
+        
+        started = time.monotonic()
+        result = self._run_command(args, argv, timeout)
+        return self._record_command(args, result, time.monotonic() - started)
+    
+    def _run_command(self, args, argv, timeout):
+        """通过传输或子进程执行命令，返回(返回码, 标准输出, 标准错误)"""
+        if self.transport is not None:
+            return self.transport.execute(args, timeout)
         
         try:
             process = subprocess.Popen(
-                full_command, 
-                shell=True, 
+                argv, 
                 stdout=subprocess.PIPE, 
                 stderr=subprocess.PIPE, 
                 text=True
             )
+        except FileNotFoundError:
+            return -1, "", f"找不到命令: {self.device_command}，请确保已安装并添加到环境变量"
+        except Exception as e:
+            return -1, "", f"命令执行失败: {str(e)}"
+        
+        try:
             stdout, stderr = process.communicate(timeout=timeout)
             return process.returncode, stdout.strip(), stderr.strip()
         except subprocess.TimeoutExpired:
             process.kill()
+            process.communicate()
             return -1, "", "命令执行超时"
-        except FileNotFoundError:
-            return -1, "", f"找不到命令: {self.device_command}，请确保已安装并添加到环境变量"
         except Exception as e:
+            process.kill()
             return -1, "", f"命令执行失败: {str(e)}"
     
     def check_command_available(self):
@@ -67,144 +482,89 @@ class HarmonyDeviceManager:
             bool: 命令是否可用
         """
         # 测试执行help命令
-        return_code, stdout, stderr = self.execute_command("help", timeout=10)
+        return_code, stdout, stderr = self.execute_command(["help"], timeout=10)
         return return_code == 0
     
+    def list_devices(self):
+        """列出已连接的设备
+        
+        Returns:
+            list: 设备ID列表
+        """
+        return_code, stdout, stderr = self.execute_command(self._device_list_args())
+        if return_code != 0:
+            return []
+        return parse_device_list(stdout)
+    
     def check_device_connected(self):
         """检查设备是否已连接
         
         Returns:
             bool: 设备是否已连接
         """
-        # 根据命令类型使用不同的命令检查设备连接
-        if self.command_type == "hdc":
-            # 只使用hdc list targets命令检查设备连接
-            cmd = "list targets"
-        else:  # adb
-            cmd = "devices"
-        
-        return_code, stdout, stderr = self.execute_command(cmd)
-        if return_code == 0:
-            stdout = stdout.strip()
-            if stdout and not stdout.lower().startswith("unknown operation"):
-                # 对于单行输出的情况
-                if "\n" not in stdout:
-                    line = stdout.strip()
-                    # 检查是否是设备ID（长度大于等于10的字母数字组合）
-                    if line and len(line) >= 10 and line.isalnum():
-                        print(f"检测到设备ID: {line}")
-                        return True
-                else:
-                    # 多行输出的情况
-                    lines = stdout.strip().split("\n")
-                    for line in lines:
-                        line = line.strip()
-                        if line and not line.lower().startswith("unknown operation"):
-                            # 排除明显的标题行
-                            if not (line.lower().startswith("list of devices attached") or 
-                                    line.lower() == "target list" or 
-                                    line.lower() == "devices"):
-                                if line and len(line) >= 10 and line.isalnum():
-                                    print(f"检测到设备ID: {line}")
-                                    return True
-        
-        return False
+        devices = self.list_devices()
+        if self.device_id:
+            connected = self.device_id in devices
+        else:
+            connected = bool(devices)
+        if connected:
+            print(f"检测到设备ID: {self.device_id or devices[0]}")
+        return connected
     
-    def get_screenshot(self, save_path):
+    def get_screenshot(self, save_path, quiet=False):
         """获取设备屏幕截图
         
         Args:
             save_path (str): 截图保存路径
+            quiet (bool): 是否不输出日志（用于后台线程中的截图）
             
         Returns:
             bool: 截图是否成功
         """
-        # 确保保存路径在pictures目录下
-        import os
-        from datetime import datetime
-        
-        # 创建pictures目录（如果不存在）
-        pictures_dir = os.path.join(os.getcwd(), "pictures")
-        if not os.path.exists(pictures_dir):
-            os.makedirs(pictures_dir)
-        
-        # 生成带时间戳的文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = os.path.basename(save_path)
-        name, ext = os.path.splitext(filename)
-        timestamped_filename = f"{name}_{timestamp}{ext}"
-        timestamped_path = os.path.join(pictures_dir, timestamped_filename)
-        
-        # 更新保存路径为带时间戳的路径
-        save_path = timestamped_path
-        if self.command_type == "hdc":
-            # 只保留鸿蒙官方推荐的截图命令 - 使用snapshot_display（经过测试可正常工作）
-            screenshot_commands = [
-                (f"shell snapshot_display -f /data/local/tmp/screenshot.jpeg", 
-                 f"file recv /data/local/tmp/screenshot.jpeg {save_path}", 
-                 f"shell rm /data/local/tmp/screenshot.jpeg")
-            ]
-            
-            for cmd in screenshot_commands:
-                success = False
-                
-                if isinstance(cmd, tuple):
-                    # 处理需要多个步骤的命令序列
-                    print(f"尝试命令序列: {cmd[0]}")
-                    step_success = True
-                    for step in cmd:
-                        return_code, stdout, stderr = self.execute_command(step)
-                        if return_code != 0:
-                            print(f"  步骤失败: {step}")
-                            print(f"  错误: {stderr}")
-                            step_success = False
-                            break
-                    if step_success:
-                        success = True
-                else:
-                    # 处理单个命令
-                    print(f"尝试命令: {cmd}")
-                    return_code, stdout, stderr = self.execute_command(cmd)
-                    if return_code == 0:
-                        success = True
-                    else:
-                        print(f"  命令失败")
-                        print(f"  错误: {stderr}")
-                
-                # 检查文件是否真的存在且大小大于0
-                if success and os.path.exists(save_path) and os.path.getsize(save_path) > 0:
-                    print(f"截图成功，保存到: {save_path}")
-                    return True
-            
-            print(f"所有hdc截图命令都失败了")
-            return False
-        else:  # adb
-            # 使用adb命令获取截图
-            print("尝试adb截图命令序列")
-            
-            # 先截图到设备
-            return_code, stdout, stderr = self.execute_command(f"shell screencap -p /sdcard/screenshot.png")
-            if return_code != 0:
-                print(f"  设备截图失败: {stderr}")
-                return False
-                
-            # 从设备复制到本地
-            return_code, stdout, stderr = self.execute_command(f"pull /sdcard/screenshot.png {save_path}")
+        with SCREENSHOT_SECONDS.time(source="device"):
+            return self._get_screenshot(save_path, quiet)
+    
+    def _get_screenshot(self, save_path, quiet=False):
+        """执行截图命令，成功后归档截图"""
+        # 截图直接保存到save_path，随后按内容归档到截图存储（相同画面只保存一份）
+        save_dir = os.path.dirname(save_path)
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+        
+        log = (lambda message: None) if quiet else print
+        steps, cleanup = self._screenshot_steps(save_path)
+        log(f"尝试命令序列: {shlex.join(steps[0])}")
+        for step in steps:
+            return_code, stdout, stderr = self.execute_command(step, quiet=quiet)
             if return_code != 0:
-                print(f"  本地保存失败: {stderr}")
+                log(f"  步骤失败: {shlex.join(step)}")
+                log(f"  错误: {stderr}")
+                log(f"截图失败")
                 return False
-                
-            # 删除设备上的临时文件
-            self.execute_command("shell rm /sdcard/screenshot.png")
-            
-            # 检查文件是否真的存在且大小大于0
-            if os.path.exists(save_path) and os.path.getsize(save_path) > 0:
-                print(f"截图成功，保存到: {save_path}")
-                return True
+        # 删除设备上的临时文件
+        self.execute_command(cleanup, quiet=quiet)
         
-        print(f"截图失败")
+        # 检查文件是否真的存在且大小大于0
+        if os.path.exists(save_path) and os.path.getsize(save_path) > 0:
+            self.archive_screenshot(save_path)
+            log(f"截图成功，保存到: {save_path}")
+            return True
+        
+        log(f"截图失败")
         return False
     
+    def archive_screenshot(self, path):
+        """将截图归档到截图存储，归档失败不影响截图结果
+        
+        Args:
+            path (str): 截图路径
+        """
+        try:
+            label = os.path.splitext(os.path.basename(path))[0]
+            self.screenshot_store.put_file(path, label=label)
+        except (OSError, sqlite3.Error) as e:
+            print(f"截图归档失败: {str(e)}")
+    
     def tap(self, x, y):
         """点击设备屏幕上的指定位置
         
@@ -215,8 +575,7 @@ class HarmonyDeviceManager:
         Returns:
             bool: 点击是否成功
         """
-        # 使用用户指定的uinput命令格式：uinput -T -d x y -u x y
-        return_code, stdout, stderr = self.execute_command(f"shell uinput -T -d {x} {y} -u {x} {y}")
+        return_code, stdout, stderr = self.execute_command(self._tap_args(x, y))
         if return_code != 0:
             print(f"点击失败: {stderr}")
             return False
@@ -236,12 +595,9 @@ class HarmonyDeviceManager:
         Returns:
             bool: 滑动是否成功
         """
-        if duration:
-            command = f"shell input swipe {start_x} {start_y} {end_x} {end_y} {duration}"
-        else:
-            command = f"shell input swipe {start_x} {start_y} {end_x} {end_y}"
-        
-        return_code, stdout, stderr = self.execute_command(command)
+        return_code, stdout, stderr = self.execute_command(
+            self._swipe_args(start_x, start_y, end_x, end_y, duration)
+        )
         if return_code != 0:
             print(f"滑动失败: {stderr}")
             return False
@@ -254,7 +610,7 @@ class HarmonyDeviceManager:
         Returns:
             bool: 操作是否成功
         """
-        return_code, stdout, stderr = self.execute_command("shell input keyevent 3")
+        return_code, stdout, stderr = self.execute_command(self._key_args(3))
         if return_code != 0:
             print(f"按下Home键失败: {stderr}")
             return False
@@ -267,7 +623,7 @@ class HarmonyDeviceManager:
         Returns:
             bool: 操作是否成功
         """
-        return_code, stdout, stderr = self.execute_command("shell input keyevent 4")
+        return_code, stdout, stderr = self.execute_command(self._key_args(4))
         if return_code != 0:
             print(f"按下返回键失败: {stderr}")
             return False
@@ -280,13 +636,29 @@ class HarmonyDeviceManager:
         Returns:
             bool: 操作是否成功
         """
-        return_code, stdout, stderr = self.execute_command("shell input keyevent 82")
+        return_code, stdout, stderr = self.execute_command(self._key_args(82))
         if return_code != 0:
             print(f"按下菜单键失败: {stderr}")
             return False
         print("按下菜单键")
         return True
     
+    def press_key(self, keycode):
+        """按下指定键码的按键
+        
+        Args:
+            keycode (int): 按键键码
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        return_code, stdout, stderr = self.execute_command(self._key_args(keycode))
+        if return_code != 0:
+            print(f"按键{keycode}失败: {stderr}")
+            return False
+        print(f"按键: {keycode}")
+        return True
+    
     def send_text(self, text):
         """向设备发送文本
         
@@ -296,53 +668,120 @@ class HarmonyDeviceManager:
         Returns:
             bool: 操作是否成功
         """
-        # 替换特殊字符
-        text = text.replace(" ", "%s").replace("\n", "%n")
-        return_code, stdout, stderr = self.execute_command(f"shell input text {text}")
+        args, text = self._text_args(text)
+        return_code, stdout, stderr = self.execute_command(args)
         if return_code != 0:
             print(f"发送文本失败: {stderr}")
             return False
         print(f"发送文本: {text}")
         return True
     
-    def get_screen_size(self):
-        """获取设备屏幕尺寸
+    def launch_app(self, package, ability=None):
+        """按包名启动应用，无需在桌面上找到应用图标
         
+        Args:
+            package (str): 应用包名（鸿蒙为bundleName）
+            ability (str, optional): 鸿蒙应用的Ability名称，默认EntryAbility
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        return_code, stdout, stderr = self.execute_command(self._launch_args(package, ability))
+        # aa start失败时返回码可能仍为0，需要检查输出
+        if return_code != 0 or "error" in stdout.lower():
+            print(f"启动应用失败: {stderr or stdout}")
+            return False
+        print(f"启动应用: {package}")
+        return True
+    
+    def get_screen_size(self, refresh=False):
+        """获取设备屏幕尺寸，成功获取后缓存，之后不再执行命令
+        
+        Args:
+            refresh (bool): 是否忽略缓存重新获取（如分辨率设置改变后）
+            
         Returns:
             tuple: (宽度, 高度)，如果获取失败则返回None
         """
-        return_code, stdout, stderr = self.execute_command("shell wm size")
+        if self._screen_size is not None and not refresh:
+            return self._screen_size
+        return_code, stdout, stderr = self.execute_command(self._screen_size_args())
         if return_code != 0:
             print(f"获取屏幕尺寸失败: {stderr}")
             return None
+        self._screen_size = parse_screen_size(stdout)
+        return self._screen_size
+    
+    def get_foreground_activity(self):
+        """获取前台页面（包名和Ability/Activity名），比导出控件树快得多
         
-        # 解析输出，格式类似：Physical size: 1080x2340
+        Returns:
+            str: "包名/Ability或Activity名"，获取失败时返回None
+        """
+        return_code, stdout, stderr = self.execute_command(self._foreground_args(), quiet=True)
+        if return_code != 0:
+            return None
+        return parse_foreground_activity(self.command_type, stdout)
+    
+    def dump_layout(self, quiet=False):
+        """导出当前界面的控件树（无需截图和视觉模型）
+        
+        Args:
+            quiet (bool): 是否不输出日志（用于后台线程中的导出）
+        
+        Returns:
+            list: UI元素列表，每个元素包含type、text、description、position([x1, y1, x2, y2])、clickable，
+                  获取失败时返回None
+        """
+        fd, local_path = tempfile.mkstemp(suffix=self._layout_suffix())
+        os.close(fd)
+        log = (lambda message: None) if quiet else print
         try:
-            # 检查是否包含错误信息
-            if "inaccessible" in stdout.lower() or "not found" in stdout.lower():
-                print(f"解析屏幕尺寸失败: {stdout.strip()}")
-                return None
-                
-            # 尝试多种可能的格式解析
-            size_str = stdout.strip()
-            
-            # 格式1: Physical size: 1080x2340
-            if ":" in size_str:
-                size_str = size_str.split(":")[-1].strip()
+            steps, cleanup = self._layout_steps(local_path)
+            for step in steps:
+                return_code, stdout, stderr = self.execute_command(step, quiet=quiet)
+                if return_code != 0:
+                    log(f"导出控件树失败: {stderr}")
+                    return None
+            self.execute_command(cleanup, quiet=quiet)
             
-            # 格式2: 1080x2340
-            if "x" in size_str:
-                width, height = map(int, size_str.split("x"))
-                return width, height
-            
-            # 格式3: 1080 2340 (空格分隔)
-            elif " " in size_str and all(part.isdigit() for part in size_str.split()):
-                width, height = map(int, size_str.split())
-                return width, height
-            else:
-                print(f"解析屏幕尺寸失败: 输出格式无法识别: {stdout}")
+            if os.path.getsize(local_path) == 0:
+                log("导出控件树失败: 文件为空")
                 return None
-                
-        except Exception as e:
-            print(f"解析屏幕尺寸失败: {str(e)}")
-            return None
\ No newline at end of file
+            with open(local_path, "r", encoding="utf-8") as f:
+                elements, self.foreground_app = parse_layout_text(self.command_type, f.read())
+            return elements
+        except (ValueError, ET.ParseError) as e:
+            log(f"解析控件树失败: {str(e)}")
+            return None
+        finally:
+            os.remove(local_path)
+    
+    def capture_frame(self, width=None, height=None, channel="frame"):
+        """快速截取一帧屏幕画面，不保存到pictures目录
+        
+        用于界面稳定检测等只需要低分辨率画面的场景。
+        
+        Args:
+            width (int, optional): 画面宽度（仅hdc支持缩放）
+            height (int, optional): 画面高度（仅hdc支持缩放）
+            channel (str): 设备端临时文件名，在其他线程中截取画面的调用方（如后台截屏、界面预取）各用一个
+            
+        Returns:
+            bytes: 图片数据，获取失败时返回None
+        """
+        fd, local_path = tempfile.mkstemp(suffix=self._frame_suffix())
+        os.close(fd)
+        started = time.monotonic()
+        try:
+            for step in self._frame_steps(local_path, width, height, channel):
+                return_code, stdout, stderr = self.execute_command(step, quiet=True)
+                if return_code != 0:
+                    print(f"截取画面失败: {stderr}")
+                    return None
+            with open(local_path, "rb") as f:
+                data = f.read()
+            SCREENSHOT_SECONDS.observe(time.monotonic() - started, source="frame")
+            return data or None
+        finally:
+            os.remove(local_path)
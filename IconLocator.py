@@ -0,0 +1,281 @@
+import os
+import time
+
+# NumPy和Pillow在第一次定位图标时才导入，未安装时定位器不可用
+_modules = None
+_modules_loaded = False
+
+# 支持的图标文件扩展名
+ICON_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def _load_modules():
+    """导入NumPy和Pillow，任一未安装时返回None"""
+    global _modules, _modules_loaded
+    if not _modules_loaded:
+        try:
+            import numpy
+            from PIL import Image
+            _modules = (numpy, Image)
+        except ImportError:
+            _modules = None
+        _modules_loaded = True
+    return _modules
+
+
+def _fast_length(n):
+    """不小于n且只含因子2、3、5的长度，FFT在这类长度上最快"""
+    while True:
+        m = n
+        for factor in (2, 3, 5):
+            while m % factor == 0:
+                m //= factor
+        if m == 1:
+            return n
+        n += 1
+
+
+def match_template(np, image, template, cache=None):
+    """归一化互相关模板匹配
+
+    相关项用FFT计算，窗口内的均值和方差用积分图计算，整个过程向量化，不逐像素循环。
+
+    Args:
+        np (module): numpy模块
+        image (ndarray): 灰度图像（二维float数组）
+        template (ndarray): 灰度模板（二维float数组）
+        cache (dict, optional): 同一图像多次匹配时复用积分图和频谱的缓存
+
+    Returns:
+        tuple: (最高得分, (y, x)左上角位置)，模板比图像大或没有纹理时返回None
+    """
+    th, tw = template.shape
+    ih, iw = image.shape
+    if th > ih or tw > iw:
+        return None
+    t = template - template.mean()
+    t_norm = np.sqrt((t * t).sum())
+    if t_norm < 1e-6:
+        return None
+    if cache is None:
+        cache = {}
+
+    if "integral" not in cache:
+        for key, values in (("integral", image), ("integral_sq", image * image)):
+            integral = np.zeros((ih + 1, iw + 1))
+            integral[1:, 1:] = values.cumsum(0).cumsum(1)
+            cache[key] = integral
+
+    # 不同尺寸的模板按相同的FFT长度计算时可以复用图像的频谱
+    shape = cache.get("fft_shape")
+    if shape is None or shape[0] < ih + th - 1 or shape[1] < iw + tw - 1:
+        shape = (_fast_length(ih + th - 1), _fast_length(iw + tw - 1))
+    spectrum = cache.get(shape)
+    if spectrum is None:
+        spectrum = cache[shape] = np.fft.rfft2(image, s=shape)
+    correlation = np.fft.irfft2(spectrum * np.fft.rfft2(t[::-1, ::-1], s=shape), s=shape)[th - 1:ih, tw - 1:iw]
+
+    def window_sum(integral):
+        return integral[th:, tw:] - integral[:-th, tw:] - integral[th:, :-tw] + integral[:-th, :-tw]
+
+    count = th * tw
+    sums = window_sum(cache["integral"])
+    variance = np.maximum(window_sum(cache["integral_sq"]) - sums * sums / count, 0.0)
+    denominator = np.sqrt(variance) * t_norm
+    # 平坦区域（如纯色背景）的方差接近0，得分没有意义
+    valid = variance > count * 1e-2
+    scores = np.where(valid, correlation / np.where(valid, denominator, 1.0), -1.0)
+    index = int(np.argmax(scores))
+    y, x = divmod(index, scores.shape[1])
+    return float(scores[y, x]), (y, x)
+
+
+class IconLocator:
+    """基于模板匹配的本地图标定位器
+
+    图标库目录中每个文件是一个参考图标截图，文件名即图标名称（如icons/设置.png，
+    同一图标的多个截图可命名为设置@2.png）。定位时先在图像金字塔的粗糙层按多个缩放比例搜索，
+    再在原始分辨率下对最佳候选附近做精细匹配，不依赖设备分辨率，也不需要调用模型。
+    """
+
+    def __init__(self, icon_dir=None, min_confidence=None, scales=None, coarse_width=200):
+        """初始化图标定位器
+
+        Args:
+            icon_dir (str, optional): 图标库目录，默认读取ICON_LIBRARY_DIR（默认为当前目录下的icons）
+            min_confidence (float, optional): 最低匹配得分（-1到1），默认读取ICON_LOCATOR_MIN_CONFIDENCE（默认0.8）
+            scales (list, optional): 参考图标相对截图的缩放比例，默认0.5到2倍
+            coarse_width (int): 图像金字塔粗糙层的最大宽度
+        """
+        self.icon_dir = icon_dir or os.getenv("ICON_LIBRARY_DIR") or os.path.join(os.getcwd(), "icons")
+        if min_confidence is None:
+            min_confidence = float(os.getenv("ICON_LOCATOR_MIN_CONFIDENCE", "0.8"))
+        self.min_confidence = min_confidence
+        self.scales = scales or [0.5 * 2 ** (i / 6) for i in range(13)]
+        self.coarse_width = coarse_width
+        self._templates = None
+        self.stats = {"lookups": 0, "hits": 0, "last_elapsed": 0.0}
+
+    def _load_library(self):
+        """读取图标库，按名称分组为灰度数组"""
+        if self._templates is None:
+            self._templates = {}
+            modules = _load_modules()
+            if modules is None or not os.path.isdir(self.icon_dir):
+                return self._templates
+            np, Image = modules
+            for filename in sorted(os.listdir(self.icon_dir)):
+                stem, ext = os.path.splitext(filename)
+                if ext.lower() not in ICON_EXTENSIONS:
+                    continue
+                try:
+                    with Image.open(os.path.join(self.icon_dir, filename)) as icon:
+                        template = np.asarray(icon.convert("L"), dtype=np.float64)
+                except OSError as e:
+                    print(f"读取图标失败: {filename}: {str(e)}")
+                    continue
+                self._templates.setdefault(stem.split("@")[0], []).append(template)
+        return self._templates
+
+    def available(self):
+        """定位器是否可用（已安装NumPy和Pillow且图标库不为空）
+
+        Returns:
+            bool: 是否可用
+        """
+        return bool(self._load_library())
+
+    def names(self):
+        """图标库中的图标名称
+
+        Returns:
+            list: 图标名称列表
+        """
+        return list(self._load_library())
+
+    def match_name(self, instruction):
+        """找出指令中提到的图标名称
+
+        Args:
+            instruction (str): 自然语言指令或目标描述
+
+        Returns:
+            str: 指令中最长的图标名称，没有时返回None
+        """
+        if not instruction:
+            return None
+        matches = [name for name in self._load_library() if name in instruction]
+        return max(matches, key=len) if matches else None
+
+    def _resize(self, Image, np, array, scale):
+        height, width = array.shape
+        size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+        image = Image.fromarray(array.astype(np.uint8))
+        return np.asarray(image.resize(size, Image.BILINEAR), dtype=np.float64)
+
+    def _search(self, np, Image, screen, template):
+        """在截图中按多个缩放比例搜索一个参考图标
+
+        Returns:
+            tuple: (得分, [x1, y1, x2, y2])，未找到时返回None
+        """
+        # 粗糙层：截图按2的幂缩小到coarse_width以内
+        factor = 1
+        while screen.shape[1] / factor > self.coarse_width:
+            factor *= 2
+        coarse = self._resize(Image, np, screen, 1.0 / factor) if factor > 1 else screen
+
+        coarse_templates = [
+            (scale, self._resize(Image, np, template, scale / factor)) for scale in self.scales
+        ]
+        coarse_templates = [(scale, t) for scale, t in coarse_templates if min(t.shape) >= 6]
+        if not coarse_templates:
+            return None
+        # 所有缩放比例使用同一FFT长度，截图的频谱只计算一次
+        max_h = max(t.shape[0] for scale, t in coarse_templates)
+        max_w = max(t.shape[1] for scale, t in coarse_templates)
+        cache = {"fft_shape": (_fast_length(coarse.shape[0] + max_h - 1), _fast_length(coarse.shape[1] + max_w - 1))}
+
+        best = None
+        for scale, coarse_template in coarse_templates:
+            result = match_template(np, coarse, coarse_template, cache)
+            if result is not None and (best is None or result[0] > best[0]):
+                best = (result[0], result[1], scale)
+        if best is None:
+            return None
+
+        # 精细层：原始分辨率下，在最佳候选附近用相邻缩放比例重新匹配
+        score, (y, x), scale = best
+        result = None
+        for refine_scale in (scale / 1.06, scale, scale * 1.06):
+            fine_template = self._resize(Image, np, template, refine_scale)
+            th, tw = fine_template.shape
+            margin = factor * 2
+            top = max(0, y * factor - margin)
+            left = max(0, x * factor - margin)
+            region = screen[top:top + th + 2 * margin, left:left + tw + 2 * margin]
+            match = match_template(np, region, fine_template)
+            if match is not None and (result is None or match[0] > result[0]):
+                fy, fx = match[1]
+                result = (match[0], [left + fx, top + fy, left + fx + tw, top + fy + th])
+        return result
+
+    def locate(self, name, screenshot_path, quiet=False):
+        """在截图中定位图标
+
+        Args:
+            name (str): 图标名称
+            screenshot_path (str): 截图路径
+            quiet (bool): 是否不输出日志（用于后台预取）
+
+        Returns:
+            dict: 目标元素（type、description、position([x1, y1, x2, y2])、confidence），
+                  未找到或得分低于min_confidence时返回None
+        """
+        templates = self._load_library().get(name)
+        if not templates:
+            return None
+        np, Image = _load_modules()
+        started = time.monotonic()
+        self.stats["lookups"] += 1
+        try:
+            with Image.open(screenshot_path) as image:
+                screen = np.asarray(image.convert("L"), dtype=np.float64)
+        except OSError as e:
+            if not quiet:
+                print(f"读取截图失败: {str(e)}")
+            return None
+
+        best = None
+        for template in templates:
+            result = self._search(np, Image, screen, template)
+            if result is not None and (best is None or result[0] > best[0]):
+                best = result
+        self.stats["last_elapsed"] = time.monotonic() - started
+        if best is None or best[0] < self.min_confidence:
+            return None
+        self.stats["hits"] += 1
+        if not quiet:
+            print(f"本地定位图标: {name}，得分 {best[0]:.2f}，耗时 {self.stats['last_elapsed'] * 1000:.0f}ms")
+        return {
+            "type": "icon",
+            "description": name,
+            "position": best[1],
+            "confidence": round(best[0], 3),
+            "clickable": True,
+        }
+
+    def resolve(self, instruction, screenshot_path):
+        """根据指令中提到的图标名称在截图中定位目标
+
+        Args:
+            instruction (str): 自然语言指令或目标描述
+            screenshot_path (str): 截图路径
+
+        Returns:
+            dict: 目标元素，指令中没有已知图标或未找到时返回None
+        """
+        name = self.match_name(instruction)
+        if name is None:
+            return None
+        return self.locate(name, screenshot_path)
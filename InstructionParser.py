@@ -1,27 +1,66 @@
 import json
+from ModelRouter import ACTION_TYPES, ModelRouter, iter_elements
 from OpenAICompatibleClient import OpenAICompatibleClient
+from StructuredOutput import (ACTION_PLAN_SCHEMA, ELEMENT_SCHEMA, SWIPE_PARAMS_SCHEMA, StructuredOutput,
+                              response_format)
 
 class InstructionParser:
     """指令解析器，将自然语言指令转换为操作步骤"""
     
-    def __init__(self, client=None):
+    def __init__(self, client=None, router=None):
         """初始化指令解析器
         
         Args:
             client (OpenAICompatibleClient): LLM客户端实例
+            router (ModelRouter, optional): 模型分级路由，默认基于client创建
         """
         self.client = client or OpenAICompatibleClient()
+        self.router = router or ModelRouter(self.client)
+        self.structured = StructuredOutput(self.client)
     
-    def parse_instruction(self, instruction, ui_elements=None):
+    def load_json(self, result):
+        """解析LLM返回的JSON，容忍前后的说明文字、代码块和常见的格式错误
+        
+        Args:
+            result (str): LLM返回的原始文本
+            
+        Returns:
+            object: 解析结果，无法解析时返回None
+        """
+        return self.structured.load(result)
+    
+    def _load_structured(self, result, schema, prompt, system_prompt):
+        """解析LLM返回的JSON并按结构校验，个别字段出错时只重新询问该字段
+        
+        Args:
+            result (str|object): LLM返回的原始文本，或已解析的结果
+            schema (dict): 期望的结构
+            prompt (str): 原始提示
+            system_prompt (str): 原始系统提示
+            
+        Returns:
+            object: 解析结果，无法解析时返回None
+        """
+        value = self.load_json(result) if isinstance(result, str) else result
+        if value is None or isinstance(value, dict) and value.get("need_screen"):
+            return value
+        return self.structured.coerce(value, schema, prompt, system_prompt, self.router.text_model_id)
+    
+    def parse_instruction(self, instruction, ui_elements=None, screenshot_path=None):
         """解析自然语言指令
         
         Args:
             instruction (str): 自然语言指令
             ui_elements (dict): UI元素分析结果
+            screenshot_path (str, optional): 当前截图路径，文本模型无法确定时用于升级到多模态模型
             
         Returns:
             dict: 解析结果，包含操作类型和参数
         """
+        parsed = self.router.apply_rules("parse_instruction", instruction, ui_elements)
+        if parsed is not None:
+            return parsed
+        
         system_prompt = "你是一个智能助手，能够将用户的自然语言指令转换为具体的手机操作步骤。"
         
         if ui_elements:
@@ -31,45 +70,59 @@ class InstructionParser:
             # 如果没有UI元素信息，只分析指令类型
             prompt = f"用户指令: {instruction}\n\n请分析这个指令，确定需要执行的操作类型和可能的参数。操作类型包括：click, swipe, tap, type, press_home, press_back, press_menu等。\n\n请以JSON格式返回结果，确保格式正确。"
         
-        result = self.client.generate(prompt, system_prompt)
-        
-        # 处理可能包含在代码块中的JSON
-        if result.startswith('```json') and result.endswith('```'):
-            # 提取代码块中的JSON内容
-            result = result[7:-3].strip()
-        elif result.startswith('```') and result.endswith('```'):
-            # 提取通用代码块中的内容
-            result = result[3:-3].strip()
-        
-        try:
-            return json.loads(result)
-        except json.JSONDecodeError:
-            # 如果LLM返回的不是有效的JSON，尝试修复或返回错误
-            print(f"LLM返回的结果不是有效的JSON: {result}")
-            # 尝试简单解析
-            return {"action": "unknown", "error": f"无法解析指令: {result}"}
+        prompt += '单个操作返回一个对象，多个操作返回{"steps": [操作1, 操作2, ...]}。'
+        
+        def parse(result):
+            parsed = self.load_json(result)
+            if parsed is None:
+                # 如果LLM返回的不是有效的JSON，返回错误
+                print(f"LLM返回的结果不是有效的JSON: {result}")
+                return {"action": "unknown", "error": f"无法解析指令: {result}"}, 0.0
+            if isinstance(parsed, dict) and parsed.get("need_screen"):
+                return parsed, 0.0
+            # 统一为步骤列表后校验，操作类型不合法的步骤只重新询问该字段
+            if isinstance(parsed, dict) and isinstance(parsed.get("steps"), list):
+                steps = parsed["steps"]
+            else:
+                steps = parsed if isinstance(parsed, list) else [parsed]
+            plan = self._load_structured({"steps": steps}, ACTION_PLAN_SCHEMA, prompt, system_prompt)
+            steps = plan["steps"]
+            known = all(isinstance(step, dict) and step.get("action") in ACTION_TYPES for step in steps)
+            return steps if len(steps) != 1 else steps[0], 1.0 if known else 0.5
+        
+        return self.router.run("parse_instruction", prompt, system_prompt, parse, screenshot_path,
+                               response_format=response_format("action_plan", ACTION_PLAN_SCHEMA))
     
-    def find_target_element(self, instruction, ui_elements):
+    def find_target_element(self, instruction, ui_elements, screenshot_path=None):
         """根据指令在UI元素中找到目标元素
         
         Args:
             instruction (str): 自然语言指令
             ui_elements (dict): UI元素分析结果
+            screenshot_path (str, optional): 当前截图路径，文本模型无法确定时用于升级到多模态模型
             
         Returns:
             dict: 目标UI元素信息
         """
+        target = self.router.apply_rules("find_target_element", instruction, ui_elements)
+        if target is not None:
+            return target
+        
         system_prompt = "你是一个精确的UI元素匹配助手，能够根据用户指令找到对应的UI元素。"
         
-        prompt = f"用户指令: {instruction}\n\n当前屏幕UI元素:\n{json.dumps(ui_elements, ensure_ascii=False)}\n\n请从提供的UI元素中找到与用户指令最匹配的元素，只返回该元素的完整信息，不要添加任何其他内容。\n\n请以JSON格式返回结果，确保格式正确。"
+        prompt = f"用户指令: {instruction}\n\n当前屏幕UI元素:\n{json.dumps(ui_elements, ensure_ascii=False)}\n\n请从提供的UI元素中找到与用户指令最匹配的元素，只返回该元素的完整信息（包括position: [x1, y1, x2, y2]），不要添加任何其他内容。\n\n请以JSON格式返回结果，确保格式正确。"
         
-        result = self.client.generate(prompt, system_prompt)
+        def parse(result):
+            element = self._load_structured(result, ELEMENT_SCHEMA, prompt, system_prompt)
+            if element is None:
+                print(f"无法解析目标元素: {result}")
+                return None, 0.0
+            return element, 1.0 if self.get_element_center(element) else 0.5
         
-        try:
-            return json.loads(result)
-        except json.JSONDecodeError:
-            print(f"无法解析目标元素: {result}")
-            return None
+        # 没有可供匹配的元素时文本模型无从选择，有截图就直接交给视觉层
+        return self.router.run("find_target_element", prompt, system_prompt, parse, screenshot_path,
+                               needs_pixels=not iter_elements(ui_elements),
+                               response_format=response_format("ui_element", ELEMENT_SCHEMA))
     
     def get_element_center(self, element):
         """计算UI元素的中心点坐标
@@ -98,12 +151,19 @@ class InstructionParser:
         Returns:
             str: 操作类型
         """
+        action_type = self.router.apply_rules("determine_action_type", instruction)
+        if action_type is not None:
+            return action_type
+        
         system_prompt = "你是一个操作类型分析助手，能够根据用户指令确定需要执行的手机操作类型。"
         
         prompt = f"用户指令: {instruction}\n\n请从以下操作类型中选择最匹配的类型：\n- click: 点击某个UI元素\n- swipe: 滑动屏幕\n- tap: 点击屏幕某个坐标\n- type: 输入文本\n- press_home: 按下Home键\n- press_back: 按下返回键\n- press_menu: 按下菜单键\n- screenshot: 截图\n\n只返回操作类型名称，不要添加任何其他内容。"
         
-        result = self.client.generate(prompt, system_prompt)
-        return result.strip()
+        def parse(result):
+            result = result.strip()
+            return result, 1.0 if result in ACTION_TYPES else 0.0
+        
+        return self.router.run("determine_action_type", prompt, system_prompt, parse)
     
     def extract_swipe_params(self, instruction, screen_size):
         """从指令中提取滑动操作参数
@@ -117,16 +177,23 @@ class InstructionParser:
         """
         if not screen_size:
             return None
+        
+        swipe_params = self.router.apply_rules("extract_swipe_params", instruction, screen_size)
+        if swipe_params is not None:
+            return swipe_params
             
         system_prompt = "你是一个滑动操作参数提取助手，能够从用户指令中提取滑动操作的参数。"
         
         width, height = screen_size
         prompt = f"用户指令: {instruction}\n\n当前屏幕尺寸: {width}x{height}\n\n请根据指令提取滑动操作的参数，包括：\n- start_x: 起始x坐标\n- start_y: 起始y坐标\n- end_x: 结束x坐标\n- end_y: 结束y坐标\n- duration: 滑动持续时间（毫秒，可选）\n\n请以JSON格式返回结果，确保格式正确。"
         
-        result = self.client.generate(prompt, system_prompt)
+        def parse(result):
+            params = self._load_structured(result, SWIPE_PARAMS_SCHEMA, prompt, system_prompt)
+            if not isinstance(params, dict):
+                print(f"无法解析滑动参数: {result}")
+                return None, 0.0
+            complete = all(isinstance(params.get(key), (int, float)) for key in ("start_x", "start_y", "end_x", "end_y"))
+            return params, 1.0 if complete else 0.0
         
-        try:
-            return json.loads(result)
-        except json.JSONDecodeError:
-            print(f"无法解析滑动参数: {result}")
-            return None
\ No newline at end of file
+        return self.router.run("extract_swipe_params", prompt, system_prompt, parse,
+                               response_format=response_format("swipe_params", SWIPE_PARAMS_SCHEMA))
\ No newline at end of file
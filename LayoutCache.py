@@ -0,0 +1,300 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from FrameAnalysis import FrameSignature, changed_ratio, compute_signature
+from Metrics import record_cache
+
+# 按屏幕宽度换算的坐标字段
+X_KEYS = {"x", "x1", "x2", "left", "right", "width", "w", "center_x", "cx"}
+# 按屏幕高度换算的坐标字段
+Y_KEYS = {"y", "y1", "y2", "top", "bottom", "height", "h", "center_y", "cy"}
+# 按x、y交替排列的坐标列表字段，如position: [x1, y1, x2, y2]
+POINT_LIST_KEYS = {"position", "bounds", "bbox", "box", "center", "coordinates", "point"}
+
+# 页面指纹的网格尺寸（宽, 高），由灰度缩略图按块平均得到
+HASH_GRID = (8, 16)
+# 随缓存保存的灰度缩略图尺寸（宽, 高），用于在感知哈希相近时逐像素复核
+THUMB_GRID = (64, 128)
+
+
+def page_hash(signature):
+    """由画面指纹计算与分辨率无关的页面感知哈希（均值哈希）
+
+    Args:
+        signature (FrameSignature): 画面指纹
+
+    Returns:
+        int: 128位感知哈希，画面指纹没有缩略图（未安装Pillow）时返回None
+    """
+    if signature.pixels is None:
+        return None
+    width, height = signature.size
+    block_w = width // HASH_GRID[0]
+    block_h = height // HASH_GRID[1]
+    blocks = []
+    for by in range(HASH_GRID[1]):
+        for bx in range(HASH_GRID[0]):
+            total = 0
+            for y in range(by * block_h, (by + 1) * block_h):
+                row = y * width
+                total += sum(signature.pixels[row + bx * block_w:row + (bx + 1) * block_w])
+            blocks.append(total)
+    mean = sum(blocks) / len(blocks)
+    value = 0
+    for block in blocks:
+        value = (value << 1) | (1 if block > mean else 0)
+    return value
+
+
+def aspect_class(width, height):
+    """屏幕宽高比分类，按0.1取整，如1080x2340和1260x2720都属于"2.2"
+
+    Args:
+        width (int): 屏幕宽度
+        height (int): 屏幕高度
+
+    Returns:
+        str: 宽高比分类
+    """
+    return f"{height / width:.1f}"
+
+
+def _convert(value, width, height, scale, key=None):
+    """递归换算元素结构中的坐标字段
+
+    Returns:
+        tuple: (换算后的结构, 换算的字段数)
+    """
+    if isinstance(value, dict):
+        converted = {}
+        count = 0
+        for k, v in value.items():
+            converted[k], n = _convert(v, width, height, scale, k)
+            count += n
+        return converted, count
+    if isinstance(value, list):
+        lowered = key.lower() if isinstance(key, str) else None
+        if lowered in POINT_LIST_KEYS and value and all(
+                isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+            return [scale(v, width if i % 2 == 0 else height) for i, v in enumerate(value)], len(value)
+        converted = []
+        count = 0
+        for item in value:
+            item, n = _convert(item, width, height, scale)
+            converted.append(item)
+            count += n
+        return converted, count
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and isinstance(key, str):
+        lowered = key.lower()
+        if lowered in X_KEYS:
+            return scale(value, width), 1
+        if lowered in Y_KEYS:
+            return scale(value, height), 1
+    return value, 0
+
+
+def normalize_elements(elements, width, height):
+    """将元素坐标换算为0到1之间的相对坐标
+
+    Args:
+        elements (list|dict): UI元素分析结果
+        width (int): 屏幕宽度
+        height (int): 屏幕高度
+
+    Returns:
+        tuple: (换算后的结果, 换算的坐标字段数)
+    """
+    return _convert(elements, width, height, lambda v, size: round(v / size, 5))
+
+
+def denormalize_elements(elements, width, height):
+    """将相对坐标换算为设备像素坐标
+
+    Args:
+        elements (list|dict): 相对坐标的UI元素
+        width (int): 屏幕宽度
+        height (int): 屏幕高度
+
+    Returns:
+        list|dict: 像素坐标的UI元素
+    """
+    return _convert(elements, width, height, lambda v, size: int(round(v * size)))[0]
+
+
+class LayoutCache:
+    """与分辨率无关的界面分析缓存
+
+    多模态模型分析出的UI元素按相对坐标保存，以(应用, 宽高比分类)加页面感知哈希为键，
+    不同分辨率的设备命中同一页面时，按各自屏幕尺寸换算回像素坐标。
+    截图内容完全相同时直接命中；内容不同（如分辨率不同）时，共用标题栏和底栏的不同页面
+    感知哈希也可能很接近，因此还要求前台页面（Ability/Activity）相同、缩略图逐像素比较
+    也足够接近才算命中，调用方无法提供前台页面时按未命中处理。
+    缓存保存在SQLite文件中，多个进程和设备可以共用同一个文件。
+    """
+
+    def __init__(self, path=None, max_distance=4, max_changed=0.003, max_entries=None):
+        """初始化界面分析缓存
+
+        Args:
+            path (str, optional): SQLite文件路径，默认读取LAYOUT_CACHE_PATH（默认为当前目录下的layout_cache.sqlite3）
+            max_distance (int): 页面感知哈希允许的最大汉明距离
+            max_changed (float): 缩略图中允许发生变化的像素比例
+            max_entries (int, optional): 最多保存的页面数，默认读取LAYOUT_CACHE_MAX_ENTRIES（默认5000）
+        """
+        self.path = path or os.getenv("LAYOUT_CACHE_PATH") or os.path.join(os.getcwd(), "layout_cache.sqlite3")
+        if max_entries is None:
+            max_entries = int(os.getenv("LAYOUT_CACHE_MAX_ENTRIES", "5000"))
+        self.max_distance = max_distance
+        self.max_changed = max_changed
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        """首次使用时创建数据库（调用方需持有锁）"""
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            # WAL模式允许多个进程同时读取
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS layouts ("
+                "id INTEGER PRIMARY KEY, app TEXT NOT NULL, aspect TEXT NOT NULL, page_key TEXT, "
+                "phash TEXT, thumb BLOB, digest TEXT NOT NULL, elements TEXT NOT NULL, "
+                "created REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0, "
+                "UNIQUE (app, aspect, digest))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS layouts_key ON layouts(app, aspect, last_used)")
+            self._db.commit()
+        return self._db
+
+    def _signature(self, image_data):
+        signature = compute_signature(image_data, THUMB_GRID)
+        return signature, page_hash(signature)
+
+    def _near_match(self, signature, phash, row_phash, row_thumb):
+        """内容不同时复核是否为同一页面：感知哈希接近，且缩略图变化的像素足够少
+
+        Returns:
+            int: 感知哈希的汉明距离，不是同一页面时返回None
+        """
+        if phash is None or row_phash is None or row_thumb is None:
+            return None
+        distance = bin(phash ^ int(row_phash, 16)).count("1")
+        if distance > self.max_distance:
+            return None
+        stored = FrameSignature(None, bytes(row_thumb), THUMB_GRID)
+        if changed_ratio(signature, stored) > self.max_changed:
+            return None
+        return distance
+
+    def lookup(self, app, image_data, screen_size, page_key=None):
+        """查找当前页面的缓存分析结果
+
+        Args:
+            app (str): 前台应用包名，未知时为None
+            image_data (bytes): 截图数据
+            screen_size (tuple): 当前设备屏幕尺寸 (宽, 高)
+            page_key (str, optional): 前台页面，如"包名/Ability名"，为None时只接受内容完全相同的截图
+
+        Returns:
+            list|dict: 换算为当前设备像素坐标的UI元素，未命中时返回None
+        """
+        width, height = screen_size
+        signature, phash = self._signature(image_data)
+        with self._lock:
+            db = self._connect()
+            rows = db.execute(
+                "SELECT id, phash, digest, page_key, thumb, elements FROM layouts WHERE app = ? AND aspect = ? "
+                "ORDER BY last_used DESC LIMIT 500",
+                (app or "", aspect_class(width, height)),
+            ).fetchall()
+            best = None
+            for row_id, row_phash, row_digest, row_page_key, row_thumb, elements in rows:
+                if row_digest == signature.digest:
+                    best = (0, row_id, elements)
+                    break
+                if page_key is None or row_page_key != page_key:
+                    continue
+                distance = self._near_match(signature, phash, row_phash, row_thumb)
+                if distance is not None and (best is None or distance < best[0]):
+                    best = (distance, row_id, elements)
+            record_cache("layout", best is not None)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            db.execute("UPDATE layouts SET last_used = ?, hits = hits + 1 WHERE id = ?", (time.time(), best[1]))
+            db.commit()
+        return denormalize_elements(json.loads(best[2]), width, height)
+
+    def store(self, app, image_data, screen_size, elements, page_key=None):
+        """保存页面分析结果，同一应用、宽高比分类下内容相同的截图只保存一份
+
+        Args:
+            app (str): 前台应用包名，未知时为None
+            image_data (bytes): 截图数据
+            screen_size (tuple): 分析时的设备屏幕尺寸 (宽, 高)
+            elements (list|dict): 像素坐标的UI元素
+            page_key (str, optional): 前台页面，如"包名/Ability名"
+
+        Returns:
+            bool: 是否已保存（结果中没有坐标或包含错误时不保存）
+        """
+        if isinstance(elements, dict) and ("error" in elements or "text" in elements and len(elements) == 1):
+            return False
+        width, height = screen_size
+        normalized, count = normalize_elements(elements, width, height)
+        if count == 0:
+            return False
+        signature, phash = self._signature(image_data)
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT INTO layouts (app, aspect, phash, digest, page_key, thumb, elements, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(app, aspect, digest) DO UPDATE SET page_key = excluded.page_key, "
+                "thumb = excluded.thumb, elements = excluded.elements, last_used = excluded.last_used",
+                (
+                    app or "",
+                    aspect_class(width, height),
+                    None if phash is None else f"{phash:032x}",
+                    signature.digest,
+                    page_key,
+                    signature.pixels,
+                    json.dumps(normalized, ensure_ascii=False),
+                    now,
+                    now,
+                ),
+            )
+            db.execute(
+                "DELETE FROM layouts WHERE id NOT IN (SELECT id FROM layouts ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            db.commit()
+        return True
+
+    def get_stats(self):
+        """获取命中统计
+
+        Returns:
+            dict: 命中次数、未命中次数和保存的页面数
+        """
+        with self._lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM layouts").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,355 @@
+import bisect
+import threading
+import time
+import weakref
+
+# 默认的耗时分桶（秒），覆盖毫秒级的设备命令到数十秒的模型请求
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in key)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增不减的计数器，按标签分别计数"""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        """累加计数
+
+        Args:
+            amount (float): 增量
+            **labels: 标签
+        """
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        """获取某组标签的当前计数"""
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """分桶统计的直方图，记录次数、总和、最大值和各分桶的累计次数"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        """记录一次观测值
+
+        Args:
+            value (float): 观测值（耗时为秒）
+            **labels: 标签
+        """
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0,
+                                              "count": 0, "max": 0.0}
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+            series["max"] = max(series["max"], value)
+
+    def time(self, **labels):
+        """返回计时上下文，退出时记录经过的秒数"""
+        return _Timer(self, labels)
+
+    def snapshot(self):
+        """获取各组标签的统计快照
+
+        Returns:
+            dict: 标签到{"counts", "sum", "count", "max"}的映射
+        """
+        with self._lock:
+            return {key: dict(series, counts=list(series["counts"])) for key, series in self._series.items()}
+
+    def quantile(self, q, **labels):
+        """按分桶估算分位数（返回分位数所在分桶的上界）
+
+        Args:
+            q (float): 分位（0到1）
+            **labels: 标签
+
+        Returns:
+            float: 估算值，没有观测值时返回None
+        """
+        series = self.snapshot().get(_label_key(labels))
+        return self._quantile(series, q) if series else None
+
+    def _quantile(self, series, q):
+        target = q * series["count"]
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series["counts"]):
+            cumulative += count
+            if cumulative >= target:
+                return min(bound, series["max"])
+        return series["max"]
+
+    def samples(self):
+        result = []
+        for key, series in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series["counts"]):
+                cumulative += count
+                result.append((self.name + "_bucket", key + (("le", _format_value(bound)),), cumulative))
+            result.append((self.name + "_sum", key, series["sum"]))
+            result.append((self.name + "_count", key, series["count"]))
+        return result
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.monotonic() - self.started, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """进程内的指标注册表
+
+    模块在执行路径上直接更新计数器和直方图；已有自身统计的组件（限流器、熔断器、
+    模型路由等）注册采集函数，在导出时才读取其当前状态。导出格式为Prometheus文本格式。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = {}
+        self.started_at = time.monotonic()
+        self._server = None
+
+    def _get_or_create(self, cls, name, help_text, **options):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **options)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标{name}已注册为{metric.kind}")
+            return metric
+
+    def counter(self, name, help_text=""):
+        """获取（不存在时创建）计数器"""
+        return self._get_or_create(Counter, name, help_text)
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        """获取（不存在时创建）直方图"""
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def register_collector(self, name, collect):
+        """注册采集函数，同名的采集函数会被替换
+
+        Args:
+            name (str): 采集函数名称
+            collect (callable): 返回指标列表的函数，每项为(指标名, 类型, 说明, 标签dict, 值)，类型为counter或gauge；
+                也可以是weakref.WeakMethod，所属对象被回收后自动移除
+        """
+        with self._lock:
+            self._collectors[name] = collect
+
+    def unregister_collector(self, name):
+        """移除采集函数"""
+        with self._lock:
+            self._collectors.pop(name, None)
+
+    def _collected(self):
+        with self._lock:
+            collectors = list(self._collectors.items())
+        families = {}
+        for name, collect in collectors:
+            if isinstance(collect, weakref.ref):
+                collect = collect()
+                if collect is None:
+                    self.unregister_collector(name)
+                    continue
+            try:
+                items = collect()
+            except Exception as e:
+                print(f"采集指标{name}失败: {str(e)}")
+                continue
+            for metric_name, kind, help_text, labels, value in items:
+                family = families.setdefault(metric_name, (kind, help_text, {}))
+                key = _label_key(labels)
+                # 多个采集函数给出同一组标签时，计数器累加，其他类型以后采集的为准
+                if kind == "counter" and key in family[2]:
+                    value += family[2][key]
+                family[2][key] = value
+        return {metric_name: (kind, help_text, [(metric_name, key, value) for key, value in samples.items()])
+                for metric_name, (kind, help_text, samples) in families.items()}
+
+    def render(self):
+        """导出Prometheus文本格式
+
+        Returns:
+            str: 指标文本
+        """
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        families = [(name, metric.kind, metric.help, metric.samples()) for name, metric in metrics]
+        families += [(name, kind, help_text, samples)
+                     for name, (kind, help_text, samples) in sorted(self._collected().items())]
+        families.append(("process_uptime_seconds", "gauge", "进程运行时间",
+                         [("process_uptime_seconds", (), time.monotonic() - self.started_at)]))
+        for name, kind, help_text, samples in families:
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, key, value in samples:
+                lines.append(f"{sample_name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """生成运行结束时的指标摘要
+
+        Returns:
+            str: 多行文本，计数器按标签列出总数，直方图列出次数、平均值、P50、P95和最大值
+        """
+        uptime = time.monotonic() - self.started_at
+        lines = [f"运行时间: {uptime:.1f}秒"]
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        for name, metric in metrics:
+            if isinstance(metric, Counter):
+                for _, key, value in metric.samples():
+                    lines.append(f"{name}{_format_labels(key)}: {value:g}")
+                continue
+            for key, series in sorted(metric.snapshot().items()):
+                if not series["count"]:
+                    continue
+                lines.append(
+                    f"{name}{_format_labels(key)}: {series['count']}次，"
+                    f"平均{series['sum'] / series['count'] * 1000:.1f}ms，"
+                    f"P50≤{metric._quantile(series, 0.5) * 1000:.1f}ms，"
+                    f"P95≤{metric._quantile(series, 0.95) * 1000:.1f}ms，"
+                    f"最大{series['max'] * 1000:.1f}ms"
+                )
+        instructions = self._metrics.get("agent_instructions_total")
+        if isinstance(instructions, Counter) and uptime > 0:
+            total = sum(value for _, _, value in instructions.samples())
+            lines.append(f"指令吞吐: {total / uptime:.3f}条/秒")
+        lookups = self._metrics.get("agent_cache_lookups_total")
+        if isinstance(lookups, Counter):
+            caches = {}
+            for _, key, value in lookups.samples():
+                labels = dict(key)
+                hits, total = caches.get(labels["cache"], (0, 0))
+                caches[labels["cache"]] = (hits + (value if labels["result"] == "hit" else 0), total + value)
+            for cache, (hits, total) in sorted(caches.items()):
+                lines.append(f"缓存命中率[{cache}]: {hits / total:.1%}（{hits:g}/{total:g}）")
+        for name, (_, _, samples) in sorted(self._collected().items()):
+            for _, key, value in samples:
+                lines.append(f"{name}{_format_labels(key)}: {value:g}")
+        return "\n".join(lines)
+
+    def serve(self, port, host="127.0.0.1"):
+        """在后台线程中通过HTTP导出指标（GET /metrics）
+
+        Args:
+            port (int): 监听端口，为0时由系统分配
+            host (str): 监听地址，默认只监听本机
+
+        Returns:
+            int: 实际监听的端口
+        """
+        # http.server只在导出指标时才导入，不影响设备命令的启动耗时
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+        port = self._server.server_address[1]
+        print(f"指标导出: http://{host}:{port}/metrics")
+        return port
+
+    def shutdown(self):
+        """停止指标HTTP服务"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry():
+    """获取进程内共享的指标注册表"""
+    return _registry
+
+
+def record_failure(reason):
+    """按原因记录一次失败
+
+    Args:
+        reason (str): 失败原因，取值应是有限的几种（如device_timeout、llm_error、no_op）
+    """
+    _registry.counter("agent_failures_total", "按原因统计的失败次数").inc(reason=reason)
+
+
+def record_cache(cache, hit):
+    """记录一次缓存查找
+
+    Args:
+        cache (str): 缓存名称
+        hit (bool): 是否命中
+    """
+    _registry.counter("agent_cache_lookups_total", "缓存查找次数").inc(cache=cache, result="hit" if hit else "miss")
@@ -0,0 +1,326 @@
+import collections
+import json
+import os
+import re
+import threading
+import time
+
+# 支持的操作类型
+ACTION_TYPES = ["click", "swipe", "tap", "type", "press_home", "press_back", "press_menu", "screenshot", "launch_app"]
+
+# 文本层的附加提示：无法仅凭文字判断时让模型主动要求升级到视觉层
+TEXT_TIER_HINT = "\n\n如果仅凭以上文字信息无法确定结果（例如需要查看屏幕画面），请只返回 {\"need_screen\": true}。"
+
+
+def allow_need_screen(response_format):
+    """在结构化输出的要求中允许文本层只返回{"need_screen": true}
+
+    Args:
+        response_format (dict): json_schema类型的response_format
+
+    Returns:
+        dict: 增加need_screen字段、不再要求必填字段的response_format，缺失的字段由本地校验发现
+    """
+    if not response_format or response_format.get("type") != "json_schema":
+        return response_format
+    schema = dict(response_format["json_schema"]["schema"])
+    schema["properties"] = dict(schema.get("properties", {}), need_screen={"type": "boolean"})
+    schema["required"] = []
+    return {"type": "json_schema", "json_schema": dict(response_format["json_schema"], schema=schema)}
+
+
+def iter_elements(ui_elements):
+    """从UI元素分析结果中取出元素列表
+
+    视觉模型的返回格式不固定，可能直接是列表，也可能是{"elements": [...]}之类的包装。
+
+    Args:
+        ui_elements (list|dict): UI元素分析结果
+
+    Returns:
+        list: UI元素列表
+    """
+    if isinstance(ui_elements, list):
+        return [element for element in ui_elements if isinstance(element, dict)]
+    if isinstance(ui_elements, dict):
+        for value in ui_elements.values():
+            if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+                return value
+    return []
+
+
+class LocalRules:
+    """本地规则层，处理关键词明确、无需调用模型的任务"""
+
+    # 含有这些连接词的指令通常是多步操作，交给模型处理
+    MULTI_STEP_PATTERN = re.compile(r"然后|并且|接着|之后|再|，|,|;|；")
+    KEY_ACTIONS = [
+        (re.compile(r"^(按下?|点击|回到|返回)?(home|主页|主屏幕|桌面)(键|按钮)?$", re.I), "press_home"),
+        (re.compile(r"^(按下?|点击)?(返回|后退|back)(键|按钮)?$", re.I), "press_back"),
+        (re.compile(r"^(按下?|点击|打开)?(菜单|menu)(键|按钮)?$", re.I), "press_menu"),
+        (re.compile(r"^(截图|截屏|屏幕截图|screenshot)$", re.I), "screenshot"),
+    ]
+    TYPE_PATTERN = re.compile(r"^(?:输入|键入|填写)[:：\s]*(.+)$")
+    CLICK_PATTERN = re.compile(r"^(?:点击|打开|单击|启动|进入|点)\s*(.+)$")
+    SWIPE_PATTERN = re.compile(r"^(?:向)?([上下左右])(?:滑|划|翻)(?:动)?(?:一下)?(?:屏幕)?$")
+    TARGET_SUFFIX_PATTERN = re.compile(r"(按钮|图标|应用|选项)$")
+
+    def _normalize(self, instruction):
+        return (instruction or "").strip().rstrip("。.!！")
+
+    def determine_action_type(self, instruction):
+        """根据关键词确定操作类型
+
+        Args:
+            instruction (str): 自然语言指令
+
+        Returns:
+            str: 操作类型，无法确定时返回None
+        """
+        instruction = self._normalize(instruction)
+        if not instruction or self.MULTI_STEP_PATTERN.search(instruction):
+            return None
+        for pattern, action_type in self.KEY_ACTIONS:
+            if pattern.match(instruction):
+                return action_type
+        if self.TYPE_PATTERN.match(instruction):
+            return "type"
+        if self.SWIPE_PATTERN.match(instruction):
+            return "swipe"
+        return None
+
+    def parse_instruction(self, instruction, ui_elements=None):
+        """将简单指令直接转换为操作步骤
+
+        Args:
+            instruction (str): 自然语言指令
+            ui_elements (list|dict): UI元素分析结果
+
+        Returns:
+            dict: 操作步骤，无法确定时返回None
+        """
+        instruction = self._normalize(instruction)
+        action_type = self.determine_action_type(instruction)
+        if action_type in ("press_home", "press_back", "press_menu", "screenshot"):
+            return {"action": action_type, "params": {}}
+        if action_type == "type":
+            text = self.TYPE_PATTERN.match(instruction).group(1).strip().strip("\"'“”‘’")
+            return {"action": "type", "params": {"text": text}} if text else None
+        if action_type == "swipe":
+            return {"action": "swipe", "description": instruction, "params": {}}
+
+        match = self.CLICK_PATTERN.match(instruction)
+        if match and not self.MULTI_STEP_PATTERN.search(instruction):
+            target = self.find_target_element(match.group(1), ui_elements)
+            if target and isinstance(target.get("position"), list) and len(target["position"]) == 4:
+                return {"action": "click", "target": target, "params": {}}
+        return None
+
+    def find_target_element(self, instruction, ui_elements):
+        """按文本精确匹配目标元素，只有唯一匹配时才返回
+
+        Args:
+            instruction (str): 自然语言指令或目标描述
+            ui_elements (list|dict): UI元素分析结果
+
+        Returns:
+            dict: 目标元素，无法唯一确定时返回None
+        """
+        instruction = self._normalize(instruction)
+        match = self.CLICK_PATTERN.match(instruction)
+        target = match.group(1) if match else instruction
+        target = self.TARGET_SUFFIX_PATTERN.sub("", target.strip())
+        if not target:
+            return None
+
+        elements = iter_elements(ui_elements)
+        labels = [(element, str(element.get("text") or element.get("description") or "").strip()) for element in elements]
+        exact = [element for element, label in labels if label == target]
+        if len(exact) == 1:
+            return exact[0]
+        if exact:
+            return None
+        partial = [element for element, label in labels if label and target in label]
+        return partial[0] if len(partial) == 1 else None
+
+    def extract_swipe_params(self, instruction, screen_size):
+        """根据方向关键词计算滑动参数
+
+        Args:
+            instruction (str): 自然语言指令
+            screen_size (tuple): 屏幕尺寸 (宽度, 高度)
+
+        Returns:
+            dict: 滑动参数，无法确定时返回None
+        """
+        match = self.SWIPE_PATTERN.match(self._normalize(instruction))
+        if not match or not screen_size:
+            return None
+        width, height = screen_size
+        center_x, center_y = width // 2, height // 2
+        direction = match.group(1)
+        if direction == "上":
+            start, end = (center_x, int(height * 0.7)), (center_x, int(height * 0.3))
+        elif direction == "下":
+            start, end = (center_x, int(height * 0.3)), (center_x, int(height * 0.7))
+        elif direction == "左":
+            start, end = (int(width * 0.8), center_y), (int(width * 0.2), center_y)
+        else:
+            start, end = (int(width * 0.2), center_y), (int(width * 0.8), center_y)
+        return {
+            "start_x": start[0],
+            "start_y": start[1],
+            "end_x": end[0],
+            "end_y": end[1],
+            "duration": 300,
+        }
+
+
+class ModelRouter:
+    """模型分级路由：本地规则 -> 小型文本模型 -> 大型多模态模型
+
+    每个任务先尝试本地规则，规则无法处理时交给文本模型；文本模型把握不足
+    （返回need_screen、结果无法解析或置信度低于阈值）且有截图可用时升级到多模态模型。
+    每次升级都会被记录，用于调整阈值。
+    """
+
+    TIER_RULES = "rules"
+    TIER_TEXT = "text"
+    TIER_VISION = "vision"
+
+    def __init__(self, client, text_model_id=None, vision_model_id=None, confidence_threshold=None, log_path=None):
+        """初始化路由器
+
+        Args:
+            client (OpenAICompatibleClient): LLM客户端实例
+            text_model_id (str, optional): 文本层模型，默认读取LLM_TEXT_MODEL_ID，未设置时使用客户端默认模型
+            vision_model_id (str, optional): 视觉层模型，默认读取LLM_VISION_MODEL_ID，未设置时使用客户端默认模型
+            confidence_threshold (float, optional): 低于该置信度时升级，默认读取MODEL_ROUTER_CONFIDENCE或0.6
+            log_path (str, optional): 升级记录的JSONL文件路径，默认读取MODEL_ROUTER_LOG
+        """
+        self.client = client
+        self.rules = LocalRules()
+        self.text_model_id = text_model_id or os.getenv("LLM_TEXT_MODEL_ID") or None
+        self.vision_model_id = vision_model_id or os.getenv("LLM_VISION_MODEL_ID") or None
+        if confidence_threshold is None:
+            confidence_threshold = float(os.getenv("MODEL_ROUTER_CONFIDENCE", "0.6"))
+        self.confidence_threshold = confidence_threshold
+        self.log_path = log_path or os.getenv("MODEL_ROUTER_LOG")
+        self._lock = threading.Lock()
+        self.tier_counts = collections.Counter()
+        self.escalations = collections.deque(maxlen=200)
+
+    def _count(self, task, tier):
+        with self._lock:
+            self.tier_counts[(task, tier)] += 1
+
+    def _record_escalation(self, task, from_tier, to_tier, confidence, reason, quiet=False):
+        """记录一次升级，并追加到日志文件（如已配置）；quiet为True时不输出"""
+        event = {
+            "time": time.time(),
+            "task": task,
+            "from": from_tier,
+            "to": to_tier,
+            "confidence": confidence,
+            "reason": reason,
+        }
+        with self._lock:
+            self.escalations.append(event)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        if not quiet:
+            print(f"模型路由升级: {task} {from_tier} -> {to_tier}（{reason}）")
+
+    def apply_rules(self, task, *args):
+        """尝试用本地规则完成任务
+
+        Args:
+            task (str): 任务名称，对应LocalRules中的同名方法
+            *args: 传给规则方法的参数
+
+        Returns:
+            object: 规则结果，规则无法处理时返回None
+        """
+        handler = getattr(self.rules, task, None)
+        result = handler(*args) if handler else None
+        if result is not None:
+            self._count(task, self.TIER_RULES)
+        return result
+
+    def run(self, task, prompt, system_prompt, parse, screenshot_path=None, needs_pixels=False,
+            response_format=None):
+        """按文本层、视觉层的顺序调用模型
+
+        Args:
+            task (str): 任务名称
+            prompt (str): 提示
+            system_prompt (str): 系统提示
+            parse (callable): 将模型原始输出转换为(结果, 置信度)的函数
+            screenshot_path (str, optional): 当前截图路径，为None时无法升级到视觉层
+            needs_pixels (bool): 任务是否必须查看屏幕画面，为True时跳过文本层
+            response_format (dict, optional): 结构化输出要求，端点支持时随请求发送
+
+        Returns:
+            object: 解析后的结果
+        """
+        # 只在需要时传递response_format，兼容只接受基本参数的客户端
+        options = {"response_format": response_format} if response_format else {}
+        if not needs_pixels or not screenshot_path:
+            text_options = {"response_format": allow_need_screen(response_format)} if response_format else {}
+            result = self.client.generate(prompt + TEXT_TIER_HINT, system_prompt, self.text_model_id, **text_options)
+            self._count(task, self.TIER_TEXT)
+            value, confidence = parse(result)
+            if isinstance(value, dict) and value.get("need_screen"):
+                value, confidence, reason = None, 0.0, "模型要求查看屏幕"
+            elif isinstance(value, dict) and isinstance(value.get("confidence"), (int, float)):
+                confidence = min(confidence, float(value.pop("confidence")))
+                reason = f"置信度{confidence:.2f}低于阈值"
+            else:
+                reason = "结果无法解析或不完整"
+            if confidence >= self.confidence_threshold or not screenshot_path:
+                return value
+            self._record_escalation(task, self.TIER_TEXT, self.TIER_VISION, confidence, reason)
+
+        result = self.client.generate_with_image(prompt, screenshot_path, system_prompt, self.vision_model_id, **options)
+        self._count(task, self.TIER_VISION)
+        value, _ = parse(result)
+        return value
+
+    def extract_elements(self, screenshot_path, layout_elements=None, quiet=False):
+        """获取UI元素：优先使用控件树，控件树不可用时才调用多模态模型
+
+        Args:
+            screenshot_path (str): 截图路径
+            layout_elements (list, optional): dump_layout导出的UI元素
+            quiet (bool): 是否不输出升级记录（用于后台预取）
+
+        Returns:
+            list|dict: UI元素分析结果
+        """
+        if layout_elements:
+            self._count("extract_elements", self.TIER_RULES)
+            return layout_elements
+        from StructuredOutput import (ELEMENT_LIST_PROMPT, ELEMENT_LIST_SCHEMA, ELEMENT_LIST_SYSTEM_PROMPT,
+                                      parse_element_list, response_format)
+        self._record_escalation("extract_elements", self.TIER_RULES, self.TIER_VISION, 0.0, "控件树不可用",
+                                quiet=quiet)
+        # 没有控件树时只能从画面中识别元素，文本模型无从判断，直接交给视觉层
+        try:
+            return self.run("extract_elements", ELEMENT_LIST_PROMPT, ELEMENT_LIST_SYSTEM_PROMPT,
+                            lambda result: (parse_element_list(result), 1.0), screenshot_path, needs_pixels=True,
+                            response_format=response_format("ui_elements", ELEMENT_LIST_SCHEMA))
+        except Exception as e:
+            return {"error": str(e)}
+
+    def get_stats(self):
+        """获取各层的调用次数和最近的升级记录
+
+        Returns:
+            dict: 路由统计
+        """
+        with self._lock:
+            return {
+                "tiers": {f"{task}/{tier}": count for (task, tier), count in self.tier_counts.items()},
+                "escalations": list(self.escalations),
+            }
@@ -1,11 +1,94 @@
 import os
 import base64
-import json
-from openai import OpenAI
-from dotenv import load_dotenv
+import hashlib
+import threading
+import time
+from Metrics import get_registry, record_failure
+from RateLimiter import CircuitOpenError, compute_backoff, get_circuit_breaker, get_rate_limiter, parse_retry_after
+from StructuredOutput import (ELEMENT_LIST_PROMPT, ELEMENT_LIST_SCHEMA, ELEMENT_LIST_SYSTEM_PROMPT, parse_element_list,
+                              response_format as schema_format)
 
-# 加载环境变量
-load_dotenv()
+# openai和dotenv在首次创建客户端时才导入，只使用设备功能的命令不需要承担导入开销
+_env_loaded = False
+
+
+def load_env():
+    """加载.env中的环境变量（只执行一次）"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+# 可重试的HTTP状态码：限流和服务端临时错误
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+LLM_REQUEST_SECONDS = get_registry().histogram("llm_request_seconds", "LLM单次请求耗时（秒），按模型和结果")
+LLM_TOKENS = get_registry().counter("llm_tokens_total", "LLM消耗的token数，按模型和类型")
+
+# 端点拒绝response_format时返回的状态码
+FORMAT_REJECTED_STATUS_CODES = {400, 404, 422}
+# 错误信息中包含这些内容（不区分大小写）才认为被拒绝的是response_format，而不是上下文过长等其他请求错误
+FORMAT_REJECTED_HINTS = ("response_format", "json_schema", "json_object", "unsupported parameter",
+                         "unknown parameter", "unrecognized request argument")
+# 记录为不支持的格式在该时间（秒）后重新探测，端点升级或临时故障后可以恢复
+FORMAT_RECHECK_SECONDS = 3600
+
+# 各端点、模型对结构化输出的支持情况：(base_url, 模型, 格式类型) -> (是否支持, 记录时间)，进程内共享
+_format_support = {}
+_format_support_lock = threading.Lock()
+
+
+def get_format_support(base_url, model_id, format_type):
+    """查询端点对某种response_format的支持情况
+
+    Returns:
+        bool: 是否支持，尚未探测或不支持的记录已超过FORMAT_RECHECK_SECONDS时返回None
+    """
+    with _format_support_lock:
+        entry = _format_support.get((base_url, model_id, format_type))
+    if entry is None:
+        return None
+    supported, recorded_at = entry
+    if not supported and time.monotonic() - recorded_at >= FORMAT_RECHECK_SECONDS:
+        return None
+    return supported
+
+
+def set_format_support(base_url, model_id, format_type, supported):
+    """记录端点对某种response_format的支持情况"""
+    with _format_support_lock:
+        _format_support[(base_url, model_id, format_type)] = (supported, time.monotonic())
+
+
+def is_format_rejection(error):
+    """判断请求错误是否由response_format引起
+
+    Args:
+        error (Exception): 调用接口时抛出的异常
+
+    Returns:
+        bool: 状态码表示参数错误，且错误信息提到response_format或不支持的参数
+    """
+    if getattr(error, "status_code", None) not in FORMAT_REJECTED_STATUS_CODES:
+        return False
+    text = f"{error} {getattr(error, 'body', None) or ''}".lower()
+    return any(hint in text for hint in FORMAT_REJECTED_HINTS)
+
+
+def _env_int(name):
+    """读取整数类型的环境变量，未设置或为空时返回None"""
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+class LLMRequestError(Exception):
+    """调用LLM接口失败，保留状态码和是否可重试等信息"""
+
+    def __init__(self, message, status_code=None, retryable=False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
 
 
 class OpenAICompatibleClient:
@@ -19,22 +102,235 @@ class OpenAICompatibleClient:
             base_url (str, optional): API基础URL
             model_id (str, optional): 模型ID
         """
+        load_env()
         self.api_key = api_key or os.getenv("LLM_API_KEY")
         self.base_url = base_url or os.getenv("LLM_BASE_URL", "https://api.deepseek.com")
         self.model_id = model_id or os.getenv("LLM_MODEL_ID", "deepseek-chat")
 
-        # 创建OpenAI客户端
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url,
+        self.max_retries = _env_int("LLM_MAX_RETRIES")
+        if self.max_retries is None:
+            self.max_retries = 3
+        # 结构化输出模式：auto按端点支持情况依次尝试json_schema、json_object；json_object只用JSON模式；off不发送
+        self.response_format_mode = os.getenv("LLM_RESPONSE_FORMAT", "auto").lower()
+
+        # OpenAI客户端在第一次请求时创建
+        self._client = None
+        self._client_lock = threading.Lock()
+
+        # 同一API密钥共享限流器，同一端点共享熔断器
+        key_digest = hashlib.sha256((self.api_key or "").encode("utf-8")).hexdigest()[:12]
+        self.rate_limiter = get_rate_limiter(
+            f"{self.base_url}|{key_digest}",
+            requests_per_minute=_env_int("LLM_RPM"),
+            tokens_per_minute=_env_int("LLM_TPM"),
         )
+        self.circuit_breaker = get_circuit_breaker(self.base_url)
+        self._metrics_lock = threading.Lock()
+        self.metrics = {
+            "requests": 0,
+            "retries": 0,
+            "failures": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "format_fallbacks": 0,
+        }
+
+    @property
+    def client(self):
+        """底层的OpenAI客户端，首次访问时导入openai并创建"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    # 重试由本类统一处理，避免SDK内部重试叠加
+                    self._client = OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        max_retries=0,
+                    )
+        return self._client
+
+    @staticmethod
+    def _estimate_tokens(messages):
+        """粗略估算请求消耗的token数，用于请求前预占限流配额
+
+        Args:
+            messages (list): 聊天消息列表
+
+        Returns:
+            int: 估算的token数
+        """
+        total = 0
+        for message in messages:
+            content = message["content"]
+            if isinstance(content, str):
+                total += len(content) // 2 + 4
+                continue
+            for part in content:
+                if part.get("type") == "text":
+                    total += len(part["text"]) // 2 + 4
+                else:
+                    # 图片按高分辨率图片的典型消耗估算
+                    total += 765
+        return max(total, 1)
+
+    @staticmethod
+    def _classify_error(error):
+        """判断异常是否可重试，并提取服务端给出的Retry-After
+
+        Args:
+            error (Exception): 调用接口时抛出的异常
+
+        Returns:
+            tuple: (是否可重试, 状态码, Retry-After秒数)
+        """
+        status_code = getattr(error, "status_code", None)
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("retry-after"))
+        if status_code is not None:
+            return status_code in RETRYABLE_STATUS_CODES, status_code, retry_after
+        # 连接错误、超时等没有状态码的异常
+        name = type(error).__name__
+        return name in ("APIConnectionError", "APITimeoutError"), None, retry_after
+
+    def _record(self, key, value=1):
+        """累加客户端指标"""
+        with self._metrics_lock:
+            self.metrics[key] += value
+
+    def _negotiate_format(self, model_id, response_format, rejected=()):
+        """根据配置和端点的支持情况选择本次请求实际发送的response_format
+
+        Args:
+            model_id (str): 本次请求使用的模型
+            response_format (dict): 调用方期望的结构化输出格式
+            rejected (set): 本次请求中已被端点拒绝的格式类型
+
+        Returns:
+            dict: 实际发送的response_format，不发送时返回None
+        """
+        if not response_format or self.response_format_mode == "off":
+            return None
+        candidates = [response_format, {"type": "json_object"}]
+        if self.response_format_mode == "json_object" or response_format.get("type") == "json_object":
+            candidates = candidates[1:]
+        for candidate in candidates:
+            if candidate["type"] not in rejected and get_format_support(
+                    self.base_url, model_id, candidate["type"]) is not False:
+                return candidate
+        return None
+
+    def _send(self, messages, model_id, response_format=None):
+        """发送一次请求；端点拒绝response_format时记录下来，并降级后立即重发
 
-    def generate(self, prompt, system_prompt=None):
+        降级重发不计入重试次数，也不影响熔断器：被拒绝的只是参数，端点本身是健康的。
+        其他原因的400/404/422（如上下文过长、模型不存在）照常抛出，不影响格式的支持记录。
+        """
+        rejected = set()
+        while True:
+            sent_format = self._negotiate_format(model_id, response_format, rejected)
+            options = {"response_format": sent_format} if sent_format else {}
+            try:
+                response = self.client.chat.completions.create(model=model_id, messages=messages, **options)
+            except Exception as e:
+                if sent_format and is_format_rejection(e):
+                    set_format_support(self.base_url, model_id, sent_format["type"], False)
+                    rejected.add(sent_format["type"])
+                    self._record("format_fallbacks")
+                    print(f"端点不支持response_format={sent_format['type']}，降级后重新请求")
+                    continue
+                raise
+            if sent_format:
+                set_format_support(self.base_url, model_id, sent_format["type"], True)
+            return response
+
+    def _create_completion(self, messages, model_id=None, response_format=None):
+        """带限流、重试和熔断的聊天补全调用
+
+        Args:
+            messages (list): 聊天消息列表
+            model_id (str, optional): 本次请求使用的模型，默认使用self.model_id
+            response_format (dict, optional): 期望的结构化输出格式，端点不支持时自动降级
+
+        Returns:
+            object: 接口响应
+
+        Raises:
+            CircuitOpenError: 端点熔断中
+            LLMRequestError: 不可重试的错误或重试次数耗尽
+        """
+        estimated_tokens = self._estimate_tokens(messages)
+        model_id = model_id or self.model_id
+        for attempt in range(self.max_retries + 1):
+            if not self.circuit_breaker.allow():
+                self._record("failures")
+                record_failure("llm_circuit_open")
+                raise CircuitOpenError(
+                    f"API端点 {self.base_url} 连续失败已熔断，"
+                    f"{self.circuit_breaker.remaining_open_time():.1f}秒后重试"
+                )
+            self.rate_limiter.acquire(estimated_tokens)
+            self._record("requests")
+            started = time.monotonic()
+            try:
+                response = self._send(messages, model_id, response_format)
+            except Exception as e:
+                LLM_REQUEST_SECONDS.observe(time.monotonic() - started, model=model_id, outcome="error")
+                retryable, status_code, retry_after = self._classify_error(e)
+                if status_code == 429 or (status_code is not None and status_code < 500 and not retryable):
+                    # 429只代表配额不足，由限流器处理；其他4xx（如401/403密钥无效）说明请求本身有问题，
+                    # 都不能证明端点健康，不计入成功也不计入故障，只释放半开状态的探测名额
+                    self.circuit_breaker.release_probe()
+                else:
+                    # 5xx、408等可重试的错误，以及没有状态码的异常（连接错误、响应无法解析等）都计入端点故障
+                    self.circuit_breaker.record_failure()
+                if not retryable or attempt == self.max_retries:
+                    self._record("failures")
+                    record_failure("llm_error")
+                    raise LLMRequestError(str(e), status_code=status_code, retryable=retryable) from e
+                if retry_after is not None:
+                    self.rate_limiter.penalize(retry_after)
+                delay = compute_backoff(attempt, retry_after=retry_after)
+                print(f"LLM请求失败（{status_code or type(e).__name__}），{delay:.1f}秒后第{attempt + 1}次重试")
+                self._record("retries")
+                time.sleep(delay)
+                continue
+
+            LLM_REQUEST_SECONDS.observe(time.monotonic() - started, model=model_id, outcome="success")
+            self.circuit_breaker.record_success()
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                self.rate_limiter.adjust(estimated_tokens, usage.total_tokens)
+                self._record("prompt_tokens", usage.prompt_tokens or 0)
+                self._record("completion_tokens", usage.completion_tokens or 0)
+                LLM_TOKENS.inc(usage.prompt_tokens or 0, model=model_id, type="prompt")
+                LLM_TOKENS.inc(usage.completion_tokens or 0, model=model_id, type="completion")
+            return response
+
+    def get_metrics(self):
+        """获取客户端、共享限流器和熔断器的运行指标
+
+        Returns:
+            dict: 指标快照
+        """
+        with self._metrics_lock:
+            client_metrics = dict(self.metrics)
+        return {
+            "client": client_metrics,
+            "rate_limiter": dict(self.rate_limiter.metrics),
+            "circuit_breaker": dict(self.circuit_breaker.metrics, state=self.circuit_breaker.state),
+        }
+
+    def generate(self, prompt, system_prompt=None, model_id=None, response_format=None):
         """生成文本回复
 
         Args:
             prompt (str): 用户输入的提示
             system_prompt (str, optional): 系统提示
+            model_id (str, optional): 本次请求使用的模型，默认使用self.model_id
+            response_format (dict, optional): 期望的结构化输出格式
 
         Returns:
             str: 生成的回复
@@ -44,82 +340,101 @@ class OpenAICompatibleClient:
             messages.append({"role": "system", "content": system_prompt})
         messages.append({"role": "user", "content": prompt})
 
-        response = self.client.chat.completions.create(
-            model=self.model_id,
-            messages=messages,
-        )
+        response = self._create_completion(messages, model_id, response_format)
 
         return response.choices[0].message.content.strip()
     
-    def generate_with_image(self, prompt, image_path, system_prompt=None):
+    def chat(self, messages, model_id=None, response_format=None):
+        """按完整的消息列表生成回复
+
+        调用方自行组织多轮消息（如固定的系统提示和任务前缀加上变化的观察内容），
+        便于服务端对不变的前缀做缓存。
+
+        Args:
+            messages (list): 聊天消息列表，内容可以是文本或包含图片的列表
+            model_id (str, optional): 本次请求使用的模型，默认使用self.model_id
+            response_format (dict, optional): 期望的结构化输出格式
+
+        Returns:
+            str: 生成的回复
+        """
+        response = self._create_completion(messages, model_id, response_format)
+        return response.choices[0].message.content.strip()
+
+    @staticmethod
+    def image_part(image_path):
+        """将图片文件转换为消息中的图片内容
+
+        Args:
+            image_path (str): 图片路径
+
+        Returns:
+            dict: image_url类型的消息内容
+        """
+        with open(image_path, "rb") as image_file:
+            base64_image = base64.b64encode(image_file.read()).decode("utf-8")
+        return {
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:image/jpeg;base64,{base64_image}"
+            }
+        }
+
+    def generate_with_image(self, prompt, image_path, system_prompt=None, model_id=None, response_format=None):
         """生成带图片的回复
 
         Args:
             prompt (str): 用户输入的提示
             image_path (str): 图片路径
             system_prompt (str, optional): 系统提示
+            model_id (str, optional): 本次请求使用的模型，默认使用self.model_id
+            response_format (dict, optional): 期望的结构化输出格式
 
         Returns:
             str: 生成的回复
         """
-        # 读取图片并转换为base64
-        with open(image_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode("utf-8")
-        
         messages = []
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         
-        # 构建消息内容
+        # 构建消息内容，图片以base64形式内嵌
         messages.append({
             "role": "user",
             "content": [
                 {"type": "text", "text": prompt},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{base64_image}"
-                    }
-                }
+                self.image_part(image_path),
             ]
         })
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_id,
-                messages=messages,
-            )
+            response = self._create_completion(messages, model_id, response_format)
             return response.choices[0].message.content.strip()
-        except Exception as e:
+        except CircuitOpenError:
+            raise
+        except LLMRequestError as e:
             error_msg = str(e)
             if "unknown variant `image_url`" in error_msg:
-                raise Exception(f"当前API不支持多模态功能。错误信息: {error_msg}\n请检查以下几点:\n1. 模型ID是否正确\n2. 是否使用了支持多模态的API服务\n3. API端点是否正确")
+                raise LLMRequestError(f"当前API不支持多模态功能。错误信息: {error_msg}\n请检查以下几点:\n1. 模型ID是否正确\n2. 是否使用了支持多模态的API服务\n3. API端点是否正确", e.status_code)
             elif "Model Not Exist" in error_msg:
-                raise Exception(f"当前模型 {self.model_id} 不存在。请检查模型ID是否正确。")
-            raise Exception(f"调用多模态API时发生错误: {e}")
+                raise LLMRequestError(f"当前模型 {model_id or self.model_id} 不存在。请检查模型ID是否正确。", e.status_code)
+            raise LLMRequestError(f"调用多模态API时发生错误: {e}", e.status_code, e.retryable)
     
 
     
-    def extract_elements_from_image(self, image_path):
+    def extract_elements_from_image(self, image_path, model_id=None):
         """从图片中提取元素及其位置
 
         Args:
             image_path (str): 图片路径
+            model_id (str, optional): 使用的多模态模型，默认使用self.model_id
 
         Returns:
             dict: 包含图片中元素及其位置的字典
         """
-        prompt = "请分析这张图片，识别所有可见的UI元素（如按钮、输入框、文本区域、图标等），并返回它们的位置信息。每个元素需要包含类型、位置（x, y坐标和宽度、高度）、以及描述。请以JSON格式返回结果，确保格式正确。"
-        
-        system_prompt = "你是一个精确的UI元素分析助手，能够准确识别图片中的UI元素及其位置。"
-        
         try:
-            result = self.generate_with_image(prompt, image_path, system_prompt)
-            # 尝试解析JSON响应
-            try:
-                return json.loads(result)
-            except json.JSONDecodeError:
-                # 如果响应不是有效的JSON，返回原始文本
-                return {"text": result}
+            result = self.generate_with_image(ELEMENT_LIST_PROMPT, image_path, ELEMENT_LIST_SYSTEM_PROMPT, model_id,
+                                              response_format=schema_format("ui_elements", ELEMENT_LIST_SCHEMA))
         except Exception as e:
             return {"error": str(e)}
+        # 本地提取和修复JSON，缺少有效位置的元素直接丢弃，不再整张图重新分析
+        return parse_element_list(result)
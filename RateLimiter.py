@@ -0,0 +1,355 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+
+from Metrics import get_registry
+
+
+class TokenBucket:
+    """令牌桶，按固定速率补充令牌，线程安全"""
+
+    def __init__(self, capacity, refill_per_second):
+        """初始化令牌桶
+
+        Args:
+            capacity (float): 桶容量（最大突发量）
+            refill_per_second (float): 每秒补充的令牌数
+        """
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        """按经过的时间补充令牌（调用方需持有锁）"""
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self.updated_at = now
+
+    def reserve(self, amount, now):
+        """预占令牌，返回需要等待的秒数（调用方需持有锁）
+
+        令牌允许透支：预占后余额为负时，调用方等待余额回到0所需的时间即可，
+        这样等待发生在锁外，多个线程/协程按预占顺序排队。
+
+        Args:
+            amount (float): 需要的令牌数
+            now (float): 当前单调时间
+
+        Returns:
+            float: 需要等待的秒数
+        """
+        self._refill(now)
+        self.tokens -= min(float(amount), self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.refill_per_second
+
+    def refund(self, amount, now):
+        """归还（或在amount为负时追加扣除）令牌（调用方需持有锁）"""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """客户端限流器，同时限制每分钟请求数和每分钟token数
+
+    同一个API密钥下的所有客户端共享一个实例（见get_rate_limiter），
+    既可在线程中使用acquire，也可在asyncio任务中使用acquire_async。
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        """初始化限流器
+
+        Args:
+            requests_per_minute (int, optional): 每分钟最大请求数，None表示不限制
+            tokens_per_minute (int, optional): 每分钟最大token数，None表示不限制
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._lock = threading.Lock()
+        self._request_bucket = TokenBucket(requests_per_minute, requests_per_minute / 60.0) if requests_per_minute else None
+        self._token_bucket = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0) if tokens_per_minute else None
+        self._blocked_until = 0.0
+        self.metrics = {
+            "acquired": 0,
+            "throttled": 0,
+            "waited_seconds": 0.0,
+            "penalties": 0,
+        }
+
+    def _reserve(self, tokens):
+        """预占一次请求所需的配额，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._blocked_until - now)
+            if self._request_bucket:
+                wait = max(wait, self._request_bucket.reserve(1, now))
+            if self._token_bucket:
+                wait = max(wait, self._token_bucket.reserve(tokens, now))
+            self.metrics["acquired"] += 1
+            if wait > 0:
+                self.metrics["throttled"] += 1
+                self.metrics["waited_seconds"] += wait
+            return wait
+
+    def acquire(self, tokens=1):
+        """阻塞直到可以发起请求
+
+        Args:
+            tokens (int): 预估本次请求消耗的token数
+
+        Returns:
+            float: 实际等待的秒数
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=1):
+        """协程版本的acquire，等待期间不阻塞事件循环
+
+        Args:
+            tokens (int): 预估本次请求消耗的token数
+
+        Returns:
+            float: 实际等待的秒数
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def adjust(self, estimated_tokens, actual_tokens):
+        """根据响应中的实际用量修正token桶
+
+        Args:
+            estimated_tokens (int): 请求前预估的token数
+            actual_tokens (int): 响应返回的实际token数
+        """
+        if not self._token_bucket or actual_tokens is None:
+            return
+        with self._lock:
+            self._token_bucket.refund(estimated_tokens - actual_tokens, time.monotonic())
+
+    def penalize(self, seconds):
+        """服务端要求退避时（如429的Retry-After），暂停所有共享此限流器的请求
+
+        Args:
+            seconds (float): 暂停秒数
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self.metrics["penalties"] += 1
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态时拒绝请求"""
+
+
+class CircuitBreaker:
+    """单个API端点的熔断器
+
+    连续失败达到阈值后打开，在recovery_timeout内直接拒绝请求；
+    超时后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30.0):
+        """初始化熔断器
+
+        Args:
+            failure_threshold (int): 触发熔断的连续失败次数
+            recovery_timeout (float): 熔断后多久尝试恢复（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.metrics = {
+            "opened": 0,
+            "rejected": 0,
+            "failures": 0,
+            "successes": 0,
+        }
+
+    def allow(self):
+        """判断当前是否允许发起请求
+
+        Returns:
+            bool: 是否允许
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    self.metrics["rejected"] += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.metrics["rejected"] += 1
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        """记录一次成功请求"""
+        with self._lock:
+            self.metrics["successes"] += 1
+            self._failures = 0
+            self._probe_in_flight = False
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        """记录一次失败请求"""
+        with self._lock:
+            self.metrics["failures"] += 1
+            self._failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.metrics["opened"] += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        """释放半开状态的探测名额，用于既不算成功也不算失败的结果（如429）
+
+        探测请求被限流说明端点尚未恢复到可以接收请求的状态，重新打开熔断器并重新计时，
+        等待recovery_timeout后再放行下一个探测请求；其他状态下不做任何改变。
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probe_in_flight:
+                self._probe_in_flight = False
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def remaining_open_time(self):
+        """熔断器距离进入半开状态还剩多少秒
+
+        Returns:
+            float: 剩余秒数，未打开时为0
+        """
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+
+
+def compute_backoff(attempt, base_delay=1.0, max_delay=60.0, retry_after=None):
+    """计算带抖动的指数退避时间（full jitter）
+
+    Args:
+        attempt (int): 第几次重试（从0开始）
+        base_delay (float): 基础延迟（秒）
+        max_delay (float): 最大延迟（秒）
+        retry_after (float, optional): 服务端给出的Retry-After（秒），作为下限
+
+    Returns:
+        float: 需要等待的秒数
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def parse_retry_after(value):
+    """解析Retry-After响应头，支持秒数和HTTP日期两种格式
+
+    Args:
+        value (str): 响应头的值
+
+    Returns:
+        float: 秒数，无法解析时返回None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# 进程内共享的限流器和熔断器，按API密钥/端点区分
+_registry_lock = threading.Lock()
+_rate_limiters = {}
+_circuit_breakers = {}
+
+
+def get_rate_limiter(key, requests_per_minute=None, tokens_per_minute=None):
+    """获取共享的限流器，同一个key只会创建一次
+
+    Args:
+        key (str): 共享范围标识（通常为端点加API密钥）
+        requests_per_minute (int, optional): 每分钟最大请求数
+        tokens_per_minute (int, optional): 每分钟最大token数
+
+    Returns:
+        RateLimiter: 限流器实例
+    """
+    with _registry_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+            _rate_limiters[key] = limiter
+        return limiter
+
+
+def get_circuit_breaker(endpoint, failure_threshold=5, recovery_timeout=30.0):
+    """获取端点对应的共享熔断器
+
+    Args:
+        endpoint (str): API端点
+        failure_threshold (int): 触发熔断的连续失败次数
+        recovery_timeout (float): 熔断后多久尝试恢复（秒）
+
+    Returns:
+        CircuitBreaker: 熔断器实例
+    """
+    with _registry_lock:
+        breaker = _circuit_breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(failure_threshold, recovery_timeout)
+            _circuit_breakers[endpoint] = breaker
+        return breaker
+
+
+def collect_metrics():
+    """导出所有共享限流器和熔断器的统计，供指标注册表采集
+
+    Returns:
+        list: 每项为(指标名, 类型, 说明, 标签, 值)
+    """
+    with _registry_lock:
+        limiters = list(_rate_limiters.items())
+        breakers = list(_circuit_breakers.items())
+    items = []
+    for key, limiter in limiters:
+        for name, value in limiter.metrics.items():
+            items.append((f"llm_rate_limiter_{name}_total", "counter", "LLM客户端限流统计", {"limiter": key}, value))
+    for endpoint, breaker in breakers:
+        for name, value in breaker.metrics.items():
+            items.append((f"llm_circuit_breaker_{name}_total", "counter", "LLM端点熔断统计", {"endpoint": endpoint}, value))
+        items.append(("llm_circuit_breaker_open", "gauge", "熔断器是否打开（半开为0.5）", {"endpoint": endpoint},
+                      {CircuitBreaker.OPEN: 1, CircuitBreaker.HALF_OPEN: 0.5}.get(breaker.state, 0)))
+    return items
+
+
+get_registry().register_collector("rate_limiter", collect_metrics)
@@ -0,0 +1,185 @@
+import contextlib
+import shutil
+import threading
+
+from FrameAnalysis import changed_ratio, compute_signature, frame_difference
+from Metrics import get_registry, record_cache
+
+PREFETCH_ANALYSES = get_registry().counter("agent_prefetch_analyses_total", "等待输入时预先进行的界面分析，按结果")
+
+
+class ScreenPrefetcher:
+    """空闲时的界面预取：等待用户输入指令时在后台截图、计算画面指纹并预先分析UI元素
+
+    后台线程按poll_interval截取低分辨率画面。画面与上一次轮询相同（已稳定）、且与已分析的画面
+    不同时，才截取完整截图并调用analyze，因此每次界面变化最多触发一次分析（一次模型请求）。
+    指令到达时再截取一帧比较，画面没有变化就直接使用预取的截图和分析结果。
+    后台线程中的截图不输出日志；analyze同样在后台线程中调用，不应输出，以免打断用户输入。
+    """
+
+    def __init__(self, device_manager, analyze, screenshot_path, frame_size=(144, 256), threshold=0.01,
+                 noise_threshold=0.002, poll_interval=0.5):
+        """初始化界面预取
+
+        Args:
+            device_manager (HarmonyDeviceManager): 设备管理器实例
+            analyze (callable): 分析函数，参数为截图路径，返回分析结果，失败时返回None；在后台线程中调用，不应输出
+            screenshot_path (str): 预取截图的保存路径，不能与代理的截图路径相同
+            frame_size (tuple): 用于比较的低分辨率画面尺寸 (宽, 高)
+            threshold (float): 相邻两次轮询的差异低于该值视为画面已稳定
+            noise_threshold (float): 与已分析画面的变化比例不超过该值才视为同一画面
+            poll_interval (float): 两次轮询之间的间隔（秒）
+        """
+        self.device_manager = device_manager
+        self.analyze = analyze
+        self.screenshot_path = screenshot_path
+        self.frame_size = frame_size
+        self.threshold = threshold
+        self.noise_threshold = noise_threshold
+        self.poll_interval = poll_interval
+        self.stats = {"polls": 0, "analyses": 0, "failed": 0, "cancelled": 0, "hits": 0, "misses": 0}
+        # _lock保护预取结果；_work_lock在一次轮询或取用结果期间持有，暂停时用于等待进行中的工作
+        self._lock = threading.Lock()
+        self._work_lock = threading.Lock()
+        self._active = threading.Event()
+        self._cancel = threading.Event()
+        self._analyzed = None
+        self._result = None
+        self._ready = False
+        self._running = False
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self):
+        """启动后台线程（处于暂停状态，调用resume或idle后才开始预取）"""
+        if self._running:
+            return
+        self._running = True
+        self._cancel.set()
+        self._thread = threading.Thread(target=self._run, name="screen-prefetcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程"""
+        if not self._running:
+            return
+        self._running = False
+        self._cancel.set()
+        self._active.set()
+        self._thread.join()
+        self._thread = None
+
+    def resume(self):
+        """开始在后台预取"""
+        self._cancel.clear()
+        self._active.set()
+
+    def pause(self):
+        """暂停预取，并等待进行中的截图或分析结束
+
+        尚未开始的分析会被取消；已经发出的模型请求无法中断，但它分析的正是当前画面，
+        等待它完成比指令到达后重新请求更快。
+        """
+        self._active.clear()
+        self._cancel.set()
+        with self._work_lock:
+            with self._lock:
+                self._ready = True
+
+    @contextlib.contextmanager
+    def idle(self):
+        """空闲期间的上下文：进入时开始预取，退出时暂停预取"""
+        self.resume()
+        try:
+            yield self
+        finally:
+            self.pause()
+
+    def take(self, screenshot_path):
+        """取用预取的结果：当前画面与预取时相同才返回，每个空闲期最多取用一次
+
+        Args:
+            screenshot_path (str): 预取的截图复制到该路径
+
+        Returns:
+            object: 预取的分析结果，没有可用结果或画面已变化时返回None
+        """
+        with self._work_lock:
+            with self._lock:
+                ready, analyzed, result = self._ready, self._analyzed, self._result
+                self._ready = False
+            if not ready or analyzed is None or result is None:
+                return None
+            frame = self.device_manager.capture_frame(*self.frame_size, channel="prefetch")
+            hit = frame is not None and changed_ratio(compute_signature(frame), analyzed) <= self.noise_threshold
+            record_cache("prefetch", hit)
+            if not hit:
+                self.stats["misses"] += 1
+                return None
+            try:
+                shutil.copyfile(self.screenshot_path, screenshot_path)
+            except OSError as e:
+                print(f"复制预取截图失败: {str(e)}")
+                return None
+            self.stats["hits"] += 1
+            return result
+
+    def _run(self):
+        previous = None
+        while self._running:
+            self._active.wait()
+            if not self._running:
+                break
+            with self._work_lock:
+                if not self._cancel.is_set():
+                    previous = self._poll(previous)
+            self._cancel.wait(self.poll_interval)
+
+    def _poll(self, previous):
+        """截取一帧，画面稳定且尚未分析时进行分析
+
+        Returns:
+            FrameSignature: 本次画面的指纹，截取失败时返回None
+        """
+        frame = self.device_manager.capture_frame(*self.frame_size, channel="prefetch")
+        if not frame:
+            return None
+        self.stats["polls"] += 1
+        signature = compute_signature(frame)
+        with self._lock:
+            analyzed = self._analyzed
+        if analyzed is not None and changed_ratio(signature, analyzed) <= self.noise_threshold:
+            return signature
+        if previous is None or frame_difference(signature, previous) >= self.threshold:
+            # 画面可能仍在变化，下一次轮询确认稳定后再分析
+            return signature
+        self._analyze(signature)
+        return signature
+
+    def _analyze(self, signature):
+        if not self.device_manager.get_screenshot(self.screenshot_path, quiet=True):
+            return
+        if self._cancel.is_set():
+            # 截图期间用户已输入指令，不再发起分析
+            self.stats["cancelled"] += 1
+            PREFETCH_ANALYSES.inc(result="cancelled")
+            return
+        # 分析前就记下画面指纹：分析失败时同一画面也不会再次请求
+        with self._lock:
+            self._analyzed = signature
+            self._result = None
+        self.stats["analyses"] += 1
+        try:
+            result = self.analyze(self.screenshot_path)
+        except Exception:
+            # 失败只计数：指令到达时会重新分析，届时的错误会正常输出
+            result = None
+        if not result:
+            self.stats["failed"] += 1
+        PREFETCH_ANALYSES.inc(result="analyzed" if result else "failed")
+        with self._lock:
+            if self._analyzed is signature:
+                self._result = result or None
@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+
+from FrameAnalysis import compute_signature, frame_difference
+from Metrics import get_registry, record_cache
+
+SETTLE_SECONDS = get_registry().histogram("agent_settle_seconds", "操作后等待界面稳定的耗时（秒）")
+
+
+class ScreenSettleDetector:
+    """界面稳定检测器，判断操作后的动画是否已经结束
+
+    连续截取低分辨率画面，当连续stable_frames次相邻两帧的差异都小于threshold时
+    认为界面已稳定；最长等待max_wait秒。每个应用的典型稳定耗时会被学习，
+    下次等待时先跳过该应用已知的动画时间再开始轮询，减少无效截图。
+    """
+
+    def __init__(self, device_manager, stable_frames=2, threshold=0.01, poll_interval=0.05,
+                 max_wait=3.0, frame_size=(144, 256), profile_path=None):
+        """初始化界面稳定检测器
+
+        Args:
+            device_manager (HarmonyDeviceManager): 设备管理器实例
+            stable_frames (int): 需要连续多少次差异低于阈值
+            threshold (float): 相邻两帧的差异阈值（0到1）
+            poll_interval (float): 两次截取之间的最小间隔（秒）
+            max_wait (float): 最长等待时间（秒）
+            frame_size (tuple): 截取画面的尺寸 (宽, 高)
+            profile_path (str, optional): 各应用典型稳定耗时的保存路径，为None时只保存在内存中
+        """
+        self.device_manager = device_manager
+        self.stable_frames = stable_frames
+        self.threshold = threshold
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.frame_size = frame_size
+        self.profile_path = profile_path
+        self.frame_source = None
+        self._lock = threading.Lock()
+        self.typical_settle_times = {}
+        if profile_path and os.path.exists(profile_path):
+            with open(profile_path, "r", encoding="utf-8") as f:
+                self.typical_settle_times = json.load(f)
+
+    def capture(self):
+        """截取一帧用于比较的画面"""
+        if self.frame_source:
+            return self.frame_source()
+        return self.device_manager.capture_frame(*self.frame_size)
+
+    def _learn(self, app_key, settle_time):
+        """用指数滑动平均更新应用的典型稳定耗时"""
+        with self._lock:
+            previous = self.typical_settle_times.get(app_key)
+            if previous is None:
+                self.typical_settle_times[app_key] = settle_time
+            else:
+                self.typical_settle_times[app_key] = previous * 0.7 + settle_time * 0.3
+            if self.profile_path:
+                with open(self.profile_path, "w", encoding="utf-8") as f:
+                    json.dump(self.typical_settle_times, f, ensure_ascii=False, indent=2)
+
+    def current_app_key(self):
+        """当前前台应用的包名，作为学习稳定耗时的应用标识，获取失败时返回"default"
+
+        导出控件树时记录的前台应用往往已经过时，这里直接查询前台页面。
+        """
+        activity = self.device_manager.get_foreground_activity()
+        return activity.split("/", 1)[0] if activity else "default"
+
+    def wait_for_settle(self, app_key=None):
+        """等待界面稳定
+
+        Args:
+            app_key (str, optional): 应用标识，用于学习和使用该应用的典型稳定耗时，默认查询当前前台应用
+
+        Returns:
+            dict: 检测结果，包含settled（是否稳定）、elapsed（总耗时）、
+                  settle_time（画面最后一次变化的时间）、frames（截取帧数）和signature（最后一帧的画面指纹）
+        """
+        if app_key is None:
+            app_key = self.current_app_key()
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        typical = self.typical_settle_times.get(app_key)
+        # 命中已学习的稳定耗时即可跳过已知的动画时间
+        record_cache("settle_profile", bool(typical))
+        if typical:
+            # 跳过已知的动画时间，只留出一半余量用于确认
+            time.sleep(min(typical * 0.5, self.max_wait))
+
+        previous = None
+        stable_count = 0
+        frames = 0
+        last_change = time.monotonic() - start
+        while True:
+            poll_start = time.monotonic()
+            data = self.capture()
+            if data:
+                frames += 1
+                signature = compute_signature(data)
+                if previous is not None:
+                    if frame_difference(previous, signature) < self.threshold:
+                        stable_count += 1
+                    else:
+                        stable_count = 0
+                        last_change = time.monotonic() - start
+                previous = signature
+                if stable_count >= self.stable_frames:
+                    self._learn(app_key, last_change)
+                    elapsed = time.monotonic() - start
+                    SETTLE_SECONDS.observe(elapsed, settled="true")
+                    print(f"界面已稳定，耗时{elapsed:.2f}秒（{frames}帧）")
+                    return {"settled": True, "elapsed": elapsed, "settle_time": last_change, "frames": frames,
+                            "signature": signature}
+
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            time.sleep(max(0.0, min(self.poll_interval - (now - poll_start), deadline - now)))
+
+        elapsed = time.monotonic() - start
+        SETTLE_SECONDS.observe(elapsed, settled="false")
+        print(f"等待界面稳定超时（{elapsed:.2f}秒）")
+        return {"settled": False, "elapsed": elapsed, "settle_time": elapsed, "frames": frames,
+                "signature": previous}
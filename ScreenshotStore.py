@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from Metrics import record_cache
+
+
+class ScreenshotStore:
+    """按内容寻址的截图存储
+
+    截图按SHA-256哈希存放在分片目录objects/<哈希前两位>/<哈希>.<扩展名>中，
+    相同画面只保存一份；SQLite索引记录每个对象的大小和最近使用时间，
+    超出容量或过期的对象由后台线程清理。可选的会话清单记录每一步对应的画面。
+    """
+
+    def __init__(self, root=None, max_bytes=None, max_age=None, prune_interval=60.0, background_pruning=True):
+        """初始化截图存储
+
+        Args:
+            root (str, optional): 存储根目录，默认为当前目录下的pictures
+            max_bytes (int, optional): 最大总字节数，默认读取SCREENSHOT_STORE_MAX_MB（默认1024MB）
+            max_age (float, optional): 最长保留时间（秒），默认读取SCREENSHOT_STORE_MAX_AGE_DAYS（默认7天）
+            prune_interval (float): 后台清理的间隔（秒）
+            background_pruning (bool): 是否在首次写入新对象时自动启动后台清理线程
+        """
+        self.root = root or os.path.join(os.getcwd(), "pictures")
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("SCREENSHOT_STORE_MAX_MB", "1024")) * 1024 * 1024)
+        if max_age is None:
+            max_age = float(os.getenv("SCREENSHOT_STORE_MAX_AGE_DAYS", "7")) * 86400
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        self.background_pruning = background_pruning
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.sessions_dir = os.path.join(self.root, "sessions")
+        self.session_id = None
+        self._session_step = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._prune_thread = None
+        self._stop_event = threading.Event()
+        self._prune_needed = threading.Event()
+
+    def _connect(self):
+        """首次使用时创建目录和索引（调用方需持有锁）"""
+        if self._db is None:
+            os.makedirs(self.objects_dir, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(self.root, "index.sqlite3"), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS objects ("
+                "digest TEXT PRIMARY KEY, ext TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, last_seen REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 1)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS objects_last_seen ON objects(last_seen)")
+            self._db.commit()
+        return self._db
+
+    def object_path(self, digest, ext=".jpeg"):
+        """获取对象在分片目录中的路径
+
+        Args:
+            digest (str): 内容哈希
+            ext (str): 扩展名
+
+        Returns:
+            str: 对象路径
+        """
+        return os.path.join(self.objects_dir, digest[:2], digest + ext)
+
+    def put_bytes(self, data, ext=".jpeg", label=None):
+        """保存一帧画面，相同内容只保存一份
+
+        Args:
+            data (bytes): 图片数据
+            ext (str): 扩展名
+            label (str, optional): 写入会话清单的步骤说明
+
+        Returns:
+            str: 内容哈希
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            row = db.execute("SELECT ext FROM objects WHERE digest = ?", (digest,)).fetchone()
+            duplicate = bool(row) and os.path.exists(self.object_path(digest, row[0]))
+            record_cache("screenshot_store", duplicate)
+            if duplicate:
+                db.execute("UPDATE objects SET last_seen = ?, hits = hits + 1 WHERE digest = ?", (now, digest))
+            else:
+                path = self.object_path(digest, ext)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # 先写临时文件再改名，避免清理线程或读者看到不完整的文件
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                db.execute(
+                    "INSERT OR REPLACE INTO objects (digest, ext, size, created, last_seen, hits) VALUES (?, ?, ?, ?, ?, 1)",
+                    (digest, ext, len(data), now, now),
+                )
+                self._prune_needed.set()
+                if self.background_pruning and self._prune_thread is None:
+                    self.start_background_pruning()
+            db.commit()
+            if self.session_id:
+                self._append_manifest(digest, label, now)
+        return digest
+
+    def put_file(self, path, label=None):
+        """保存一个截图文件
+
+        Args:
+            path (str): 截图文件路径
+            label (str, optional): 写入会话清单的步骤说明
+
+        Returns:
+            str: 内容哈希
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        return self.put_bytes(data, os.path.splitext(path)[1] or ".jpeg", label)
+
+    def get_path(self, digest):
+        """根据内容哈希获取对象路径
+
+        Args:
+            digest (str): 内容哈希
+
+        Returns:
+            str: 对象路径，不存在时返回None
+        """
+        with self._lock:
+            row = self._connect().execute("SELECT ext FROM objects WHERE digest = ?", (digest,)).fetchone()
+        if not row:
+            return None
+        path = self.object_path(digest, row[0])
+        return path if os.path.exists(path) else None
+
+    def start_session(self, session_id=None):
+        """开始记录会话清单，之后保存的每一帧都会追加到sessions/<session_id>.jsonl
+
+        Args:
+            session_id (str, optional): 会话标识，默认使用当前时间
+
+        Returns:
+            str: 会话标识
+        """
+        with self._lock:
+            self.session_id = session_id or time.strftime("%Y%m%d_%H%M%S")
+            self._session_step = 0
+            os.makedirs(self.sessions_dir, exist_ok=True)
+        return self.session_id
+
+    def _append_manifest(self, digest, label, now):
+        """追加一条会话清单记录（调用方需持有锁）"""
+        self._session_step += 1
+        record = {"step": self._session_step, "time": now, "digest": digest, "label": label}
+        with open(os.path.join(self.sessions_dir, f"{self.session_id}.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def prune(self):
+        """删除过期对象，并在超出容量时按最近使用时间从旧到新删除
+
+        会话清单中引用的对象也可能被删除，清单只保证记录了哈希。
+
+        Returns:
+            int: 删除的对象数
+        """
+        removed = []
+        with self._lock:
+            db = self._connect()
+            now = time.time()
+            if self.max_age:
+                removed.extend(db.execute(
+                    "SELECT digest, ext FROM objects WHERE last_seen < ?", (now - self.max_age,)
+                ).fetchall())
+                db.execute("DELETE FROM objects WHERE last_seen < ?", (now - self.max_age,))
+            if self.max_bytes:
+                total = db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+                if total > self.max_bytes:
+                    for digest, ext, size in db.execute(
+                        "SELECT digest, ext, size FROM objects ORDER BY last_seen"
+                    ).fetchall():
+                        if total <= self.max_bytes:
+                            break
+                        removed.append((digest, ext))
+                        db.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+                        total -= size
+            db.commit()
+            for digest, ext in removed:
+                try:
+                    os.remove(self.object_path(digest, ext))
+                except FileNotFoundError:
+                    pass
+        return len(removed)
+
+    def start_background_pruning(self):
+        """启动后台清理线程，新对象写入后按prune_interval的节奏清理"""
+        if self._prune_thread is not None and self._prune_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._prune_thread = threading.Thread(target=self._prune_loop, name="screenshot-prune", daemon=True)
+        self._prune_thread.start()
+
+    def stop_background_pruning(self):
+        """停止后台清理线程"""
+        self._stop_event.set()
+        self._prune_needed.set()
+        if self._prune_thread is not None:
+            self._prune_thread.join()
+            self._prune_thread = None
+
+    def _prune_loop(self):
+        while not self._stop_event.is_set():
+            self._prune_needed.wait()
+            if self._stop_event.is_set():
+                break
+            self._prune_needed.clear()
+            removed = self.prune()
+            if removed:
+                print(f"截图存储清理了{removed}个对象")
+            self._stop_event.wait(self.prune_interval)
+
+    def get_stats(self):
+        """获取存储统计
+
+        Returns:
+            dict: 对象数、总字节数和总命中次数
+        """
+        with self._lock:
+            count, size, hits = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM objects"
+            ).fetchone()
+        return {"objects": count, "bytes": size, "captures": hits}
@@ -0,0 +1,409 @@
+import copy
+import json
+import re
+
+from ModelRouter import ACTION_TYPES
+
+# 模型输出的类型化结构（JSON Schema的子集），既用于请求结构化输出，也用于本地校验
+POSITION_SCHEMA = {
+    "type": "array",
+    "items": {"type": "number"},
+    "minItems": 4,
+    "maxItems": 4,
+    "description": "[x1, y1, x2, y2]，左上角和右下角的像素坐标",
+}
+
+ELEMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": ["string", "null"]},
+        "text": {"type": ["string", "null"]},
+        "description": {"type": ["string", "null"]},
+        "position": POSITION_SCHEMA,
+        "clickable": {"type": ["boolean", "null"]},
+    },
+    "required": ["position"],
+}
+
+ELEMENT_LIST_SCHEMA = {
+    "type": "object",
+    "properties": {"elements": {"type": "array", "items": ELEMENT_SCHEMA}},
+    "required": ["elements"],
+}
+
+# 从截图中提取UI元素的提示，客户端和模型路由共用
+ELEMENT_LIST_PROMPT = "请分析这张图片，识别所有可见的UI元素（如按钮、输入框、文本区域、图标等），并返回它们的位置信息。每个元素包含type（类型）、text（文字）、description（描述）、position（[x1, y1, x2, y2]，左上角和右下角的像素坐标）和clickable（是否可点击）。请以JSON格式返回结果：{\"elements\": [...]}，确保格式正确。"
+ELEMENT_LIST_SYSTEM_PROMPT = "你是一个精确的UI元素分析助手，能够准确识别图片中的UI元素及其位置。"
+
+ACTION_STEP_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "action": {"type": "string", "enum": ACTION_TYPES},
+        "target": {"type": ["object", "null"]},
+        "params": {"type": ["object", "null"]},
+        "description": {"type": ["string", "null"]},
+    },
+    "required": ["action"],
+}
+
+ACTION_PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {"steps": {"type": "array", "items": ACTION_STEP_SCHEMA, "minItems": 1}},
+    "required": ["steps"],
+}
+
+SWIPE_PARAMS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "start_x": {"type": "number"},
+        "start_y": {"type": "number"},
+        "end_x": {"type": "number"},
+        "end_y": {"type": "number"},
+        "duration": {"type": ["number", "null"]},
+    },
+    "required": ["start_x", "start_y", "end_x", "end_y"],
+}
+
+_TYPE_CHECKS = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None,
+}
+
+_LITERALS = {"True": "true", "False": "false", "None": "null", "true": "true", "false": "false", "null": "null"}
+_WORD_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_OPEN_QUOTES = {'"': '"', "'": "'", "“": "”"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def response_format(name, schema):
+    """构造结构化输出的response_format参数
+
+    Args:
+        name (str): 结构名称
+        schema (dict): JSON Schema
+
+    Returns:
+        dict: json_schema类型的response_format
+    """
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema}}
+
+
+def extract_json(text):
+    """在模型输出中找出第一段括号配平的JSON
+
+    跳过JSON前后的说明文字和代码块标记；字符串内的括号不参与配平。
+    输出被截断、括号没有配平时返回从第一个左括号到末尾的内容，交给repair_json补全。
+
+    Args:
+        text (str): 模型原始输出
+
+    Returns:
+        str: JSON片段，找不到左括号时返回None
+    """
+    first = None
+    for start, char in enumerate(text):
+        if char not in _CLOSERS:
+            continue
+        if first is None:
+            first = start
+        stack = []
+        quote = None
+        escaped = False
+        for end in range(start, len(text)):
+            char = text[end]
+            if quote:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == quote:
+                    quote = None
+            elif char in _OPEN_QUOTES:
+                quote = _OPEN_QUOTES[char]
+            elif char in _CLOSERS:
+                stack.append(_CLOSERS[char])
+            elif char in "}]":
+                if not stack or stack.pop() != char:
+                    break
+                if not stack:
+                    return text[start:end + 1]
+    return text[first:] if first is not None else None
+
+
+def repair_json(text):
+    """修复常见的JSON格式错误
+
+    处理单引号和中文引号字符串、True/False/None、未加引号的键、//注释、
+    多余的尾逗号、字符串中的换行，以及被截断的字符串和括号。
+
+    Args:
+        text (str): 待修复的JSON片段
+
+    Returns:
+        str: 修复后的文本（不保证一定是合法JSON）
+    """
+    out = []
+    stack = []
+    index = 0
+    length = len(text)
+    while index < length:
+        char = text[index]
+        if char in _OPEN_QUOTES:
+            # 字符串统一改写为双引号
+            closing = _OPEN_QUOTES[char]
+            out.append('"')
+            index += 1
+            while index < length and text[index] != closing:
+                char = text[index]
+                if char == "\\" and index + 1 < length:
+                    following = text[index + 1]
+                    out.append("'" if following == "'" else char + following)
+                    index += 2
+                    continue
+                out.append({'"': '\\"', "\n": "\\n", "\r": "\\r", "\t": "\\t"}.get(char, char))
+                index += 1
+            out.append('"')
+            index += 1
+            continue
+        if char == "/" and text.startswith("//", index):
+            newline = text.find("\n", index)
+            index = length if newline < 0 else newline
+            continue
+        if char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+        elif char in "}]":
+            _strip_trailing(out, ",")
+            if stack:
+                stack.pop()
+        elif char.isalpha() or char == "_":
+            match = _WORD_PATTERN.match(text, index)
+            if match:
+                word = match.group()
+                index = match.end()
+                rest = text[index:index + 32].lstrip()
+                if rest.startswith(":"):
+                    out.append(json.dumps(word))
+                else:
+                    out.append(_LITERALS.get(word, word))
+                continue
+        out.append(char)
+        index += 1
+    # 被截断的输出：去掉末尾不完整的键值分隔，再补全括号
+    _strip_trailing(out, ",:")
+    out.extend(reversed(stack))
+    return "".join(out)
+
+
+def _strip_trailing(out, chars):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] in chars:
+        out.pop()
+
+
+def parse_json(text):
+    """宽松地解析模型输出中的JSON
+
+    Args:
+        text (str): 模型原始输出
+
+    Returns:
+        tuple: (解析结果, 解析方式)，解析方式为direct、extracted或repaired，无法解析时为(None, None)
+    """
+    if not isinstance(text, str):
+        return None, None
+    text = text.strip()
+    try:
+        return json.loads(text), "direct"
+    except json.JSONDecodeError:
+        pass
+    candidate = extract_json(text)
+    if candidate is None:
+        return None, None
+    try:
+        return json.loads(candidate), "extracted"
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(repair_json(candidate)), "repaired"
+    except json.JSONDecodeError:
+        return None, None
+
+
+def loads_lenient(text):
+    """宽松地解析模型输出中的JSON，无法解析时返回None"""
+    return parse_json(text)[0]
+
+
+def format_path(path):
+    """将字段路径格式化为steps[0].action的形式"""
+    text = ""
+    for key in path:
+        text += f"[{key}]" if isinstance(key, int) else (f".{key}" if text else key)
+    return text
+
+
+def validate(value, schema, path=()):
+    """按JSON Schema子集校验模型输出
+
+    支持type、enum、properties、required、items、minItems、maxItems。
+
+    Args:
+        value (object): 待校验的值
+        schema (dict): JSON Schema
+        path (tuple): 当前值的字段路径
+
+    Returns:
+        list: 校验错误，每项为(字段路径, 错误说明)，校验通过时为空列表
+    """
+    types = schema.get("type")
+    if types:
+        types = [types] if isinstance(types, str) else types
+        if not any(_TYPE_CHECKS[name](value) for name in types):
+            return [(path, f"类型应为{'/'.join(types)}")]
+    if "enum" in schema and value not in schema["enum"]:
+        return [(path, f"取值应为{'、'.join(map(str, schema['enum']))}之一")]
+    errors = []
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if value.get(key) is None:
+                errors.append((path + (key,), "缺失"))
+        for key, child in schema.get("properties", {}).items():
+            if value.get(key) is not None:
+                errors.extend(validate(value[key], child, path + (key,)))
+    elif isinstance(value, list):
+        if len(value) < schema.get("minItems", 0) or len(value) > schema.get("maxItems", len(value)):
+            return [(path, f"元素个数不符合要求（当前{len(value)}个）")]
+        if "items" in schema:
+            for index, item in enumerate(value):
+                errors.extend(validate(item, schema["items"], path + (index,)))
+    return errors
+
+
+def parse_element_list(text):
+    """解析模型返回的UI元素列表，缺少有效位置的元素直接丢弃，不再整张图重新分析
+
+    Args:
+        text (str): 模型返回的原始文本
+
+    Returns:
+        dict: {"elements": [...]}，无法解析时返回{"error": 错误说明}
+    """
+    parsed, _ = parse_json(text)
+    if isinstance(parsed, list):
+        parsed = {"elements": parsed}
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("elements"), list):
+        return {"error": f"无法解析UI元素: {text}"}
+    elements = [element for element in parsed["elements"] if not validate(element, ELEMENT_SCHEMA)]
+    dropped = len(parsed["elements"]) - len(elements)
+    if dropped:
+        print(f"丢弃{dropped}个缺少有效位置的UI元素")
+    return {"elements": elements}
+
+
+def schema_at(schema, path):
+    """取出字段路径对应的子结构"""
+    for key in path:
+        schema = schema.get("items", {}) if isinstance(key, int) else schema.get("properties", {}).get(key, {})
+    return schema
+
+
+def set_path(value, path, new_value):
+    """按字段路径替换值"""
+    for key in path[:-1]:
+        value = value[key]
+    value[path[-1]] = new_value
+
+
+class StructuredOutput:
+    """结构化输出处理：本地修复和校验模型返回的JSON，只针对出错的字段重新询问
+
+    模型输出不合法时不再重跑整条指令：先在本地提取和修复JSON，再按类型化结构校验，
+    仍有个别字段缺失或不合法时，只请求模型返回该字段的值并填回原结果。
+    """
+
+    def __init__(self, client, max_reasks=2):
+        """初始化结构化输出处理
+
+        Args:
+            client (OpenAICompatibleClient): LLM客户端，用于重新询问出错的字段
+            max_reasks (int): 每个结果最多重新询问的字段数
+        """
+        self.client = client
+        self.max_reasks = max_reasks
+        self.stats = {"direct": 0, "extracted": 0, "repaired": 0, "failed": 0, "reasks": 0, "reask_fixed": 0}
+
+    def load(self, text, schema=None, prompt=None, system_prompt=None, model_id=None):
+        """解析模型输出，并按结构校验和修正
+
+        Args:
+            text (str): 模型原始输出
+            schema (dict, optional): 期望的结构
+            prompt (str, optional): 原始提示，提供时才会针对出错的字段重新询问
+            system_prompt (str, optional): 原始系统提示
+            model_id (str, optional): 重新询问使用的模型
+
+        Returns:
+            object: 解析结果，无法解析时返回None
+        """
+        value, method = parse_json(text)
+        self.stats[method or "failed"] += 1
+        if value is None or schema is None:
+            return value
+        return self.coerce(value, schema, prompt, system_prompt, model_id)
+
+    def coerce(self, value, schema, prompt=None, system_prompt=None, model_id=None):
+        """按结构校验已解析的结果，针对出错的字段重新询问
+
+        Args:
+            value (object): 已解析的结果
+            schema (dict): 期望的结构
+            prompt (str, optional): 原始提示，为None时不重新询问
+            system_prompt (str, optional): 原始系统提示
+            model_id (str, optional): 重新询问使用的模型
+
+        Returns:
+            object: 修正后的结果，无法修正的字段保持原样
+        """
+        errors = validate(value, schema)
+        if not errors or prompt is None:
+            return value
+        asked = set()
+        for path, message in errors:
+            # 整体结构错误无法按字段修正；同一字段只问一次
+            if not path or path in asked or len(asked) >= self.max_reasks:
+                continue
+            asked.add(path)
+            fixed = self._reask(value, path, message, schema_at(schema, path), prompt, system_prompt, model_id)
+            if fixed is not None:
+                set_path(value, path, fixed)
+                self.stats["reask_fixed"] += 1
+        return value
+
+    def _reask(self, value, path, message, field_schema, prompt, system_prompt, model_id):
+        """只请求模型返回出错字段的值"""
+        field = format_path(path)
+        wrapper = {"type": "object", "properties": {"value": field_schema}, "required": ["value"]}
+        ask = (
+            f"{prompt}\n\n你之前返回的结果:\n{json.dumps(value, ensure_ascii=False)}\n\n"
+            f"其中字段{field}{message}。请只返回该字段的正确值，格式为JSON："
+            '{"value": 字段的值}，不要返回整个结果或其他内容。'
+        )
+        self.stats["reasks"] += 1
+        print(f"模型输出的字段{field}{message}，重新询问该字段")
+        try:
+            answer = self.client.generate(ask, system_prompt, model_id,
+                                          response_format=response_format("field_value", wrapper))
+        except Exception as e:
+            print(f"重新询问字段{field}失败: {str(e)}")
+            return None
+        answer = loads_lenient(answer)
+        if not isinstance(answer, dict) or "value" not in answer:
+            return None
+        fixed = copy.deepcopy(answer["value"])
+        return fixed if not validate(fixed, field_schema) else None
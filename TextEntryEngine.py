@@ -0,0 +1,209 @@
+import base64
+import shlex
+import time
+
+# Android/HarmonyOS input命令的回车键码
+ENTER_KEYCODE = 66
+
+# ADBKeyboard输入法，设为当前输入法后可通过广播输入任意Unicode文本
+ADB_KEYBOARD_IME = "com.android.adbkeyboard/.AdbIME"
+
+
+class TextEntryEngine:
+    """文本输入引擎，按设备选择可用且最快的输入方式
+
+    支持的输入方式：
+    - uitest：鸿蒙uitest uiInput text，支持中文等非ASCII文本（hdc）
+    - adb_keyboard：ADBKeyboard输入法的Base64广播，支持任意Unicode文本（adb，需设为当前输入法）
+    - input_text：分块调用input text并转义，仅支持ASCII文本，所有设备可用
+
+    每种方式首次使用前探测一次是否可用，之后按实测的字符/秒选择最快的方式。
+    """
+
+    # 各输入方式的默认优先级，尚无实测速度时按此顺序选择
+    STRATEGIES = ("uitest", "adb_keyboard", "input_text")
+
+    def __init__(self, device_manager, chunk_size=None, verify=True):
+        """初始化文本输入引擎
+
+        Args:
+            device_manager (HarmonyDeviceManager): 设备管理器
+            chunk_size (dict, optional): 各输入方式每次命令发送的最大字符数
+            verify (bool): 输入后是否通过控件树确认文本已出现在界面上
+        """
+        self.device_manager = device_manager
+        self.chunk_size = {"uitest": 256, "adb_keyboard": 512, "input_text": 100}
+        if chunk_size:
+            self.chunk_size.update(chunk_size)
+        self.verify = verify
+        # 输入方式 -> 是否可用（探测结果）
+        self._available = {}
+        # 输入方式 -> 实测字符/秒（指数滑动平均）
+        self._throughput = {}
+
+    def _probe(self, strategy):
+        """探测输入方式是否可用，结果按设备缓存"""
+        if strategy in self._available:
+            return self._available[strategy]
+        command_type = self.device_manager.command_type
+        if strategy == "uitest":
+            available = False
+            if command_type == "hdc":
+                return_code, stdout, stderr = self.device_manager.execute_command(
+                    ["shell", "uitest", "--version"], timeout=10, quiet=True
+                )
+                available = return_code == 0 and bool(stdout.strip())
+        elif strategy == "adb_keyboard":
+            available = False
+            if command_type == "adb":
+                return_code, stdout, stderr = self.device_manager.execute_command(
+                    ["shell", "settings", "get", "secure", "default_input_method"], timeout=10, quiet=True
+                )
+                available = return_code == 0 and stdout.strip() == ADB_KEYBOARD_IME
+        else:
+            available = True
+        self._available[strategy] = available
+        return available
+
+    def select_strategy(self, text, exclude=()):
+        """为文本选择输入方式
+
+        Args:
+            text (str): 要输入的文本
+            exclude (iterable): 本次不使用的输入方式
+
+        Returns:
+            str: 输入方式，没有可用方式时返回None
+        """
+        candidates = [
+            strategy for strategy in self.STRATEGIES
+            if strategy not in exclude and (strategy != "input_text" or text.isascii()) and self._probe(strategy)
+        ]
+        if not candidates:
+            return None
+        measured = [strategy for strategy in candidates if strategy in self._throughput]
+        if len(measured) == len(candidates):
+            return max(measured, key=lambda strategy: self._throughput[strategy])
+        # 优先尝试尚未测速的方式，以便比较
+        return next(strategy for strategy in candidates if strategy not in measured)
+
+    def _chunks(self, text, size):
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def _send_chunk(self, strategy, chunk):
+        if strategy == "uitest":
+            args = ["shell", "uitest", "uiInput", "text", shlex.quote(chunk)]
+        elif strategy == "adb_keyboard":
+            encoded = base64.b64encode(chunk.encode("utf-8")).decode("ascii")
+            args = ["shell", "am", "broadcast", "-a", "ADB_INPUT_B64", "--es", "msg", encoded]
+        else:
+            args = self.device_manager._text_args(chunk)[0]
+        return_code, stdout, stderr = self.device_manager.execute_command(args, quiet=True)
+        if return_code != 0:
+            print(f"输入文本失败（{strategy}）: {stderr}")
+            return False
+        return True
+
+    def _enter(self, strategy, text):
+        """按输入方式发送文本
+
+        Returns:
+            tuple: (是否成功, 已发送的命令数)
+        """
+        if strategy == "input_text":
+            # input text不支持换行，按行发送并在行间按回车
+            lines = text.split("\n")
+        else:
+            lines = [text]
+        commands = 0
+        for index, line in enumerate(lines):
+            if index > 0:
+                if not self.device_manager.press_key(ENTER_KEYCODE):
+                    return False, commands
+                commands += 1
+            for chunk in self._chunks(line, self.chunk_size[strategy]):
+                if not self._send_chunk(strategy, chunk):
+                    return False, commands
+                commands += 1
+        return True, commands
+
+    def _verify(self, text):
+        """通过控件树确认输入的文本已出现在界面上
+
+        Returns:
+            bool: 是否确认，无法获取控件树时返回None
+        """
+        elements = self.device_manager.dump_layout()
+        if elements is None:
+            return None
+        # 只比较末尾部分，输入框可能滚动或截断显示
+        tail = text.strip().splitlines()[-1][-32:] if text.strip() else ""
+        return any(tail in (element.get("text") or "") for element in elements)
+
+    def enter_text(self, text):
+        """向当前焦点输入框输入文本
+
+        Args:
+            text (str): 要输入的文本
+
+        Returns:
+            dict: 输入结果，包含success、strategy、chars、commands、elapsed、chars_per_second、verified
+        """
+        result = {
+            "success": False,
+            "strategy": None,
+            "chars": len(text),
+            "commands": 0,
+            "elapsed": 0.0,
+            "chars_per_second": 0.0,
+            "verified": None,
+        }
+        if not text:
+            result["success"] = True
+            return result
+
+        # 所选方式第一条命令就失败时（如设备拒绝uitest命令）换下一种可用方式重试；
+        # 已输入部分文本后失败则不再重试，避免重复输入
+        failed = set()
+        while True:
+            strategy = self.select_strategy(text, exclude=failed)
+            if strategy is None:
+                print("输入文本失败: 没有支持该文本的输入方式（非ASCII文本需要uitest或ADBKeyboard）")
+                return result
+            started = time.monotonic()
+            success, commands = self._enter(strategy, text)
+            elapsed = time.monotonic() - started
+            if success:
+                break
+            if commands > 0:
+                result.update({"strategy": strategy, "commands": commands, "elapsed": elapsed})
+                return result
+            failed.add(strategy)
+
+        speed = len(text) / elapsed if elapsed > 0 else 0.0
+        previous = self._throughput.get(strategy)
+        self._throughput[strategy] = speed if previous is None else 0.7 * previous + 0.3 * speed
+        result.update({
+            "success": True,
+            "strategy": strategy,
+            "commands": commands,
+            "elapsed": elapsed,
+            "chars_per_second": speed,
+        })
+        if self.verify:
+            result["verified"] = self._verify(text)
+            if result["verified"] is False:
+                print("警告: 输入完成但界面上未找到输入的文本")
+        print(f"输入文本: {len(text)}个字符，方式: {strategy}，{commands}条命令，{speed:.0f}字符/秒")
+        return result
+
+    def get_stats(self):
+        """获取各输入方式的探测结果和实测速度
+
+        Returns:
+            dict: 统计信息
+        """
+        return {
+            "available": dict(self._available),
+            "chars_per_second": dict(self._throughput),
+        }
@@ -2,11 +2,104 @@
 import argparse
 import sys
 import os
-from HarmonyAutoAgent import HarmonyAutoAgent
+
+# 纯设备操作子命令：只加载设备管理器，不导入LLM相关模块
+DEVICE_SUBCOMMANDS = {"tap", "swipe", "key", "text", "screenshot"}
+
+# key子命令支持的按键名称
+KEY_NAMES = {"home": 3, "back": 4, "menu": 82}
+
+
+def find_device_subcommand(argv):
+    """查找命令行中的设备操作子命令
+    
+    Args:
+        argv (list): 命令行参数（不含程序名）
+        
+    Returns:
+        bool: 是否为设备操作子命令
+    """
+    i = 0
+    while i < len(argv):
+        if argv[i] == "--device-command":
+            i += 2
+        elif argv[i].startswith("--device-command=") or argv[i] == "--direct":
+            i += 1
+        else:
+            return argv[i] in DEVICE_SUBCOMMANDS
+    return False
+
+
+def run_device_command(argv):
+    """执行纯设备操作子命令
+    
+    Args:
+        argv (list): 命令行参数（不含程序名）
+        
+    Returns:
+        int: 退出码
+    """
+    from HarmonyDeviceManager import HarmonyDeviceManager
+    
+    parser = argparse.ArgumentParser(prog="main.py", description="设备操作命令（不加载LLM）")
+    parser.add_argument("--device-command", type=str, default="hdc", help="设备管理命令路径，支持hdc, hdc_std, adb")
+    parser.add_argument("--direct", action="store_true", help="直接与hdc/adb server通信，不启动命令行进程")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    tap_parser = subparsers.add_parser("tap", help="点击坐标")
+    tap_parser.add_argument("x", type=int)
+    tap_parser.add_argument("y", type=int)
+    
+    swipe_parser = subparsers.add_parser("swipe", help="滑动")
+    for name in ("start_x", "start_y", "end_x", "end_y"):
+        swipe_parser.add_argument(name, type=int)
+    swipe_parser.add_argument("duration", type=int, nargs="?", help="滑动持续时间（毫秒）")
+    
+    key_parser = subparsers.add_parser("key", help="按键：home、back、menu或键码")
+    key_parser.add_argument("key", type=str)
+    
+    text_parser = subparsers.add_parser("text", help="输入文本")
+    text_parser.add_argument("text", type=str)
+    
+    screenshot_parser = subparsers.add_parser("screenshot", help="截图")
+    screenshot_parser.add_argument("path", type=str, nargs="?", default="screenshot.jpeg")
+    
+    args = parser.parse_args(argv)
+    device_manager = HarmonyDeviceManager(args.device_command)
+    if args.direct:
+        from DeviceTransport import create_server_transport
+        device_manager.transport = create_server_transport(device_manager.command_type)
+    
+    if args.command == "tap":
+        success = device_manager.tap(args.x, args.y)
+    elif args.command == "swipe":
+        success = device_manager.swipe(args.start_x, args.start_y, args.end_x, args.end_y, args.duration)
+    elif args.command == "key":
+        key = args.key.lower()
+        if key in KEY_NAMES:
+            success = device_manager.press_key(KEY_NAMES[key])
+        elif key.isdigit():
+            success = device_manager.press_key(int(key))
+        else:
+            print(f"错误: 不支持的按键: {args.key}")
+            success = False
+    elif args.command == "text":
+        from TextEntryEngine import TextEntryEngine
+        success = TextEntryEngine(device_manager, verify=False).enter_text(args.text)["success"]
+    else:
+        success = device_manager.get_screenshot(args.path)
+    return 0 if success else 1
+
 
 def main():
     """主程序入口"""
-    parser = argparse.ArgumentParser(description="鸿蒙自动操作代理 - 从自然语言指令到手机操作的自动化工具")
+    if find_device_subcommand(sys.argv[1:]):
+        sys.exit(run_device_command(sys.argv[1:]))
+    
+    parser = argparse.ArgumentParser(
+        description="鸿蒙自动操作代理 - 从自然语言指令到手机操作的自动化工具",
+        epilog="纯设备操作（不加载LLM）: main.py [--device-command hdc] {tap,swipe,key,text,screenshot} ..."
+    )
     
     # 命令行参数
     parser.add_argument(
@@ -36,6 +129,63 @@ def main():
         action="store_true", 
         help="进入交互模式"
     )
+    parser.add_argument(
+        "--no-prefetch", 
+        action="store_true", 
+        help="交互模式下不在等待输入时预先截图和分析界面（预取每次界面变化最多调用一次模型）"
+    )
+    parser.add_argument(
+        "--continuous-capture", 
+        action="store_true", 
+        help="后台连续截屏到内存环形缓冲区，获取截图时无需等待截屏命令"
+    )
+    parser.add_argument(
+        "--screenshot-session", 
+        type=str, 
+        help="记录本次运行的截图清单（pictures/sessions/<名称>.jsonl），映射每一步对应的画面"
+    )
+    parser.add_argument(
+        "--loop", 
+        action="store_true", 
+        help="闭环执行：每执行一步都重新截图观察，再由模型决定下一步，适合跨多个页面的任务"
+    )
+    parser.add_argument(
+        "--direct", 
+        action="store_true", 
+        help="直接通过TCP协议与hdc/adb server通信，不再为每条命令启动命令行进程"
+    )
+    parser.add_argument(
+        "--serve", 
+        action="store_true", 
+        help="以常驻服务方式运行，保持代理实例常驻并通过JSON接口接收指令"
+    )
+    parser.add_argument(
+        "--host", 
+        type=str, 
+        default="127.0.0.1", 
+        help="服务监听地址（配合--serve使用）"
+    )
+    parser.add_argument(
+        "--port", 
+        type=int, 
+        default=8765, 
+        help="服务监听端口（配合--serve使用）"
+    )
+    parser.add_argument(
+        "--socket", 
+        type=str, 
+        help="服务监听的Unix socket路径（配合--serve使用，指定后不再监听TCP端口）"
+    )
+    parser.add_argument(
+        "--server", 
+        type=str, 
+        help="将--instruction/--instruction-file提交给已运行的服务执行，如 http://127.0.0.1:8765 或 unix:/tmp/agent.sock"
+    )
+    parser.add_argument(
+        "--metrics-port", 
+        type=int, 
+        help="在本机该端口以Prometheus文本格式导出运行指标（GET /metrics）"
+    )
     parser.add_argument(
         "--test", 
         action="store_true", 
@@ -44,11 +194,54 @@ def main():
     
     args = parser.parse_args()
     
+    from Metrics import get_registry
+    if args.metrics_port is not None:
+        get_registry().serve(args.metrics_port)
+    
+    def finish(code):
+        """打印本次运行的指标摘要后退出"""
+        print("\n===== 运行指标 =====")
+        print(get_registry().summary())
+        sys.exit(code)
+    
+    if args.serve:
+        # 常驻服务模式
+        from AgentDaemon import AgentDaemon
+        daemon = AgentDaemon(device_command=args.device_command, screenshot_path=args.screenshot_path, direct=args.direct)
+        daemon.serve(host=args.host, port=args.port, socket_path=args.socket)
+        sys.exit(0)
+    
+    if args.server:
+        # 客户端模式：指令交给常驻服务执行，本进程不创建代理
+        from AgentDaemon import AgentDaemonClient
+        client = AgentDaemonClient(args.server)
+        if args.instruction:
+            instructions = [args.instruction]
+        elif args.instruction_file and os.path.exists(args.instruction_file):
+            with open(args.instruction_file, "r", encoding="utf-8") as f:
+                instructions = [line.strip() for line in f if line.strip()]
+        else:
+            print("错误: --server需要配合--instruction或存在的--instruction-file使用")
+            sys.exit(1)
+        
+        all_success = True
+        for instruction in instructions:
+            if not client.run_instruction(instruction, "adb" if "adb" in args.device_command else "hdc"):
+                all_success = False
+        sys.exit(0 if all_success else 1)
+    
     # 创建自动操作代理实例
+    from HarmonyAutoAgent import HarmonyAutoAgent
+    transport = None
+    if args.direct:
+        from DeviceTransport import create_server_transport
+        transport = create_server_transport("adb" if "adb" in args.device_command else "hdc")
     agent = HarmonyAutoAgent(
         device_command=args.device_command, 
-        screenshot_path=args.screenshot_path
+        screenshot_path=args.screenshot_path,
+        transport=transport
     )
+    agent.closed_loop = args.loop
     
     # 检查命令是否可用
     if not agent.check_command_available():
@@ -60,6 +253,12 @@ def main():
         print("错误: 设备未连接，请确保已连接设备并授权调试")
         sys.exit(1)
     
+    if args.screenshot_session:
+        agent.device_manager.screenshot_store.start_session(args.screenshot_session)
+    
+    if args.continuous_capture:
+        agent.start_continuous_capture()
+    
     # 根据参数执行不同的功能
     if args.test:
         # 测试设备连接和基本功能
@@ -68,12 +267,12 @@ def main():
         print("测试结果:")
         for key, value in results.items():
             print(f"{key}: {value}")
-        sys.exit(0 if results.get("device_connected") else 1)
+        finish(0 if results.get("device_connected") else 1)
     
     elif args.instruction:
         # 执行单条指令
         success = agent.execute_instruction(args.instruction)
-        sys.exit(0 if success else 1)
+        finish(0 if success else 1)
     
     elif args.instruction_file:
         # 执行文件中的多条指令
@@ -86,12 +285,12 @@ def main():
         
         print(f"===== 执行文件中的 {len(instructions)} 条指令 =====")
         success = agent.execute_multiple_instructions(instructions)
-        sys.exit(0 if success else 1)
+        finish(0 if success else 1)
     
     elif args.interactive:
         # 进入交互模式
-        agent.interactive_mode()
-        sys.exit(0)
+        agent.interactive_mode(prefetch=not args.no_prefetch)
+        finish(0)
     
     else:
         # 显示帮助信息
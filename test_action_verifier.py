@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+操作验证器的测试脚本：用构造的画面指纹验证全屏变化、点击位置附近的变化和无效操作，
+以及响应慢的应用不会被重复点击（使用虚拟设备）
+"""
+
+import tempfile
+
+from ActionVerifier import NO_OP, UNVERIFIED, VERIFIED, ActionVerifier
+from FleetSimulator import FleetSimulator
+from FrameAnalysis import GRID_SIZE, FrameSignature
+
+
+class FakeDeviceManager:
+    def __init__(self, elements=None):
+        self.elements = elements
+
+    def get_screen_size(self):
+        return 1260, 2720
+
+    def dump_layout(self):
+        return self.elements
+
+
+def _signature(name, changed_cells=()):
+    width, height = GRID_SIZE
+    pixels = bytearray([200] * (width * height))
+    for x, y in changed_cells:
+        pixels[y * width + x] = 40
+    return FrameSignature(name, bytes(pixels), GRID_SIZE)
+
+
+def test_action_verifier():
+    verifier = ActionVerifier(FakeDeviceManager(), capture=lambda: None)
+    before = _signature("before")
+
+    # 画面完全相同：无效点击
+    assert verifier.verify(before, _signature("before"), tap_point=(630, 1360))["status"] == NO_OP
+
+    # 只有点击位置附近的少量像素变化（如开关状态改变）
+    switch = [(x, y) for x in range(15, 18) for y in range(31, 33)]
+    result = verifier.verify(before, _signature("switch", switch), tap_point=(630, 1360))
+    assert result["status"] == VERIFIED and result["global_change"] < 0.02
+
+    # 同样的变化发生在远离点击位置的地方：无法确认
+    far = [(x, y) for x in range(1, 4) for y in range(1, 3)]
+    assert verifier.verify(before, _signature("far", far), tap_point=(630, 1360))["status"] == UNVERIFIED
+
+    # 页面整体切换
+    page = [(x, y) for x in range(GRID_SIZE[0]) for y in range(20)]
+    assert verifier.verify(before, _signature("page", page))["status"] == VERIFIED
+
+    # 预期文字出现在控件树中
+    verifier = ActionVerifier(FakeDeviceManager([{"text": "WLAN"}]), capture=lambda: None)
+    assert verifier.verify(before, _signature("before"), expected_text="WLAN")["status"] == VERIFIED
+
+
+def test_slow_app_not_tapped_twice():
+    """界面稳定检测结束时应用还没有响应：复核后确认生效，不再重复点击；确实无效的点击才重试；格式不正确的步骤直接失败
+
+    复核替换首次验证的计数，每次点击只计一次验证结果
+    """
+    fleet = FleetSimulator(1, latency=0.0, jitter=0.0, animation_time=0.0, response_delay=0.3)
+    serial, device = next(iter(fleet.devices.items()))
+    with tempfile.TemporaryDirectory() as work_dir:
+        agent = fleet.agent(serial, work_dir)
+        agent.action_verifier.response_window = 0.5
+        settings = next(element for element in agent.device_manager.dump_layout() if element["text"] == "设置")
+        x1, y1, x2, y2 = settings["position"]
+
+        tap = {"action": "tap", "params": {"coordinates": [(x1 + x2) // 2, (y1 + y2) // 2]}}
+        assert agent._execute_action_and_settle(tap)
+        assert agent.last_verification["status"] == VERIFIED
+        assert device.stats["taps"] == 1 and device.screen == ("app", "com.huawei.hmos.settings")
+        assert agent.action_verifier.counts == {VERIFIED: 1, UNVERIFIED: 0, NO_OP: 0}
+
+        # 点击空白处：复核后仍然没有变化，重试一次后失败
+        assert not agent._execute_action_and_settle({"action": "tap", "params": {"coordinates": [5, 2700]}})
+        assert device.stats["taps"] == 3 and device.stats["no_op_taps"] == 2
+        assert agent.action_verifier.counts == {VERIFIED: 1, UNVERIFIED: 0, NO_OP: 2}
+
+        # 模型返回的步骤不是操作对象时直接失败，不截图也不点击
+        assert not agent._execute_plan(["点击设置"])
+        assert device.stats["taps"] == 3
+
+
+if __name__ == "__main__":
+    test_action_verifier()
+    test_slow_app_not_tapped_twice()
+    print("操作验证测试通过")
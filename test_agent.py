@@ -1,6 +1,51 @@
 #!/usr/bin/env python3
+import contextlib
+import os
 import sys
 from HarmonyAutoAgent import HarmonyAutoAgent
+from ScreenPrefetcher import ScreenPrefetcher
+
+def locate_apps(agent, names, screenshot_path, quiet=False):
+    """在截图中本地定位多个应用图标（需要icons目录中有该应用的图标）
+    
+    Args:
+        agent (HarmonyAutoAgent): 自动操作代理
+        names (list): 应用名称列表
+        screenshot_path (str): 截图路径
+        quiet (bool): 是否不输出日志（用于后台预取）
+        
+    Returns:
+        dict: 应用名称到图标中心坐标 (x, y) 的映射，只包含定位成功的应用
+    """
+    located = {}
+    for name in names:
+        if name not in agent.icon_locator.names():
+            continue
+        element = agent.icon_locator.locate(name, screenshot_path, quiet=quiet)
+        if element:
+            located[name] = agent.parser.get_element_center(element)
+    return located
+
+def locate_app(agent, name, prefetcher=None):
+    """在当前截图中本地定位应用图标，界面与预取时相同时直接使用预取的定位结果
+    
+    Args:
+        agent (HarmonyAutoAgent): 自动操作代理
+        name (str): 应用名称
+        prefetcher (ScreenPrefetcher, optional): 等待输入时预先定位图标的预取器
+        
+    Returns:
+        tuple: (x, y) 图标中心坐标，无法定位时返回None
+    """
+    if name not in agent.icon_locator.names():
+        return None
+    if prefetcher is not None:
+        located = prefetcher.take(agent.screenshot_path)
+        if located is not None:
+            return located.get(name)
+    if not agent.device_manager.get_screenshot(agent.screenshot_path):
+        return None
+    return locate_apps(agent, [name], agent.screenshot_path).get(name)
 
 def interactive_app_launcher():
     """交互式应用启动器，支持自然语言输入打开应用"""
@@ -16,7 +61,7 @@ def interactive_app_launcher():
     else:
         print("⚠ 设备未连接，将进入模拟模式")
     
-    # 应用UI元素配置
+    # 应用UI元素配置：坐标为icons目录中没有图标或本地定位失败时使用的默认位置
     app_elements = [
         {
             "description": "设置",
@@ -40,12 +85,41 @@ def interactive_app_launcher():
     for i, app in enumerate(app_elements, 1):
         print(f"   {i}. {app['description']} - 位置: ({app['position']['x']}, {app['position']['y']})")
     
+    # 等待输入时在后台截图并预先定位图标，界面没有变化时输入指令后无需再截图
+    prefetcher = None
+    names = [app["description"] for app in app_elements if app["description"] in agent.icon_locator.names()]
+    if device_connected and names:
+        root, ext = os.path.splitext(agent.screenshot_path)
+        prefetcher = ScreenPrefetcher(
+            agent.device_manager,
+            lambda path: locate_apps(agent, names, path, quiet=True),
+            f"{root}.prefetch{ext}",
+            noise_threshold=agent.action_verifier.noise_threshold,
+        )
+        prefetcher.start()
+    
     print("\n开始使用")
     print("输入自然语言指令（如：'打开设置'、'点击图库'），输入'exit'退出")
     
+    try:
+        run_launcher_loop(agent, app_elements, device_connected, prefetcher)
+    finally:
+        if prefetcher:
+            prefetcher.stop()
+
+def run_launcher_loop(agent, app_elements, device_connected, prefetcher=None):
+    """应用启动器的输入循环
+    
+    Args:
+        agent (HarmonyAutoAgent): 自动操作代理
+        app_elements (list): 应用UI元素配置
+        device_connected (bool): 设备是否已连接
+        prefetcher (ScreenPrefetcher, optional): 等待输入时预先定位图标的预取器
+    """
     while True:
         # 获取用户输入
-        user_input = input("\n请输入指令: ").strip()
+        with prefetcher.idle() if prefetcher else contextlib.nullcontext():
+            user_input = input("\n请输入指令: ").strip()
         
         if user_input.lower() == 'exit':
             print("\n退出应用启动器")
@@ -74,6 +148,10 @@ def interactive_app_launcher():
                         print(f"执行操作: 打开{target['description']}")
                         
                         if device_connected:
+                            # 优先使用本地定位的图标位置，定位失败时使用配置的坐标
+                            located = locate_app(agent, target["description"], prefetcher)
+                            if located:
+                                x, y = located
                             # 实际执行点击命令
                             success = agent.device_manager.tap(x, y)
                             if success:
@@ -97,6 +175,10 @@ def interactive_app_launcher():
                 print(f"执行操作: 打开{target['description']}")
                 
                 if device_connected:
+                    # 优先使用本地定位的图标位置，定位失败时使用配置的坐标
+                    located = locate_app(agent, target["description"], prefetcher)
+                    if located:
+                        x, y = located
                     # 实际执行点击命令
                     success = agent.device_manager.tap(x, y)
                     if success:
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+常驻服务的测试脚本：请求校验、客户端不能指定命令、任务结束事件与状态的一致性、代理数上限，
+以及通过HTTP提交指令并读取进度流（使用替身代理）
+"""
+
+import http.client
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+from AgentDaemon import AgentDaemon, AgentDaemonClient, Job
+
+
+class CheckedCondition(threading.Condition):
+    """每次释放锁时检查：任务已结束时最后一个事件必须是结束状态"""
+
+    def __init__(self):
+        super().__init__()
+        self.job = None
+        self.violations = []
+
+    def __exit__(self, *exc_info):
+        job = self.job
+        if job is not None and job.done:
+            last = job.events[-1] if job.events else None
+            if last is None or last["kind"] != "status" or last["message"] != job.status:
+                self.violations.append(job.status)
+        return super().__exit__(*exc_info)
+
+
+class FakeAgent:
+    def __init__(self):
+        self.instructions = []
+        self.device_manager = SimpleNamespace(get_screen_size=lambda: (1080, 2340), foreground_app=None)
+
+    def check_device_connected(self):
+        return True
+
+    def execute_instruction(self, instruction, check_device=True):
+        self.instructions.append(instruction)
+        print(f"执行: {instruction}")
+        return True
+
+
+def test_finish_appends_status_atomically():
+    job = Job("1", "返回", "hdc")
+    job.condition = CheckedCondition()
+    job.condition.job = job
+    job.set_status("running")
+    job.finish(False, "设备未连接")
+    assert job.condition.violations == []
+    assert [event["message"] for event in job.events] == ["running", "failed"]
+    assert job.to_dict()["error"] == "设备未连接"
+
+
+def _request(port, method, path, body=None, content_type="application/json"):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        headers = {"Content-Type": content_type} if body is not None else {}
+        connection.request(method, path, body.encode("utf-8") if body is not None else None, headers)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode("utf-8"))
+    finally:
+        connection.close()
+
+
+def test_agents_bounded():
+    """超过上限时释放最久未使用的空闲代理，正在执行指令的代理保留"""
+    daemon = AgentDaemon(max_agents=2)
+    for device_id in ("A1", "A2", "A3"):
+        daemon._agents[("hdc", device_id)] = FakeAgent()
+        daemon._agent_locks[("hdc", device_id)] = threading.Lock()
+        daemon._device_checks[("hdc", device_id)] = (True, time.monotonic() + 5)
+    with daemon._agent_locks[("hdc", "A1")]:
+        with daemon._lock:
+            daemon._evict_agents()
+    assert list(daemon._agents) == [("hdc", "A1"), ("hdc", "A3")]
+    assert set(daemon._device_checks) == {("hdc", "A1"), ("hdc", "A3")}
+
+
+def test_daemon_http():
+    daemon = AgentDaemon()
+    agent = FakeAgent()
+    daemon._agents[("hdc", None)] = agent
+    daemon._agent_locks[("hdc", None)] = threading.Lock()
+    thread = threading.Thread(target=daemon.serve, kwargs={"port": 0}, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while daemon.server is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    port = daemon.server.server_address[1]
+    try:
+        # 不是JSON对象、instruction不是字符串、JSON格式错误、工具或设备ID不合法都返回400
+        for body in ('["返回"]', '"返回"', '{"instruction": 5}', '{"instruction": "  "}', "{",
+                     '{"instruction": "返回", "tool": "sh -c \'touch /tmp/x\'"}',
+                     '{"instruction": "返回", "tool": ["hdc"]}',
+                     '{"instruction": "返回", "device_id": "A1; reboot"}'):
+            status, data = _request(port, "POST", "/instructions", body)
+            assert status == 400 and data["error"], body
+        assert _request(port, "POST", "/instructions", '{"instruction": "返回"}', "text/plain")[0] == 415
+        assert _request(port, "GET", "/device?tool=sh%20-c%20id")[0] == 400
+        # 旧的device_command参数被忽略，不会作为命令执行
+        status, data = _request(port, "GET", "/device?device_command=sh%20-c%20id")
+        assert status == 200 and data["tool"] == "hdc" and list(daemon._agents) == [("hdc", None)]
+        assert agent.instructions == []
+
+        client = AgentDaemonClient(f"http://127.0.0.1:{port}", timeout=10)
+        job = client.submit("打开设置")
+        events = list(client.stream_events(job["job_id"]))
+        assert events[-1] == dict(events[-1], kind="status", message="succeeded")
+        assert {"kind": "log", "message": "执行: 打开设置"}.items() <= next(
+            event for event in events if event["kind"] == "log").items()
+        assert client.get_job(job["job_id"])["success"] is True
+        assert agent.instructions == ["打开设置"]
+    finally:
+        daemon.shutdown()
+        thread.join(5)
+
+
+if __name__ == "__main__":
+    test_finish_appends_status_atomically()
+    test_agents_bounded()
+    test_daemon_http()
+    print("常驻服务测试通过")
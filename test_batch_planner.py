@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+批量规划器的测试脚本：使用脚本化的模型和虚拟设备，无需设备和LLM
+"""
+
+import json
+import tempfile
+
+from BatchPlanner import BatchPlanner
+from FleetSimulator import FleetSimulator
+from InstructionParser import InstructionParser
+
+
+class ScriptedClient:
+    def __init__(self, response):
+        self.response = response
+        self.prompts = []
+
+    def generate(self, prompt, system_prompt=None, model_id=None):
+        self.prompts.append(prompt)
+        return self.response
+
+
+def test_batch_planner():
+    """连续的不依赖屏幕的指令合并为一次请求，不合法的条目退回逐条执行"""
+    response = json.dumps({"plans": [
+        {"index": 0, "steps": [{"action": "launch_app", "params": {"package": "com.huawei.hmos.settings"}}]},
+        {"index": 1, "steps": [{"action": "press_back", "params": {}}, {"action": "press_back", "params": {}}]},
+        {"index": 2, "steps": [{"action": "type", "params": {"text": ""}}]},
+    ]}, ensure_ascii=False)
+    client = ScriptedClient(response)
+    planner = BatchPlanner(InstructionParser(client=client))
+    instructions = [
+        "启动设置应用",
+        "连续按两次返回",
+        "输入今天的日期，格式为年-月-日",
+        "点击WLAN",
+        "返回",
+    ]
+    assert planner.segment(instructions) == [(True, [0, 1, 2]), (False, [3]), (False, [4])]
+
+    plans = list(planner.iter_plans(instructions))
+    assert len(client.prompts) == 1
+    assert [instruction for instruction, plan in plans] == instructions
+    assert plans[0][1][0]["params"]["package"] == "com.huawei.hmos.settings"
+    assert len(plans[1][1]) == 2
+    # 输入内容为空的条目、依赖屏幕的指令和本地规则可处理的指令都按常规流程执行
+    assert plans[2][1] is None and plans[3][1] is None and plans[4][1] is None
+    assert planner.stats == {"batches": 1, "planned": 2, "fallbacks": 1}
+
+
+def test_batched_launch_falls_back():
+    """批量规划猜错了包名导致启动失败时，按常规流程在桌面上找到应用图标启动"""
+    response = json.dumps({"plans": [
+        {"index": 0, "steps": [{"action": "press_home", "params": {}}]},
+        {"index": 1, "steps": [{"action": "launch_app", "params": {"package": "com.example.settings"}}]},
+    ]})
+    client = ScriptedClient(response)
+    fleet = FleetSimulator(1, latency=0.0, jitter=0.0, animation_time=0.0)
+    serial, device = next(iter(fleet.devices.items()))
+    with tempfile.TemporaryDirectory() as work_dir:
+        agent = fleet.agent(serial, work_dir)
+        agent._parser = InstructionParser(client=client)
+        agent._router = agent._parser.router
+        assert agent.execute_multiple_instructions(["回到桌面后按菜单键", "启动设置应用"])
+    assert len(client.prompts) == 1
+    assert device.screen == ("app", "com.huawei.hmos.settings")
+
+
+if __name__ == "__main__":
+    test_batch_planner()
+    test_batched_launch_falls_back()
+    print("批量规划测试通过")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+闭环执行器的测试脚本：使用脚本化的代理和模型，无需设备和LLM
+"""
+
+import json
+
+from ClosedLoopExecutor import ClosedLoopExecutor
+from InstructionParser import InstructionParser
+
+
+class ScriptedClient:
+    """按顺序返回预设决策，并记录每轮请求的消息"""
+
+    def __init__(self, decisions):
+        self.decisions = list(decisions)
+        self.requests = []
+
+    def chat(self, messages, model_id=None):
+        self.requests.append(messages)
+        return json.dumps(self.decisions.pop(0), ensure_ascii=False)
+
+
+class ScriptedAgent:
+    def __init__(self, client):
+        self.client = client
+        self.parser = InstructionParser(client=client)
+        self.actions = []
+
+    def get_screenshot_and_elements(self):
+        screen = len(self.actions)
+        return "screenshot.jpeg", [
+            {"type": "button", "text": f"下一页{screen}", "position": [100, 200, 300, 260], "clickable": True},
+        ]
+
+    def _execute_action_and_settle(self, action):
+        self.actions.append(action)
+        return True
+
+
+def test_closed_loop_prefix_and_bounded_history():
+    """前缀在各轮之间逐字节不变，步骤记录不随步数线性增长"""
+    steps = 20
+    decisions = [
+        {"status": "continue", "action": {"action": "click", "params": {"coordinates": [200, 230]}}, "reason": "翻页"}
+    ] * steps + [{"status": "done"}]
+    client = ScriptedClient(decisions)
+    agent = ScriptedAgent(client)
+    executor = ClosedLoopExecutor(agent, max_steps=steps + 1)
+
+    assert executor.run("一直翻到最后一页")
+    assert len(agent.actions) == steps
+    prefixes = {json.dumps(messages[:2], ensure_ascii=False) for messages in client.requests}
+    assert len(prefixes) == 1
+    assert "下一页20" in client.requests[-1][-1]["content"]
+    sizes = list(executor.stats["prompt_chars"])
+    assert len(sizes) == steps + 1 and executor.stats["prompt_chars_total"] == sum(sizes)
+    # 历史步骤达到上限后，每轮请求的大小基本不变
+    assert max(sizes[10:]) - min(sizes[10:]) < 60
+
+    # 多次执行任务后只保留最近一个任务长度的记录
+    client.decisions.extend([{"status": "done"}] * (steps + 5))
+    for _ in range(steps + 5):
+        assert executor.run("返回桌面")
+    assert len(executor.stats["prompt_chars"]) == steps + 1
+    assert executor.stats["steps"] == 2 * steps + 6
+
+
+if __name__ == "__main__":
+    test_closed_loop_prefix_and_bounded_history()
+    print("闭环执行器测试通过")
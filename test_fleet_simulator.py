@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+虚拟设备集群的测试脚本：虚拟设备的界面状态、故障注入，以及在模拟LLM接口上的负载测试，无需设备
+"""
+
+import importlib.util
+import os
+import tempfile
+
+from FleetSimulator import FleetSimulator, MockLLMServer, VirtualDevice, run_load
+
+
+def test_virtual_device_navigation():
+    """点击和返回会改变界面状态，截图和控件树随之变化"""
+    fleet = FleetSimulator(1, latency=0.0, jitter=0.0, animation_time=0.0)
+    serial = next(iter(fleet.devices))
+    with tempfile.TemporaryDirectory() as work_dir:
+        device_manager = fleet.device_manager(serial, work_dir)
+        assert device_manager.check_device_connected()
+        assert device_manager.get_screen_size() == (1260, 2720)
+
+        home_frame = os.path.join(work_dir, "home.jpeg")
+        assert device_manager.get_screenshot(home_frame)
+        elements = device_manager.dump_layout()
+        settings = next(element for element in elements if element["text"] == "设置")
+        x1, y1, x2, y2 = settings["position"]
+        assert device_manager.tap((x1 + x2) // 2, (y1 + y2) // 2)
+
+        app_frame = os.path.join(work_dir, "app.jpeg")
+        assert device_manager.get_screenshot(app_frame)
+        with open(home_frame, "rb") as f, open(app_frame, "rb") as g:
+            assert f.read() != g.read()
+        assert "WLAN" in [element["text"] for element in device_manager.dump_layout()]
+        assert device_manager.foreground_app == "com.huawei.hmos.settings"
+        assert device_manager.get_foreground_activity() == "com.huawei.hmos.settings/MainAbility"
+
+    assert device_manager.press_back()
+    assert fleet.devices[serial].screen == ("home",)
+
+
+def test_fault_injection_over_tcp():
+    """注入的失败返回错误，断开期间设备不出现在设备列表中"""
+    device = VirtualDevice("SIMDEV000001", latency=0.0, jitter=0.0, failure_rate=1.0, seed=1)
+    fleet = FleetSimulator(0)
+    fleet.devices[device.serial] = device
+    fleet.start_server()
+    try:
+        transport = fleet.transport(device.serial, tcp=True)
+        return_code, _, stderr = transport.execute(["shell", "wm", "size"])
+        assert return_code == 1 and "simulated" in stderr
+        assert device.stats["failures"] == 1
+
+        device.failure_rate = 0.0
+        device.disconnect_rate = 1.0
+        device.disconnect_duration = 60
+        assert transport.execute(["shell", "wm", "size"])[0] == 0
+        assert not device.online
+        assert transport.execute(["list", "targets"])[1] == "[Empty]"
+        assert transport.execute(["shell", "wm", "size"])[0] == 1
+        transport.close()
+    finally:
+        fleet.stop()
+
+
+def test_load_driver():
+    """在多台虚拟设备上并发执行指令，报告吞吐、延迟分位数和资源占用"""
+    if importlib.util.find_spec("openai") is None or importlib.util.find_spec("dotenv") is None:
+        print("未安装openai或python-dotenv，跳过负载测试")
+        return
+    fleet = FleetSimulator(3, latency=0.001, jitter=0.0)
+    llm = MockLLMServer(latency=0.01, jitter=0.0)
+    llm_url = llm.start()
+    try:
+        report = run_load(fleet, ["回到桌面", "打开设置", "点击WLAN", "返回"], rounds=1, llm_url=llm_url)
+    finally:
+        llm.stop()
+    assert report["devices"] == 3 and report["instructions"] == 12
+    assert report["succeeded"] == 12
+    assert report["latency_p50"] <= report["latency_p99"] <= report["latency_max"]
+    assert report["cpu_seconds"] > 0
+    assert all(device.screen == ("home",) or device.screen[0] == "app" for device in fleet.devices.values())
+
+
+if __name__ == "__main__":
+    test_virtual_device_navigation()
+    test_fault_injection_over_tcp()
+    test_load_driver()
+    print("虚拟设备集群测试通过")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+画面环形缓冲区的测试脚本：按帧数和字节数淘汰旧帧，以及操作前开始截取的帧不算作操作后的画面，无需设备
+"""
+
+import threading
+import time
+
+from FrameRingBuffer import ContinuousCapture, FrameRingBuffer
+
+
+class GatedDevice:
+    """每次截取都等待测试放行的设备管理器替身"""
+
+    def __init__(self):
+        self.started = threading.Semaphore(0)
+        self.release = threading.Semaphore(0)
+        self.count = 0
+
+    def capture_frame(self, width=None, height=None, channel="frame"):
+        self.started.release()
+        self.release.acquire()
+        self.count += 1
+        return f"frame-{self.count}".encode()
+
+
+def test_ring_buffer_limits():
+    """超出帧数或字节数时丢弃最旧的帧，但至少保留最新的一帧"""
+    buffer = FrameRingBuffer(max_frames=3, max_bytes=10)
+    for data in (b"aa", b"bb", b"cc", b"dd"):
+        buffer.append(data)
+    assert [frame.data for frame in buffer.recent()] == [b"bb", b"cc", b"dd"]
+    assert buffer.total_bytes == 6 and buffer.latest().sequence == 4
+    assert [frame.data for frame in buffer.recent(2)] == [b"cc", b"dd"]
+
+    buffer.append(b"0123456789ab")
+    assert len(buffer) == 1 and buffer.latest().data == b"0123456789ab"
+    assert buffer.wait_for_frame(after_sequence=5, timeout=0.01) is None
+
+
+def test_frame_started_before_action_is_stale():
+    """截取过程中完成的操作：该帧按开始截取的时间判断，不能当作操作后的画面"""
+    device = GatedDevice()
+    capture = ContinuousCapture(device)
+    capture.start()
+    try:
+        # 第一帧开始截取后才执行操作
+        assert device.started.acquire(timeout=2)
+        action_time = time.monotonic()
+        device.release.release()
+        frame = capture.frame_buffer.wait_for_frame(timeout=2)
+        assert frame.data == b"frame-1" and frame.monotonic < action_time
+        assert capture.frame_buffer.latest(newer_than=action_time) is None
+
+        # 操作之后才开始截取的帧才是新画面
+        assert device.started.acquire(timeout=2)
+        device.release.release()
+        frame = capture.frame_buffer.wait_for_frame(newer_than=action_time, timeout=2)
+        assert frame is not None and frame.data == b"frame-2"
+        assert capture.frame_buffer.latest(newer_than=action_time) is frame
+    finally:
+        capture._stop_event.set()
+        device.release.release()
+        capture.stop()
+
+
+if __name__ == "__main__":
+    test_ring_buffer_limits()
+    test_frame_started_before_action_is_stale()
+    print("画面环形缓冲区测试通过")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+本地图标定位器的测试脚本：参考图标与截图分辨率不同时仍能定位（需要NumPy和Pillow）
+"""
+
+import os
+import tempfile
+
+from IconLocator import IconLocator, _load_modules
+
+
+def _draw_icon(Image, ImageDraw, size, shape):
+    icon = Image.new("L", (size, size), 200)
+    draw = ImageDraw.Draw(icon)
+    if shape == "settings":
+        draw.ellipse((size // 12, size // 12, size * 11 // 12, size * 11 // 12), fill=60)
+        draw.rectangle((size // 3, size // 3, size * 2 // 3, size * 2 // 3), fill=230)
+    else:
+        draw.polygon([(size // 2, size // 24), (size * 23 // 24, size * 23 // 24), (size // 24, size * 23 // 24)], fill=40)
+    return icon
+
+
+def test_icon_locator_multi_scale():
+    """参考图标为120像素，截图中的图标为150像素"""
+    if _load_modules() is None:
+        print("未安装NumPy或Pillow，跳过图标定位测试")
+        return
+    from PIL import Image, ImageDraw
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        icon_dir = os.path.join(work_dir, "icons")
+        os.makedirs(icon_dir)
+        _draw_icon(Image, ImageDraw, 120, "settings").save(os.path.join(icon_dir, "设置.png"))
+        _draw_icon(Image, ImageDraw, 120, "gallery").save(os.path.join(icon_dir, "图库.png"))
+
+        screen = Image.new("L", (1260, 2720), 235)
+        screen.paste(_draw_icon(Image, ImageDraw, 150, "settings"), (700, 1850))
+        screen.paste(_draw_icon(Image, ImageDraw, 150, "gallery"), (990, 1850))
+        screenshot_path = os.path.join(work_dir, "screenshot.png")
+        screen.save(screenshot_path)
+
+        locator = IconLocator(icon_dir)
+        assert locator.match_name("打开设置") == "设置"
+        element = locator.resolve("打开设置", screenshot_path)
+        assert element is not None and element["confidence"] >= 0.9
+        x1, y1, x2, y2 = element["position"]
+        assert abs((x1 + x2) // 2 - 775) <= 4 and abs((y1 + y2) // 2 - 1925) <= 4
+        assert locator.resolve("打开相机", screenshot_path) is None
+
+
+if __name__ == "__main__":
+    test_icon_locator_multi_scale()
+    print("图标定位测试通过")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+界面分析缓存的测试脚本：同一页面在不同分辨率的设备上共用分析结果，共用标题栏和底栏的不同页面不会误命中
+"""
+
+import importlib.util
+import io
+import os
+import tempfile
+
+from LayoutCache import LayoutCache, aspect_class
+
+SCREEN_DATA = b"\xff\xd8same-page\xff\xd9"
+PAGE_KEY = "com.example.app/com.example.app.MainAbility"
+NETWORK_ROWS = ["WLAN", "Bluetooth", "Mobile network", "More connections", "Display", "Sound"]
+DEVICE_ROWS = ["Battery", "Storage", "Security", "Privacy", "Accounts", "System"]
+ELEMENTS = [
+    {"type": "icon", "text": "设置", "position": [540, 1170, 648, 1287]},
+    {"type": "button", "description": "确定", "x": 108, "y": 234, "width": 216, "height": 117},
+]
+
+
+def render_page(screen_size, title, rows):
+    """按屏幕尺寸绘制一个列表页面：状态栏、标题栏、若干列表行和底栏，返回JPEG数据"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, height = screen_size
+    scale = width / 1080
+    image = Image.new("RGB", screen_size, (245, 245, 245))
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=int(48 * scale))
+    draw.rectangle((0, 0, width, int(96 * scale)), fill=(30, 30, 30))
+    draw.rectangle((0, int(96 * scale), width, int(260 * scale)), fill=(255, 255, 255))
+    draw.text((int(48 * scale), int(140 * scale)), title, fill=(0, 0, 0), font=font)
+    row_height = int(180 * scale)
+    for index, text in enumerate(rows):
+        y = int(300 * scale) + index * row_height
+        draw.rectangle((int(32 * scale), y, width - int(32 * scale), y + row_height - int(24 * scale)),
+                       fill=(255, 255, 255))
+        draw.text((int(64 * scale), y + int(48 * scale)), text, fill=(40, 40, 40), font=font)
+    draw.rectangle((0, height - int(160 * scale), width, height), fill=(255, 255, 255))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def test_layout_cache_across_resolutions():
+    """内容相同的截图直接命中，1080x2340设备上的分析结果换算到1260x2720设备"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "layout_cache.sqlite3")
+        assert aspect_class(1080, 2340) == aspect_class(1260, 2720)
+        assert LayoutCache(path).store("com.example.app", SCREEN_DATA, (1080, 2340), ELEMENTS)
+        assert not LayoutCache(path).store("com.example.app", SCREEN_DATA, (1080, 2340), {"text": "无法解析"})
+
+        # 另一个进程/设备打开同一缓存文件
+        cache = LayoutCache(path)
+        assert cache.lookup("com.example.app", SCREEN_DATA, (1260, 2720)) == [
+            {"type": "icon", "text": "设置", "position": [630, 1360, 756, 1496]},
+            {"type": "button", "description": "确定", "x": 126, "y": 272, "width": 252, "height": 136},
+        ]
+        # 应用或宽高比不同时不命中
+        assert cache.lookup("com.other.app", SCREEN_DATA, (1260, 2720)) is None
+        assert cache.lookup("com.example.app", SCREEN_DATA, (1600, 2560)) is None
+        assert cache.get_stats() == {"hits": 1, "misses": 2, "entries": 1}
+
+        # 同一截图再次保存时更新原有记录
+        moved = [dict(ELEMENTS[0], position=[0, 0, 108, 117])]
+        assert cache.store("com.example.app", SCREEN_DATA, (1080, 2340), moved)
+        assert cache.get_stats()["entries"] == 1
+        assert cache.lookup("com.example.app", SCREEN_DATA, (1080, 2340)) == moved
+        cache.close()
+
+
+def test_layout_cache_rendered_pages():
+    """分辨率不同的同一页面需要前台页面相同才命中，共用标题栏和底栏的其他页面不命中"""
+    if importlib.util.find_spec("PIL") is None:
+        print("未安装Pillow，跳过感知哈希测试")
+        return
+    small_network = render_page((1080, 2340), "Settings", NETWORK_ROWS)
+    large_network = render_page((1260, 2720), "Settings", NETWORK_ROWS)
+    large_device = render_page((1260, 2720), "Settings", DEVICE_ROWS)
+    large_renamed = render_page((1260, 2720), "Settings", NETWORK_ROWS[:5] + ["Sounds & vibration"])
+    with tempfile.TemporaryDirectory() as work_dir:
+        cache = LayoutCache(os.path.join(work_dir, "layout_cache.sqlite3"))
+        assert cache.store("com.example.app", small_network, (1080, 2340), ELEMENTS, page_key=PAGE_KEY)
+
+        assert cache.lookup("com.example.app", large_network, (1260, 2720), page_key=PAGE_KEY)[0]["position"] == [
+            630, 1360, 756, 1496]
+        # 无法确认前台页面，或前台页面不同时，内容不完全相同就不命中
+        assert cache.lookup("com.example.app", large_network, (1260, 2720)) is None
+        assert cache.lookup("com.example.app", large_network, (1260, 2720),
+                            page_key="com.example.app/com.example.app.DetailAbility") is None
+        # 同一Ability下的不同页面：标题栏和底栏相同，列表内容不同
+        assert cache.lookup("com.example.app", large_device, (1260, 2720), page_key=PAGE_KEY) is None
+        assert cache.lookup("com.example.app", large_renamed, (1260, 2720), page_key=PAGE_KEY) is None
+        assert cache.get_stats() == {"hits": 1, "misses": 4, "entries": 1}
+        cache.close()
+
+
+if __name__ == "__main__":
+    test_layout_cache_across_resolutions()
+    test_layout_cache_rendered_pages()
+    print("界面分析缓存测试通过")
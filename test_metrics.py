@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+运行指标的测试脚本：设备命令按种类计时、Prometheus文本导出和HTTP接口，无需设备
+"""
+
+import gc
+import urllib.request
+
+from ActionVerifier import VERIFIED
+from HarmonyAutoAgent import HarmonyAutoAgent
+from HarmonyDeviceManager import HarmonyDeviceManager, command_kind
+from Metrics import MetricsRegistry, get_registry
+
+
+class FakeTransport:
+    def execute(self, args, timeout=30):
+        if "keyevent" in args:
+            return -1, "", "命令执行超时"
+        return 0, "", ""
+
+
+def test_command_kind():
+    device_manager = HarmonyDeviceManager("hdc")
+    assert command_kind(device_manager._tap_args(1, 2)) == "tap"
+    assert command_kind(device_manager._swipe_args(1, 2, 3, 4)) == "swipe"
+    assert command_kind(device_manager._key_args(4)) == "key"
+    assert command_kind(device_manager._layout_steps("/tmp/layout.json")[0][0]) == "layout"
+    assert command_kind(["file", "recv", "/data/local/tmp/a.jpeg", "a.jpeg"]) == "file_recv"
+    assert command_kind(["shell", "cat", "/proc/meminfo"]) == "shell"
+
+
+def test_device_command_metrics():
+    """设备命令按种类记录耗时，超时计入失败原因"""
+    registry = get_registry()
+    seconds = registry.histogram("device_command_seconds")
+    failures = registry.counter("agent_failures_total")
+    taps = seconds.snapshot().get((("kind", "tap"),), {"count": 0})["count"]
+    timeouts = failures.get(reason="device_timeout")
+
+    device_manager = HarmonyDeviceManager("hdc", transport=FakeTransport())
+    assert device_manager.tap(100, 200)
+    assert not device_manager.press_back()
+
+    assert seconds.snapshot()[(("kind", "tap"),)]["count"] == taps + 1
+    assert failures.get(reason="device_timeout") == timeouts + 1
+    assert 'device_command_seconds_bucket{kind="tap",le="+Inf"}' in registry.render()
+
+
+def test_registry_export():
+    registry = MetricsRegistry()
+    latency = registry.histogram("llm_request_seconds", "LLM单次请求耗时")
+    for value in (0.2, 0.3, 0.4, 4.0):
+        latency.observe(value, model="deepseek-chat")
+    registry.counter("agent_instructions_total").inc(mode="single", outcome="success")
+    registry.counter("agent_cache_lookups_total").inc(cache="layout", result="hit")
+    registry.counter("agent_cache_lookups_total").inc(cache="layout", result="miss")
+    registry.register_collector("limiter", lambda: [("llm_rate_limiter_throttled_total", "counter", "", {}, 3)])
+
+    assert latency.quantile(0.5, model="deepseek-chat") == 0.5
+    assert latency.quantile(0.95, model="deepseek-chat") == 4.0
+
+    text = registry.render()
+    assert "# TYPE llm_request_seconds histogram" in text
+    assert 'llm_request_seconds_bucket{model="deepseek-chat",le="0.5"} 3' in text
+    assert 'llm_request_seconds_count{model="deepseek-chat"} 4' in text
+    assert "llm_rate_limiter_throttled_total 3" in text
+
+    summary = registry.summary()
+    assert "指令吞吐" in summary and "缓存命中率[layout]: 50.0%" in summary
+
+    port = registry.serve(0)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "agent_instructions_total" in response.read().decode("utf-8")
+    finally:
+        registry.shutdown()
+
+
+def test_agent_collectors_per_device():
+    """同一进程中的多个代理按设备分别导出，代理被回收后不再导出也不再被注册表持有"""
+    registry = get_registry()
+    agents = []
+    for serial, count in (("SIMDEV100001", 3), ("SIMDEV100002", 5)):
+        agent = HarmonyAutoAgent("hdc", transport=FakeTransport(), device_id=serial)
+        agent.action_verifier.counts[VERIFIED] = count
+        agents.append(agent)
+    text = registry.render()
+    assert 'agent_action_verifications_total{device="SIMDEV100001",status="verified"} 3' in text
+    assert 'agent_action_verifications_total{device="SIMDEV100002",status="verified"} 5' in text
+
+    del agent
+    agents.pop()
+    gc.collect()
+    text = registry.render()
+    assert 'device="SIMDEV100001",status="verified"} 3' in text
+    assert "SIMDEV100002" not in text
+
+
+def test_collector_merge():
+    """不同采集函数给出同一组标签时，计数器累加"""
+    registry = MetricsRegistry()
+    registry.register_collector("a", lambda: [("jobs_total", "counter", "", {"device": "x"}, 2)])
+    registry.register_collector("b", lambda: [("jobs_total", "counter", "", {"device": "x"}, 3)])
+    assert 'jobs_total{device="x"} 5' in registry.render()
+
+
+if __name__ == "__main__":
+    test_command_kind()
+    test_device_command_metrics()
+    test_registry_export()
+    test_agent_collectors_per_device()
+    test_collector_merge()
+    print("运行指标测试通过")
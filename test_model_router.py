@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+模型分级路由的测试脚本：用脚本化的客户端检查每个任务由哪一层完成，以及文本层要求查看屏幕时升级到视觉层，无需LLM
+"""
+
+import json
+
+from InstructionParser import InstructionParser
+from ModelRouter import ModelRouter
+
+SCREENSHOT = "screen.jpeg"
+ELEMENTS = [
+    {"type": "button", "text": "WLAN设置", "position": [0, 100, 1260, 200]},
+    {"type": "button", "text": "WLAN开关", "position": [1000, 100, 1200, 200]},
+]
+
+
+class ScriptedClient:
+    """按顺序返回预设的文本层和视觉层回复，并记录每次调用的层级"""
+
+    def __init__(self, text=(), vision=()):
+        self.text = list(text)
+        self.vision = list(vision)
+        self.calls = []
+
+    def generate(self, prompt, system_prompt=None, model_id=None, response_format=None):
+        self.calls.append("text")
+        return self.text.pop(0)
+
+    def generate_with_image(self, prompt, image_path, system_prompt=None, model_id=None, response_format=None):
+        self.calls.append(("vision", image_path))
+        return self.vision.pop(0)
+
+
+def _parser(client):
+    return InstructionParser(client=client, router=ModelRouter(client, confidence_threshold=0.6))
+
+
+def test_rules_and_text_tier():
+    """关键词明确的任务由本地规则完成；文本层把握足够时不升级"""
+    client = ScriptedClient(text=[json.dumps(ELEMENTS[0], ensure_ascii=False)])
+    parser = _parser(client)
+    assert parser.parse_instruction("返回") == {"action": "press_back", "params": {}}
+    assert parser.find_target_element("点击WLAN", ELEMENTS, SCREENSHOT)["text"] == "WLAN设置"
+    assert client.calls == ["text"]
+    stats = parser.router.get_stats()
+    assert stats["tiers"] == {"parse_instruction/rules": 1, "find_target_element/text": 1}
+    assert stats["escalations"] == []
+
+
+def test_need_screen_escalation():
+    """文本层返回need_screen时带截图升级到视觉层，并记录升级原因"""
+    client = ScriptedClient(text=['{"need_screen": true}'], vision=[json.dumps(ELEMENTS[1], ensure_ascii=False)])
+    parser = _parser(client)
+    assert parser.find_target_element("点击WLAN", ELEMENTS, SCREENSHOT)["text"] == "WLAN开关"
+    assert client.calls == ["text", ("vision", SCREENSHOT)]
+    stats = parser.router.get_stats()
+    assert stats["tiers"] == {"find_target_element/text": 1, "find_target_element/vision": 1}
+    assert stats["escalations"][0]["reason"] == "模型要求查看屏幕"
+
+    # 没有截图时无法升级，直接使用文本层的结果
+    client = ScriptedClient(text=['{"need_screen": true}'])
+    parser = _parser(client)
+    assert parser.find_target_element("点击WLAN", ELEMENTS) is None
+    assert client.calls == ["text"]
+
+
+def test_pixels_required():
+    """没有控件树时识别元素、没有可匹配的元素时查找目标，都跳过文本层直接使用视觉层"""
+    elements = json.dumps({"elements": ELEMENTS + [{"text": "没有位置"}]}, ensure_ascii=False)
+    client = ScriptedClient(vision=[elements, json.dumps(ELEMENTS[0], ensure_ascii=False)])
+    router = ModelRouter(client)
+    assert router.extract_elements(SCREENSHOT, ELEMENTS) == ELEMENTS
+    assert router.extract_elements(SCREENSHOT) == {"elements": ELEMENTS}
+    parser = InstructionParser(client=client, router=router)
+    assert parser.find_target_element("点击WLAN", {"error": "无法解析UI元素"}, SCREENSHOT)["text"] == "WLAN设置"
+    assert client.calls == [("vision", SCREENSHOT), ("vision", SCREENSHOT)]
+    assert router.get_stats()["tiers"] == {
+        "extract_elements/rules": 1, "extract_elements/vision": 1, "find_target_element/vision": 1,
+    }
+
+
+if __name__ == "__main__":
+    test_rules_and_text_tier()
+    test_need_screen_escalation()
+    test_pixels_required()
+    print("模型分级路由测试通过")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+限流器和熔断器的测试脚本：令牌桶透支与归还、熔断的打开/半开/关闭，半开探测遇到429后能够恢复，
+以及客户端错误不被当作端点健康、没有状态码的错误计入故障，无需LLM
+"""
+
+import time
+from types import SimpleNamespace
+
+import OpenAICompatibleClient as client_module
+from OpenAICompatibleClient import LLMRequestError, OpenAICompatibleClient
+from RateLimiter import CircuitBreaker, CircuitOpenError, RateLimiter, TokenBucket
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class ScriptedCompletions:
+    """按顺序返回状态码：整数抛出对应的错误，异常直接抛出，None返回成功的响应"""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+
+    def create(self, model, messages, **options):
+        status = self.statuses.pop(0)
+        if isinstance(status, Exception):
+            raise status
+        if status is not None:
+            raise StatusError(status)
+        message = SimpleNamespace(content="ok")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def test_token_bucket():
+    bucket = TokenBucket(2, 1.0)
+    now = bucket.updated_at
+    assert bucket.reserve(1, now) == 0.0
+    assert bucket.reserve(1, now) == 0.0
+    # 透支后需要等待余额回到0
+    assert abs(bucket.reserve(1, now) - 1.0) < 1e-9
+    # 1.5秒后补充了1.5个令牌，余额为0.5
+    assert bucket.reserve(0.5, now + 1.5) == 0.0
+    # 归还不会超过容量
+    bucket.refund(10, now + 1.5)
+    assert bucket.tokens == 2.0
+
+    limiter = RateLimiter(requests_per_minute=60)
+    limiter._request_bucket = TokenBucket(1, 1000.0)
+    assert limiter.acquire() == 0.0
+    assert limiter.acquire() > 0
+    assert limiter.metrics["acquired"] == 2 and limiter.metrics["throttled"] == 1
+
+
+def test_circuit_breaker_states():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+    # 半开状态只放行一个探测请求
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow() and breaker.allow()
+
+
+def test_half_open_probe_rate_limited():
+    """半开状态的探测请求遇到429时释放探测名额，之后仍能恢复"""
+    client_module._env_loaded = True
+    client = OpenAICompatibleClient(api_key="test", base_url="http://breaker-test.invalid", model_id="test-model")
+    client.max_retries = 0
+    client.circuit_breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=0.05)
+    completions = ScriptedCompletions([500] * 5 + [429, None])
+    client._client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    messages = [{"role": "user", "content": "hi"}]
+
+    for _ in range(5):
+        try:
+            client._create_completion(messages)
+        except LLMRequestError:
+            pass
+    assert client.circuit_breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    try:
+        client._create_completion(messages)
+        assert False, "探测请求应返回429"
+    except LLMRequestError as e:
+        assert e.status_code == 429
+    # 探测名额已释放，熔断器重新打开并重新计时，而不是一直停留在半开状态
+    assert client.circuit_breaker.state == CircuitBreaker.OPEN
+    try:
+        client._create_completion(messages)
+        assert False, "重新计时期间应直接拒绝"
+    except CircuitOpenError:
+        pass
+
+    time.sleep(0.06)
+    assert client._create_completion(messages).choices[0].message.content == "ok"
+    assert client.circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_client_errors_do_not_close_breaker():
+    """401等客户端错误不计入成功也不计入故障，没有状态码的错误计入故障"""
+    client_module._env_loaded = True
+    client = OpenAICompatibleClient(api_key="test", base_url="http://breaker-test.invalid", model_id="test-model")
+    client.max_retries = 0
+    client.circuit_breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+    completions = ScriptedCompletions([500, 401, ValueError("bad response"), 401, None])
+    client._client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    messages = [{"role": "user", "content": "hi"}]
+
+    # 500之后的401不会清零连续失败次数，随后没有状态码的错误打开熔断器
+    for _ in range(3):
+        try:
+            client._create_completion(messages)
+        except LLMRequestError:
+            pass
+    assert client.circuit_breaker.state == CircuitBreaker.OPEN
+    assert client.circuit_breaker.metrics["successes"] == 0
+
+    # 半开状态的探测请求遇到401：密钥无效不代表端点恢复，熔断器重新打开
+    time.sleep(0.06)
+    try:
+        client._create_completion(messages)
+        assert False, "探测请求应返回401"
+    except LLMRequestError as e:
+        assert e.status_code == 401
+    assert client.circuit_breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    assert client._create_completion(messages).choices[0].message.content == "ok"
+    assert client.circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+if __name__ == "__main__":
+    test_token_bucket()
+    test_circuit_breaker_states()
+    test_half_open_probe_rate_limited()
+    test_client_errors_do_not_close_breaker()
+    print("限流器和熔断器测试通过")
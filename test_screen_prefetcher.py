@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+空闲时界面预取的测试脚本：每次界面变化最多分析一次，画面未变化时直接使用预取结果（使用虚拟设备）
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+from FleetSimulator import FleetSimulator
+from ScreenPrefetcher import ScreenPrefetcher
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_prefetch_bounded_and_reused():
+    fleet = FleetSimulator(1, latency=0.0, jitter=0.0, animation_time=0.0)
+    serial, device = next(iter(fleet.devices.items()))
+    with tempfile.TemporaryDirectory() as work_dir:
+        device_manager = fleet.device_manager(serial, work_dir)
+        analyzed = []
+
+        def analyze(path):
+            analyzed.append(path)
+            return device_manager.dump_layout()
+
+        screenshot_path = os.path.join(work_dir, "screenshot.jpeg")
+        prefetcher = ScreenPrefetcher(device_manager, analyze, os.path.join(work_dir, "prefetch.jpeg"),
+                                      poll_interval=0.01)
+        prefetcher.start()
+        try:
+            # 画面不变时空闲再久也只分析一次
+            with prefetcher.idle():
+                assert _wait_for(lambda: analyzed)
+                time.sleep(0.2)
+            assert len(analyzed) == 1 and prefetcher.stats["polls"] > 3
+            elements = prefetcher.take(screenshot_path)
+            assert "设置" in [element["text"] for element in elements]
+            assert os.path.exists(screenshot_path)
+            # 每个空闲期只能取用一次
+            assert prefetcher.take(screenshot_path) is None
+
+            # 界面变化后再分析一次
+            device.launch("com.huawei.hmos.settings")
+            with prefetcher.idle():
+                assert _wait_for(lambda: len(analyzed) == 2)
+                time.sleep(0.1)
+            assert len(analyzed) == 2
+
+            # 输入指令前界面又发生了变化，不使用预取结果
+            device.back()
+            assert prefetcher.take(screenshot_path) is None
+            assert prefetcher.stats["misses"] == 1
+        finally:
+            prefetcher.stop()
+
+
+def test_prefetch_is_quiet_without_patching_stdout():
+    fleet = FleetSimulator(1, latency=0.0, jitter=0.0, animation_time=0.0)
+    serial = next(iter(fleet.devices))
+    with tempfile.TemporaryDirectory() as work_dir:
+        device_manager = fleet.device_manager(serial, work_dir)
+        analyzed = []
+
+        def analyze(path):
+            analyzed.append(path)
+            return device_manager.dump_layout(quiet=True)
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            stdout = sys.stdout
+            prefetcher = ScreenPrefetcher(device_manager, analyze, os.path.join(work_dir, "prefetch.jpeg"),
+                                          poll_interval=0.01)
+            prefetcher.start()
+            try:
+                # 预取器不替换进程的标准输出，后台截图和分析也不输出
+                assert sys.stdout is stdout
+                with prefetcher.idle():
+                    assert _wait_for(lambda: analyzed)
+            finally:
+                prefetcher.stop()
+            assert sys.stdout is stdout
+        assert output.getvalue() == ""
+
+
+if __name__ == "__main__":
+    test_prefetch_bounded_and_reused()
+    test_prefetch_is_quiet_without_patching_stdout()
+    print("界面预取测试通过")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+界面稳定检测的测试脚本：按脚本返回的画面判断稳定与超时，按前台应用学习典型稳定耗时，无需设备
+"""
+
+import os
+import tempfile
+
+from ScreenSettleDetector import ScreenSettleDetector
+
+
+class ScriptedDeviceManager:
+    """按顺序返回预设画面的设备管理器，画面用完后一直返回最后一帧"""
+
+    def __init__(self, frames, foreground="com.example.app/EntryAbility"):
+        self.frames = list(frames)
+        self.foreground = foreground
+        self.captured = 0
+
+    def capture_frame(self, width=None, height=None, channel="frame"):
+        self.captured += 1
+        if len(self.frames) > 1:
+            return self.frames.pop(0)
+        return self.frames[0]
+
+    def get_foreground_activity(self):
+        return self.foreground
+
+
+def test_settle_and_learn():
+    """画面连续两次不变即视为稳定，稳定耗时按前台应用的包名记录并保存"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        profile_path = os.path.join(work_dir, "settle_profile.json")
+        device_manager = ScriptedDeviceManager([b"frame-1", b"frame-2", b"frame-3", b"frame-3"])
+        detector = ScreenSettleDetector(device_manager, poll_interval=0.01, profile_path=profile_path)
+        result = detector.wait_for_settle()
+        assert result["settled"] and result["frames"] == 5
+        assert 0 < result["settle_time"] <= result["elapsed"]
+        assert list(detector.typical_settle_times) == ["com.example.app"]
+
+        # 同一应用再次等待时沿用已学习的耗时，并按滑动平均更新
+        first = detector.typical_settle_times["com.example.app"]
+        device_manager.frames = [b"frame-4", b"frame-4"]
+        assert detector.wait_for_settle()["settled"]
+        assert detector.typical_settle_times["com.example.app"] != first
+        assert ScreenSettleDetector(device_manager, profile_path=profile_path).typical_settle_times == \
+            detector.typical_settle_times
+
+        # 无法获取前台页面时归入default
+        device_manager.foreground = None
+        assert detector.wait_for_settle()["settled"]
+        assert set(detector.typical_settle_times) == {"com.example.app", "default"}
+
+
+def test_settle_timeout():
+    """画面一直变化时等到max_wait为止，不学习稳定耗时"""
+    frames = [f"frame-{i}".encode("ascii") for i in range(1000)]
+    detector = ScreenSettleDetector(ScriptedDeviceManager(frames), poll_interval=0.01, max_wait=0.2)
+    result = detector.wait_for_settle()
+    assert not result["settled"] and result["frames"] > 2
+    assert result["elapsed"] >= 0.2
+    assert detector.typical_settle_times == {}
+
+
+if __name__ == "__main__":
+    test_settle_and_learn()
+    test_settle_timeout()
+    print("界面稳定检测测试通过")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+截图存储的测试脚本：相同画面只保存一份、会话清单，以及后台线程按保留时间和容量清理
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+from ScreenshotStore import ScreenshotStore
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_dedup_and_session():
+    """相同内容只保存一份对象，会话清单记录每一步对应的画面"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        store = ScreenshotStore(os.path.join(work_dir, "pictures"), background_pruning=False)
+        session_id = store.start_session("session")
+        first = store.put_bytes(b"home-screen", label="home")
+        screenshot_path = os.path.join(work_dir, "screenshot.jpeg")
+        with open(screenshot_path, "wb") as f:
+            f.write(b"home-screen")
+        assert store.put_file(screenshot_path, label="again") == first
+        second = store.put_bytes(b"settings-screen", ext=".png")
+
+        assert store.get_stats() == {"objects": 2, "bytes": len(b"home-screen") + len(b"settings-screen"),
+                                     "captures": 3}
+        assert store.get_path(first) == store.object_path(first)
+        assert store.get_path(second).endswith(os.path.join(second[:2], second + ".png"))
+        with open(store.get_path(first), "rb") as f:
+            assert f.read() == b"home-screen"
+
+        with open(os.path.join(store.sessions_dir, f"{session_id}.jsonl"), "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        assert [(record["step"], record["digest"], record["label"]) for record in records] == [
+            (1, first, "home"), (2, first, "again"), (3, second, None),
+        ]
+
+
+def test_background_pruning():
+    """过期的对象由后台线程删除；超出容量时按最近使用时间从旧到新删除"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        root = os.path.join(work_dir, "pictures")
+        store = ScreenshotStore(root, max_bytes=1024 * 1024, max_age=3600, prune_interval=0.05)
+        try:
+            expired = store.put_bytes(b"expired-screen")
+            kept = store.put_bytes(b"kept-screen")
+            # 另一个进程共用同一个索引，把其中一个对象的最近使用时间改到保留时间之前
+            db = sqlite3.connect(os.path.join(root, "index.sqlite3"))
+            db.execute("UPDATE objects SET last_seen = ? WHERE digest = ?", (time.time() - 7200, expired))
+            db.commit()
+            db.close()
+            expired_path = store.get_path(expired)
+
+            # 写入新对象后后台线程开始清理
+            store.put_bytes(b"new-screen")
+            assert _wait_for(lambda: store.get_path(expired) is None)
+            assert not os.path.exists(expired_path)
+            assert store.get_path(kept) is not None
+            assert store.get_stats()["objects"] == 2
+        finally:
+            store.stop_background_pruning()
+
+        # 容量只够两个对象：最久未使用的先删除，重复保存会刷新最近使用时间
+        store = ScreenshotStore(os.path.join(work_dir, "capped"), max_bytes=20, max_age=0,
+                                background_pruning=False)
+        oldest = store.put_bytes(b"0123456789")
+        recent = store.put_bytes(b"abcdefghij")
+        time.sleep(0.01)
+        store.put_bytes(b"0123456789")
+        time.sleep(0.01)
+        newest = store.put_bytes(b"ABCDEFGHIJ")
+        assert store.prune() == 1
+        assert store.get_path(recent) is None
+        assert store.get_path(oldest) is not None and store.get_path(newest) is not None
+
+
+if __name__ == "__main__":
+    test_dedup_and_session()
+    test_background_pruning()
+    print("截图存储测试通过")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+启动耗时基准测试：设备操作命令不能加载LLM相关依赖，导入耗时不能超过预算
+"""
+
+import os
+import subprocess
+import sys
+
+# 导入耗时预算（毫秒），可通过环境变量调整
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "100"))
+
+# 纯设备操作不应加载的模块
+LLM_MODULES = ["openai", "dotenv", "PIL", "numpy", "OpenAICompatibleClient", "InstructionParser", "ModelRouter"]
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run_python(code):
+    """在新的解释器中执行代码，返回标准输出"""
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip()
+
+
+def measure_import_ms(runs=5):
+    """测量导入main和设备管理器的耗时（取多次中的最小值，排除系统抖动）
+
+    Args:
+        runs (int): 测量次数
+
+    Returns:
+        float: 导入耗时（毫秒）
+    """
+    code = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        "import main, HarmonyDeviceManager\n"
+        "print((time.perf_counter() - start) * 1000)\n"
+    )
+    return min(float(_run_python(code)) for _ in range(runs))
+
+
+def test_device_commands_skip_llm_stack():
+    """执行设备操作子命令后不应导入任何LLM相关模块"""
+    code = (
+        "import sys, main\n"
+        "main.run_device_command(['--device-command', sys.executable + ' -c pass', 'tap', '1', '2'])\n"
+        f"print('LOADED:' + ','.join(name for name in {LLM_MODULES!r} if name in sys.modules))\n"
+    )
+    loaded = _run_python(code).splitlines()[-1][len("LOADED:"):]
+    assert loaded == "", f"设备操作加载了LLM相关模块: {loaded}"
+
+
+def test_agent_import_is_lazy():
+    """导入HarmonyAutoAgent时不应导入openai等依赖"""
+    code = (
+        "import sys, HarmonyAutoAgent\n"
+        f"print(','.join(name for name in {LLM_MODULES!r} if name in sys.modules))\n"
+    )
+    loaded = _run_python(code)
+    assert loaded == "", f"导入代理时加载了LLM相关模块: {loaded}"
+
+
+def test_import_budget():
+    """导入耗时不能超过预算"""
+    elapsed = measure_import_ms()
+    assert elapsed <= STARTUP_BUDGET_MS, f"导入耗时{elapsed:.1f}ms，超过预算{STARTUP_BUDGET_MS:.0f}ms"
+
+
+if __name__ == "__main__":
+    elapsed = measure_import_ms()
+    print(f"导入耗时: {elapsed:.1f}ms（预算 {STARTUP_BUDGET_MS:.0f}ms）")
+    test_device_commands_skip_llm_stack()
+    test_agent_import_is_lazy()
+    sys.exit(0 if elapsed <= STARTUP_BUDGET_MS else 1)
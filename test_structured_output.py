@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+结构化输出的测试脚本：本地修复JSON、按字段重新询问，以及端点不支持response_format时的降级，无需LLM
+"""
+
+import json
+from types import SimpleNamespace
+
+import OpenAICompatibleClient as client_module
+from InstructionParser import InstructionParser
+from OpenAICompatibleClient import LLMRequestError, OpenAICompatibleClient, get_format_support
+from StructuredOutput import parse_json
+
+
+class ScriptedClient:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.prompts = []
+
+    def generate(self, prompt, system_prompt=None, model_id=None, response_format=None):
+        self.prompts.append((prompt, response_format))
+        return self.responses.pop(0)
+
+
+class RejectingCompletions:
+    """只接受json_object的端点"""
+
+    def __init__(self):
+        self.formats = []
+
+    def create(self, model, messages, response_format=None):
+        self.formats.append(response_format and response_format["type"])
+        if response_format and response_format["type"] == "json_schema":
+            raise FormatRejected("response_format type json_schema is not supported")
+        message = SimpleNamespace(content='{"start_x": 1, "start_y": 2, "end_x": 3, "end_y": 4}')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+class FormatRejected(Exception):
+    status_code = 400
+
+
+class ContextTooLong(Exception):
+    status_code = 400
+
+
+class OverlongCompletions:
+    """所有请求都因上下文过长被拒绝的端点"""
+
+    def __init__(self):
+        self.formats = []
+
+    def create(self, model, messages, response_format=None):
+        self.formats.append(response_format and response_format["type"])
+        raise ContextTooLong("This model's maximum context length is 8192 tokens")
+
+
+def test_repair_parser():
+    """说明文字、代码块、尾逗号、单引号、Python字面量和截断的输出都能在本地解析"""
+    assert parse_json('好的：\n```json\n{"action": "click", "params": {"coordinates": [1, 2],},}\n```\n完成')[0] == \
+        {"action": "click", "params": {"coordinates": [1, 2]}}
+    assert parse_json("{'action': 'type', 'params': {'text': \"it's\"}, 'done': True}")[0] == \
+        {"action": "type", "params": {"text": "it's"}, "done": True}
+    assert parse_json('{action: "swipe", "start_x": 1, "end_y": [3')[0] == {"action": "swipe", "start_x": 1, "end_y": [3]}
+    assert parse_json('结果：{“text”: “设置”, "position": [1, 2, 3, 4]}')[0] == {"text": "设置", "position": [1, 2, 3, 4]}
+    assert parse_json("无法确定") == (None, None)
+
+
+def test_field_reask():
+    """只缺少一个字段时只重新询问该字段，不重跑整个任务"""
+    client = ScriptedClient([
+        '滑动参数如下：{"start_x": 630, "start_y": 2000, "end_x": 630,}',
+        '{"value": 700}',
+    ])
+    parser = InstructionParser(client=client)
+    params = parser.extract_swipe_params("从屏幕底部向上滑一段距离", (1260, 2720))
+    assert params == {"start_x": 630, "start_y": 2000, "end_x": 630, "end_y": 700}
+    assert len(client.prompts) == 2
+    assert "end_y" in client.prompts[1][0]
+    assert client.prompts[1][1]["json_schema"]["schema"]["properties"]["value"] == {"type": "number"}
+    assert parser.structured.stats["reask_fixed"] == 1
+
+
+def test_format_fallback():
+    """端点拒绝json_schema后降级为json_object，并记住该端点不支持json_schema"""
+    client_module._env_loaded = True
+    client = OpenAICompatibleClient(api_key="test", base_url="http://format-test.invalid", model_id="test-model")
+    completions = RejectingCompletions()
+    client._client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    response_format = {"type": "json_schema", "json_schema": {"name": "swipe_params", "schema": {"type": "object"}}}
+
+    assert json.loads(client.generate("滑动", response_format=response_format))["end_y"] == 4
+    assert completions.formats == ["json_schema", "json_object"]
+    assert get_format_support(client.base_url, "test-model", "json_schema") is False
+    assert get_format_support(client.base_url, "test-model", "json_object") is True
+
+    client.generate("滑动", response_format=response_format)
+    assert completions.formats[2:] == ["json_object"]
+    assert client.get_metrics()["client"]["format_fallbacks"] == 1
+
+    # 超过重新探测的间隔后再次尝试json_schema
+    original = client_module.FORMAT_RECHECK_SECONDS
+    client_module.FORMAT_RECHECK_SECONDS = 0
+    try:
+        assert get_format_support(client.base_url, "test-model", "json_schema") is None
+        client.generate("滑动", response_format=response_format)
+        assert completions.formats[3:] == ["json_schema", "json_object"]
+    finally:
+        client_module.FORMAT_RECHECK_SECONDS = original
+
+
+def test_unrelated_rejection_not_downgraded():
+    """与response_format无关的400照常报错，不记录为不支持结构化输出"""
+    client_module._env_loaded = True
+    client = OpenAICompatibleClient(api_key="test", base_url="http://overlong-test.invalid", model_id="test-model")
+    client.max_retries = 0
+    completions = OverlongCompletions()
+    client._client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    response_format = {"type": "json_schema", "json_schema": {"name": "swipe_params", "schema": {"type": "object"}}}
+
+    try:
+        client.generate("滑动", response_format=response_format)
+        assert False, "上下文过长应抛出异常"
+    except LLMRequestError as e:
+        assert e.status_code == 400
+    assert completions.formats == ["json_schema"]
+    assert get_format_support(client.base_url, "test-model", "json_schema") is None
+    assert client.get_metrics()["client"]["format_fallbacks"] == 0
+
+
+if __name__ == "__main__":
+    test_repair_parser()
+    test_field_reask()
+    test_format_fallback()
+    test_unrelated_rejection_not_downgraded()
+    print("结构化输出测试通过")
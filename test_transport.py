@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+直连hdc/adb server传输的测试脚本，使用本地替身server，无需真实设备
+"""
+
+import asyncio
+import os
+import socket
+import tempfile
+import time
+
+from AsyncHarmonyDeviceManager import AsyncHarmonyDeviceManager
+from DeviceServerStandIn import AdbStandInServer, HdcStandInServer, InMemoryDevice
+from DeviceTransport import ADB_SHELL_CLOSE_STDIN, AdbServerTransport, HdcServerTransport, TransportError
+from FleetSimulator import FleetSimulator
+from HarmonyDeviceManager import HarmonyDeviceManager
+from ScreenshotStore import ScreenshotStore
+from TextEntryEngine import TextEntryEngine
+
+SERIAL = "FMR0223A01000001"
+SCREENSHOT_DATA = b"\xff\xd8fake-jpeg\xff\xd9"
+
+
+def _make_device(remote_screenshot):
+    return InMemoryDevice(
+        responses={"wm size": (0, "Physical size: 1260x2720", "")},
+        files={remote_screenshot: SCREENSHOT_DATA},
+    )
+
+
+def _check_device_manager(device_command, transport, device, work_dir):
+    manager = HarmonyDeviceManager(
+        device_command,
+        screenshot_store=ScreenshotStore(os.path.join(work_dir, "pictures"), background_pruning=False),
+        transport=transport,
+    )
+    assert manager.check_command_available()
+    assert manager.check_device_connected()
+    assert manager.tap(753, 1923)
+    assert "uinput -T -d 753 1923 -u 753 1923" in device.commands
+    assert manager.get_screen_size() == (1260, 2720)
+
+    save_path = os.path.join(work_dir, "screenshot.jpeg")
+    assert manager.get_screenshot(save_path)
+    with open(save_path, "rb") as f:
+        assert f.read() == SCREENSHOT_DATA
+    transport.close()
+
+
+def test_hdc_server_transport():
+    """通过hdc替身server完成握手、设备检查、点击和文件接收"""
+    device = _make_device("/data/local/tmp/screenshot.jpeg")
+    server = HdcStandInServer({SERIAL: device})
+    port = server.start()
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            _check_device_manager("hdc", HdcServerTransport(SERIAL, port=port), device, work_dir)
+    finally:
+        server.stop()
+
+
+def test_adb_server_transport():
+    """通过adb替身server完成shell v2、设备检查和sync拉取文件，拉取失败时不留下临时文件"""
+    device = _make_device("/sdcard/screenshot.png")
+    server = AdbStandInServer({SERIAL: device})
+    port = server.start()
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            _check_device_manager("adb", AdbServerTransport(SERIAL, port=port), device, work_dir)
+            # shell v2连接上只发送关闭stdin的控制包
+            assert server.stdin_packets and set(server.stdin_packets) == {ADB_SHELL_CLOSE_STDIN}
+
+            transport = AdbServerTransport(SERIAL, port=port, pool_size=0)
+            local_path = os.path.join(work_dir, "missing.png")
+            assert transport.execute(["pull", "/sdcard/missing.png", local_path])[0] == -1
+            assert not os.path.exists(local_path) and not os.path.exists(local_path + ".part")
+    finally:
+        server.stop()
+
+
+def test_adb_shell_v2_kept_after_dropped_connection():
+    """连接中断不是server拒绝shell v2，之后仍使用shell v2"""
+    transport = AdbServerTransport(SERIAL, pool_size=0)
+    sock, peer = socket.socketpair()
+    peer.close()
+    try:
+        transport._shell(sock, "echo hi")
+        assert False, "连接已关闭时应抛出异常"
+    except (OSError, TransportError):
+        pass
+    finally:
+        sock.close()
+    assert transport._shell_v2
+
+
+def test_adb_shell_v1_fallback():
+    """设备不支持shell v2时退回旧协议"""
+    device = InMemoryDevice(responses={"echo hi": (0, "hi", "")})
+    server = AdbStandInServer({SERIAL: device}, shell_v2=False)
+    port = server.start()
+    try:
+        transport = AdbServerTransport(SERIAL, port=port, pool_size=0)
+        assert transport.execute("shell echo hi") == (0, "hi", "")
+        assert transport.execute("shell echo hi") == (0, "hi", "")
+    finally:
+        server.stop()
+
+
+def test_async_device_manager():
+    """异步设备管理器并发执行命令，超时和取消时终止进程"""
+    device = InMemoryDevice(responses={"wm size": (0, "Physical size: 1260x2720", "")}, latency=0.1)
+    server = HdcStandInServer({SERIAL: device})
+    port = server.start()
+
+    async def run(work_dir):
+        store = ScreenshotStore(os.path.join(work_dir, "pictures"), background_pruning=False)
+        manager = AsyncHarmonyDeviceManager(
+            "hdc", screenshot_store=store, transport=HdcServerTransport(SERIAL, port=port, pool_size=0)
+        )
+        started = time.monotonic()
+        results = await asyncio.gather(*(manager.tap(100 * i, 200) for i in range(4)))
+        assert all(results)
+        # 4条命令并发执行，总耗时明显少于串行执行
+        assert time.monotonic() - started < 0.35
+        assert await manager.get_screen_size() == (1260, 2720)
+        manager.transport.close()
+
+        # 用sleep模拟卡住的设备命令
+        slow = AsyncHarmonyDeviceManager("sleep", screenshot_store=store)
+        assert await slow.execute_command(["5"], timeout=0.2) == (-1, "", "命令执行超时")
+        task = asyncio.ensure_future(slow.execute_command(["5"]))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        try:
+            await task
+            assert False, "任务应被取消"
+        except asyncio.CancelledError:
+            pass
+
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            asyncio.run(run(work_dir))
+    finally:
+        server.stop()
+
+
+def test_async_concurrent_file_commands():
+    """同一设备上同时截图和导出控件树时各用各的临时文件，换一个事件循环也能继续使用"""
+    fleet = FleetSimulator(1, latency=0.02, jitter=0.0, animation_time=0.0)
+    serial, device = next(iter(fleet.devices.items()))
+    commands = []
+    shell = device.shell
+    device.shell = lambda command: commands.append(command) or shell(command)
+
+    async def run(manager, work_dir):
+        paths = [os.path.join(work_dir, f"screenshot-{i}.jpeg") for i in range(4)]
+        results = await asyncio.gather(*(manager.get_screenshot(path) for path in paths),
+                                       *(manager.dump_layout() for _ in range(4)))
+        assert all(results[:4]) and all(results[4:])
+        assert "设置" in [element["text"] for element in results[4]]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        store = ScreenshotStore(os.path.join(work_dir, "pictures"), background_pruning=False)
+        manager = AsyncHarmonyDeviceManager("hdc", screenshot_store=store, transport=fleet.transport(serial),
+                                            device_id=serial, max_concurrency=2)
+        asyncio.run(run(manager, work_dir))
+        asyncio.run(run(manager, work_dir))
+    remote_paths = [command.split()[-1] for command in commands
+                    if command.startswith(("snapshot_display", "uitest dumpLayout"))]
+    assert len(remote_paths) == len(set(remote_paths)) == 16
+    # 所有临时文件都已清理
+    assert device.files == {}
+
+
+def test_text_entry_engine():
+    """长文本分块输入；非ASCII文本在支持uitest的设备上改用uitest"""
+    fleet = FleetSimulator(1, latency=0.0, jitter=0.0, animation_time=0.0)
+    serial, device = next(iter(fleet.devices.items()))
+    commands = []
+    shell = device.shell
+    device.shell = lambda command: commands.append(command) or shell(command)
+    fleet.start_server()
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            # 经过hdc替身server，检查文本中的特殊字符能原样传到设备端shell
+            manager = fleet.device_manager(serial, work_dir, tcp=True)
+            engine = TextEntryEngine(manager, verify=False)
+            result = engine.enter_text("你好，世界" * 100)
+            assert result["success"] and result["strategy"] == "uitest"
+            assert result["commands"] == 2 and result["chars_per_second"] > 0
+
+            # uitest不可用时，ASCII文本分块走input text，特殊字符由设备端shell原样传给input
+            engine = TextEntryEngine(manager, chunk_size={"input_text": 4}, verify=False)
+            engine._available["uitest"] = False
+            result = engine.enter_text("a b;c'd\nef")
+            assert result["success"] and result["strategy"] == "input_text"
+            assert commands[-4:] == [
+                "input text 'a%sb;'", "input text 'c'\"'\"'d'", "input keyevent 66", "input text ef",
+            ]
+            assert engine.enter_text("中文")["success"] is False
+            manager.transport.close()
+    finally:
+        fleet.stop()
+
+
+if __name__ == "__main__":
+    test_hdc_server_transport()
+    test_adb_server_transport()
+    test_adb_shell_v2_kept_after_dropped_connection()
+    test_adb_shell_v1_fallback()
+    test_async_device_manager()
+    test_async_concurrent_file_commands()
+    test_text_entry_engine()
+    print("传输测试通过")